@@ -0,0 +1,472 @@
+"""Check in over asyncio streams, with everything an attempt waits on under one deadline.
+
+The requests path did one thing at a time: work out the proxy route,
+resolve the server, connect, send, and only after a route had failed try
+the next one. An attempt here starts the server's name lookup while the
+route is still being worked out (PAC files and system settings are read in
+a daemon thread, which the deadline doesn't wait for), probes the routes
+in preference order with a short head start each - the first to connect,
+through its proxy and TLS handshake, wins and the rest are closed - and
+sends the request over the winner.
+Addresses of one host are raced the same way, IPv4 first as the trackers
+have always preferred.
+
+Cancelling an attempt, on suspend or shutdown, closes whatever it had
+open. Only the stdlib is used: HTTP/1.1 with Connection: close, http and
+https proxies (CONNECT for https servers) and socks5h.
+
+  CheckinEngine.attempt()  one attempt, for callers running an event loop
+  CheckinEngine.probe()    reach the server without sending anything
+  run() / cancel_running() one attempt for a synchronous caller, such as
+                           the trackers' try_connect_with_retry, which a
+                           signal handler can cut short
+  EngineThread             one long-lived loop hosting any number of
+                           attempts and probes for an event thread that
+                           can't run asyncio itself (the monitors' select
+                           loop, message pump or run loop), handing the
+                           results back on that thread
+"""
+import asyncio
+import base64
+import http.client
+import io
+import json
+import logging
+import os
+import socket
+import ssl
+import struct
+import threading
+from collections import deque
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger('AttendanceTracker')
+
+# Head start each route, and each address of a host, gets before the next is tried alongside it
+PROBE_STAGGER = 0.25
+MAX_RESPONSE = 1 << 20
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'socks5': 1080, 'socks5h': 1080}
+
+
+class CheckinError(Exception):
+    """An attempt got no HTTP response: nothing connected, the exchange failed or the deadline passed."""
+
+
+class Cancelled(CheckinError):
+    """run() was cut short by cancel_running()."""
+
+
+class Response:
+    """The parts of a reply the trackers and checkin_lease read, named as on a requests response."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def ssl_context():
+    # The same trust as the requests session: an explicit bundle, else certifi's, else the system store
+    cafile = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+    if not cafile:
+        try:
+            import certifi
+            cafile = certifi.where()
+        except ImportError:
+            pass
+    return ssl.create_default_context(cafile=cafile)
+
+
+class _Connection:
+    def __init__(self, reader, writer, via):
+        self.reader = reader
+        self.writer = writer
+        self.via = via
+        # Plain http through a proxy sends the full URL and the proxy's credentials
+        self.forward_headers = None
+
+    def close(self):
+        self.writer.close()
+
+
+async def _lookup(host, port):
+    """Addresses of host, IPv4 first."""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = []
+    for family in (socket.AF_INET, socket.AF_INET6):
+        for info in infos:
+            if info[0] == family and info[4][0] not in addresses:
+                addresses.append(info[4][0])
+    if not addresses:
+        raise OSError(f"no addresses for {host}")
+    return addresses
+
+
+async def _in_thread(function, *args):
+    """function(*args) in a daemon thread of its own.
+
+    Not asyncio.to_thread: cancelling that leaves the call running, and
+    asyncio.run() then waits for it on the way out, so a PAC download or
+    script that hangs would hold the attempt past its deadline. This thread
+    is never waited for; its result is dropped if nobody wants it any more.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if not future.done():
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def call():
+        try:
+            result, error = function(*args), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # The loop is gone, the attempt with it
+    threading.Thread(target=call, name='checkin-resolver', daemon=True).start()
+    return await future
+
+
+async def _settled(awaitable):
+    # A lookup only some routes need must not take the others down when it fails
+    try:
+        return await awaitable
+    except Exception as e:
+        return e
+
+
+async def _race(openers, stagger=PROBE_STAGGER):
+    """Start openers one after another, stagger seconds apart or as soon as the previous one fails; return the first result.
+
+    The others are cancelled, and any that connected regardless are closed.
+    """
+    queue = deque(openers)
+    pending = set()
+    errors = []
+    try:
+        while queue or pending:
+            if queue:
+                pending.add(asyncio.ensure_future(queue.popleft()()))
+            done, pending = await asyncio.wait(pending, timeout=stagger if queue else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            winners = [task.result() for task in done if not task.cancelled() and task.exception() is None]
+            errors += [task.exception() for task in done if not task.cancelled() and task.exception() is not None]
+            if winners:
+                for extra in winners[1:]:
+                    extra.close()
+                return winners[0]
+    finally:
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, _Connection):
+                result.close()
+    raise CheckinError('; '.join(str(e) or type(e).__name__ for e in errors) or "nothing to connect to")
+
+
+async def _read_head(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError(f"connection closed after {len(e.partial)} bytes of response")
+    except asyncio.LimitOverrunError:
+        raise ConnectionError("response headers too long")
+    status_line, _, rest = head.partition(b'\r\n')
+    version, _, status = status_line.decode('latin-1').partition(' ')
+    if not version.startswith('HTTP/') or not status[:3].isdigit():
+        raise ConnectionError(f"not an HTTP response: {status_line[:80]!r}")
+    return int(status[:3]), http.client.parse_headers(io.BytesIO(rest))
+
+
+async def _read_body(reader, status, headers):
+    if status in (204, 304) or 100 <= status < 200:
+        return b''
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                return body
+            if len(body) + size > MAX_RESPONSE:
+                raise ConnectionError("response too large")
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+    length = headers.get('Content-Length')
+    if length is not None:
+        if int(length) > MAX_RESPONSE:
+            raise ConnectionError("response too large")
+        return await reader.readexactly(int(length))
+    # Neither, so the body runs to the end of the connection: one read() only returns what has arrived
+    body = b''
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return body
+        if len(body) + len(data) > MAX_RESPONSE:
+            raise ConnectionError("response too large")
+        body += data
+
+
+def _proxy_authorization(proxy):
+    if proxy.username is None:
+        return {}
+    credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}"
+    return {'Proxy-Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')}
+
+
+class CheckinEngine:
+    """Check-in attempts over the routes a proxy_resolver.ProxyResolver picks.
+
+    The resolver's answers are cached per host as before; invalidate it
+    after a network change.
+    """
+
+    def __init__(self, resolver, context=None):
+        self.resolver = resolver
+        self.context = context
+
+    def _tls(self):
+        if self.context is None:
+            self.context = ssl_context()
+        return self.context
+
+    async def attempt(self, url, body, headers=None, timeout=30):
+        """POST body as JSON to url once; the Response, or CheckinError when none came within timeout seconds."""
+        async def exchange(connection, target):
+            return await self._exchange(connection, target, body, headers or {})
+        return await self._over_route(url, timeout, exchange)
+
+    async def probe(self, url, timeout=30):
+        """Reach url's server as attempt() would, through proxy and TLS, but send nothing; the route that got there."""
+        async def reached(connection, target):
+            return connection.via
+        return await self._over_route(url, timeout, reached)
+
+    async def _over_route(self, url, timeout, use):
+        """use(connection, target) over the first route to connect, everything under the one deadline."""
+        target = urlsplit(url)
+        if target.scheme not in ('http', 'https') or not target.hostname:
+            raise CheckinError(f"cannot check in to {url!r}")
+        port = target.port or DEFAULT_PORTS[target.scheme]
+        try:
+            async with asyncio.timeout(timeout):
+                lookup = asyncio.ensure_future(_settled(_lookup(target.hostname, port)))
+                try:
+                    routes = await _in_thread(self.resolver.candidates, url)
+                    connection = await _race([lambda route=route: self._open(target, port, route, lookup)
+                                              for route in routes])
+                finally:
+                    lookup.cancel()
+                try:
+                    logger.info(f"Connected to {target.hostname} via {connection.via}")
+                    return await use(connection, target)
+                finally:
+                    connection.close()
+        except TimeoutError:
+            raise CheckinError(f"no response within {timeout} seconds")
+        except (OSError, ssl.SSLError, asyncio.IncompleteReadError, ValueError) as e:
+            raise CheckinError(str(e) or type(e).__name__)
+
+    async def _connect(self, host, port, addresses, tls):
+        async def connect(address):
+            reader, writer = await asyncio.open_connection(
+                address, port, ssl=self._tls() if tls else None, server_hostname=host if tls else None)
+            return _Connection(reader, writer, 'DIRECT')
+        return await _race([lambda address=address: connect(address) for address in addresses])
+
+    async def _open(self, target, port, route, lookup):
+        """A connection that reaches target over one of the resolver's routes, TLS included."""
+        proxy_url = route.get(target.scheme)
+        https = target.scheme == 'https'
+        if not proxy_url:
+            addresses = await asyncio.shield(lookup)
+            if isinstance(addresses, Exception):
+                raise addresses
+            return await self._connect(target.hostname, port, addresses, https)
+
+        proxy = urlsplit(proxy_url)
+        if proxy.scheme not in DEFAULT_PORTS or not proxy.hostname:
+            raise CheckinError(f"unsupported proxy {proxy_url}")
+        proxy_port = proxy.port or DEFAULT_PORTS[proxy.scheme]
+        addresses = await _lookup(proxy.hostname, proxy_port)
+        connection = await self._connect(proxy.hostname, proxy_port, addresses, proxy.scheme == 'https')
+        connection.via = f"{proxy.scheme}://{proxy.hostname}:{proxy_port}"
+        try:
+            if proxy.scheme.startswith('socks5'):
+                await self._socks5(connection, target.hostname, port)
+            elif https:
+                await self._tunnel(connection, proxy, target.hostname, port)
+            else:
+                connection.forward_headers = _proxy_authorization(proxy)
+            if https:
+                await connection.writer.start_tls(self._tls(), server_hostname=target.hostname)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def _tunnel(self, connection, proxy, host, port):
+        request = f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        request += ''.join(f"{name}: {value}\r\n" for name, value in _proxy_authorization(proxy).items())
+        connection.writer.write((request + '\r\n').encode('latin-1'))
+        await connection.writer.drain()
+        status, headers = await _read_head(connection.reader)
+        if status != 200:
+            raise ConnectionError(f"proxy answered {status} to CONNECT")
+
+    async def _socks5(self, connection, host, port):
+        # No authentication, and the proxy resolves the name (socks5h)
+        connection.writer.write(b'\x05\x01\x00')
+        await connection.writer.drain()
+        if await connection.reader.readexactly(2) != b'\x05\x00':
+            raise ConnectionError("SOCKS proxy wants authentication")
+        name = host.encode('idna')
+        connection.writer.write(b'\x05\x01\x00\x03' + bytes([len(name)]) + name + struct.pack('>H', port))
+        await connection.writer.drain()
+        reply = await connection.reader.readexactly(4)
+        if reply[1] != 0:
+            raise ConnectionError(f"SOCKS proxy refused the connection (code {reply[1]})")
+        bound = {1: 4, 4: 16}.get(reply[3]) or (await connection.reader.readexactly(1))[0]
+        await connection.reader.readexactly(bound + 2)
+
+    async def _exchange(self, connection, target, body, headers):
+        data = json.dumps(body).encode('utf-8')
+        forwarded = connection.forward_headers is not None
+        path = target.geturl() if forwarded else (target.path or '/') + (f'?{target.query}' if target.query else '')
+        fields = {'Host': target.netloc.rpartition('@')[2], 'User-Agent': 'AttendanceTracker',
+                  'Accept-Encoding': 'identity', 'Connection': 'close', 'Content-Type': 'application/json',
+                  'Content-Length': str(len(data))}
+        fields.update(connection.forward_headers or {})
+        fields.update(headers)
+        request = f"POST {path} HTTP/1.1\r\n" + ''.join(f"{name}: {value}\r\n" for name, value in fields.items())
+        connection.writer.write((request + '\r\n').encode('latin-1') + data)
+        await connection.writer.drain()
+        status, response_headers = await _read_head(connection.reader)
+        while status == 100:
+            status, response_headers = await _read_head(connection.reader)
+        return Response(status, response_headers, await _read_body(connection.reader, status, response_headers))
+
+
+# The loop and task run() is waiting on, for cancel_running()
+_running = None
+
+
+def run(coroutine):
+    """Run one coroutine to completion on a fresh event loop; Cancelled if cancel_running() cut it short."""
+    async def main():
+        global _running
+        _running = (asyncio.get_running_loop(), asyncio.current_task())
+        try:
+            return await coroutine
+        finally:
+            _running = None
+    try:
+        return asyncio.run(main())
+    except asyncio.CancelledError:
+        raise Cancelled("cancelled")
+
+
+def cancel_running():
+    """Cancel what run() is running, if anything; safe to call from a signal handler or another thread."""
+    running = _running
+    if running:
+        loop, task = running
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            pass  # run() finished and closed its loop in the meantime
+
+
+class EngineThread:
+    """One event loop in one thread, running check-ins for an event thread that can't run asyncio itself.
+
+    submit(coroutine, on_done) returns a concurrent.futures.Future. on_done
+    is not called on the loop's thread: a select() loop registers this
+    object (fileno/handle_ready, as with the control endpoint) and
+    handle_ready() calls it there; other event threads pass notify, which
+    is called from the loop's thread whenever results are waiting, and call
+    handle_ready() once they have posted themselves over. cancel_all(), on
+    suspend, and close(), on shutdown, cancel every attempt in flight and
+    so close its connections.
+    """
+
+    def __init__(self, notify=None):
+        self.notify = notify
+        self.done = deque()
+        self.futures = set()
+        self.wakeup_r = self.wakeup_w = None
+        if notify is None:
+            self.wakeup_r, self.wakeup_w = socket.socketpair()
+            self.wakeup_r.setblocking(False)
+            self.wakeup_w.setblocking(False)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='checkin-engine', daemon=True)
+        self.thread.start()
+
+    def fileno(self):
+        return self.wakeup_r.fileno()
+
+    def submit(self, coroutine, on_done=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.futures.add(future)
+
+        def finished(future):
+            self.futures.discard(future)
+            if on_done:
+                self.done.append((on_done, future))
+                if self.notify:
+                    self.notify()
+                else:
+                    try:
+                        self.wakeup_w.send(b'\0')
+                    except OSError:
+                        pass
+        future.add_done_callback(finished)
+        return future
+
+    def handle_ready(self):
+        """Call on_done for each attempt that has finished; on the event thread."""
+        if self.wakeup_r:
+            try:
+                while self.wakeup_r.recv(4096):
+                    pass
+            except OSError:
+                pass
+        while self.done:
+            on_done, future = self.done.popleft()
+            try:
+                on_done(future)
+            except Exception as e:
+                logger.error(f"Check-in completion handler failed: {e}", exc_info=True)
+
+    def cancel_all(self):
+        for future in list(self.futures):
+            future.cancel()
+
+    def close(self, timeout=5):
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.loop.shutdown_default_executor()
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Check-in engine did not shut down cleanly: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+        for sock in (self.wakeup_r, self.wakeup_w):
+            if sock:
+                sock.close()
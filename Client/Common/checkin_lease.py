@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger('AttendanceTracker')
+
+# Never trust a lease further out than this, whatever the server or clock says
+MAX_LEASE_SECONDS = 7 * 24 * 3600
+
+
+def _parse_time(value):
+    """Turn an epoch number or ISO 8601 string from the server into epoch seconds."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    return datetime.fromisoformat(text).timestamp()
+
+
+def _max_age(cache_control):
+    for directive in (cache_control or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name.lower() == 'max-age' and value.isdigit():
+            return int(value)
+    return None
+
+
+def lease_from_response(response, now=None):
+    """Extract a lease from a /checkin response, or None if the server did not grant one.
+
+    The server may send valid_until or next_required in the JSON body, or a
+    Cache-Control max-age, plus an ETag to revalidate against later. Servers
+    that only answer 200/208 without these yield None, and the client falls
+    back to the once-per-calendar-day rule.
+    """
+    now = time.time() if now is None else now
+    valid_until = None
+    try:
+        body = response.json()
+    except Exception:
+        body = None
+    if isinstance(body, dict):
+        try:
+            valid_until = _parse_time(body.get('valid_until', body.get('next_required')))
+        except ValueError as e:
+            logger.warning(f"Ignoring unparseable lease time from server: {e}")
+    if valid_until is None:
+        max_age = _max_age(response.headers.get('Cache-Control'))
+        if max_age is not None:
+            valid_until = now + max_age
+    etag = response.headers.get('ETag')
+    if valid_until is None and etag is None:
+        return None
+    if valid_until is not None:
+        valid_until = min(valid_until, now + MAX_LEASE_SECONDS)
+    return {'valid_until': valid_until, 'etag': etag, 'granted_at': now}
+
+
+def load_lease(path):
+    try:
+        with open(path, 'r') as f:
+            lease = json.load(f)
+        return lease if isinstance(lease, dict) else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable lease file {path}: {e}")
+        return None
+
+
+def save_lease(path, lease):
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(lease, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error saving check-in lease: {str(e)}")
+
+
+def lease_active(lease, now=None):
+    """True while a cached lease says no check-in is needed yet."""
+    if not lease or lease.get('valid_until') is None:
+        return False
+    now = time.time() if now is None else now
+    # A lease granted "in the future" means the clock went backwards; don't trust it
+    if lease.get('granted_at', 0) > now:
+        return False
+    return now < lease['valid_until']
+
+
+def conditional_headers(lease):
+    """Headers that let the server answer 304 Not Modified for an unchanged check-in."""
+    if lease and lease.get('etag'):
+        return {'If-None-Match': lease['etag']}
+    return {}
+
+
+def refresh_lease(path, previous, response, now=None):
+    """Store the lease from response, keeping the previous ETag on a bare 304."""
+    lease = lease_from_response(response, now)
+    if lease is None and previous:
+        lease = {'valid_until': None, 'etag': previous.get('etag'), 'granted_at': time.time() if now is None else now}
+    elif lease is not None and lease['etag'] is None and previous:
+        lease['etag'] = previous.get('etag')
+    if lease is not None:
+        save_lease(path, lease)
+        if lease['valid_until'] is not None:
+            logger.info(f"Check-in lease valid until {datetime.fromtimestamp(lease['valid_until'])}")
+    return lease
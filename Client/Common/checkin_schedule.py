@@ -0,0 +1,94 @@
+"""Daily check-in windows, for machines whose events alone don't get them checked in.
+
+Off unless config.json lists windows; the shipped configs leave the list
+empty. To opt in, fill it in, for example:
+
+    "schedule": {"windows": ["09:00-11:00"], "jitter_seconds": 1800}
+
+Each window then fires once a day, at a random offset of up to
+jitter_seconds into it. The running monitor picks the change up at its
+next event, or at once with "monitorctl.py reload".
+"""
+import logging
+import random
+import socket
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('PowerMonitor')
+
+
+def parse_window(text):
+    """Parse an 'HH:MM-HH:MM' daily window into a (start, end) pair of times."""
+    start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in text.split('-', 1))
+    if end <= start:
+        raise ValueError(f"Schedule window {text!r} must end after it starts")
+    return start, end
+
+
+class CheckinSchedule:
+    """Works out when the monitor should next start a check-in on its own.
+
+    Check-ins normally follow wake/unlock/logon events. The schedule adds
+    daily windows so a machine that never locks, or whose first event came
+    before the network was up, still checks in. Each window fires once per
+    day at a jittered offset that is stable for a given machine and day, and
+    nothing is scheduled for a day that already has a successful check-in.
+    """
+
+    def __init__(self, windows, jitter_seconds, last_success_path, hostname=None):
+        self.windows = sorted(parse_window(w) for w in windows)
+        self.jitter_seconds = jitter_seconds
+        self.last_success_path = last_success_path
+        self.hostname = hostname or socket.gethostname()
+        self.fired = set()
+
+    def done_today(self, now):
+        if not self.last_success_path:
+            # A machine-wide monitor that could not look up the user's profile
+            return False
+        try:
+            with open(self.last_success_path, 'r') as f:
+                return f.read().strip() == now.strftime('%Y-%m-%d')
+        except OSError:
+            return False
+
+    def _fire_time(self, day, index):
+        start, end = self.windows[index]
+        start_dt = datetime.combine(day, start)
+        span = (datetime.combine(day, end) - start_dt).total_seconds()
+        offset = random.Random(f"{self.hostname}-{day.isoformat()}-{index}").uniform(0, min(self.jitter_seconds, span))
+        return start_dt + timedelta(seconds=offset)
+
+    def next_checkin(self, now):
+        """Return the datetime of the next scheduled check-in, or None if there are no windows."""
+        if not self.windows:
+            return None
+        today = now.date()
+        self.fired = {key for key in self.fired if key[0] == today}
+        skip_today = self.done_today(now)
+        for day_offset in (0, 1):
+            day = today + timedelta(days=day_offset)
+            if day_offset == 0 and skip_today:
+                continue
+            for index, (_, end) in enumerate(self.windows):
+                if day_offset == 0 and ((day, index) in self.fired or datetime.combine(day, end) <= now):
+                    continue
+                return max(self._fire_time(day, index), now)
+        return None
+
+    def mark_fired(self, now):
+        """Remember that the window containing now has had its check-in."""
+        for index, (start, end) in enumerate(self.windows):
+            if datetime.combine(now.date(), start) <= now < datetime.combine(now.date(), end):
+                self.fired.add((now.date(), index))
+
+
+def schedule_from_config(config, last_success_path):
+    """Build a CheckinSchedule from the 'schedule' section of a validated config, or None."""
+    section = config.get('schedule') or {}
+    windows = section.get('windows') or []
+    if not windows:
+        return None
+    schedule = CheckinSchedule(windows, section.get('jitter_seconds', 0), last_success_path)
+    logger.info(f"Scheduled check-in windows: {', '.join(windows)} (jitter {schedule.jitter_seconds}s)")
+    return schedule
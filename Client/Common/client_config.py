@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('PowerMonitor')
+
+REQUIRED = object()
+
+
+class ConfigError(ValueError):
+    """Raised when config.json or logging.conf is missing, unreadable or invalid."""
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _string(value):
+    return isinstance(value, str)
+
+
+def _http_url(value):
+    return value.startswith(('http://', 'https://')) or 'must start with http:// or https://'
+
+
+def _https_url(value):
+    # What this fetches is installed and run, so it must come over TLS; plain http is
+    # left for a release served on this machine, as publish_update.py serve does
+    if value.startswith('https://'):
+        return True
+    try:
+        local = value.startswith('http://') and urlsplit(value).hostname in ('localhost', '127.0.0.1', '::1')
+    except ValueError:
+        local = False
+    return local or 'must start with https:// (http:// only for localhost)'
+
+
+def _at_least(minimum):
+    return lambda value: value >= minimum or f'must be at least {minimum}'
+
+
+def _proxy_url(value):
+    return (value.startswith(('http://', 'https://', 'socks5://', 'socks5h://'))
+            or 'must be an http://, https:// or socks5:// URL')
+
+
+def _string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _windows(value):
+    from checkin_schedule import parse_window
+    if not isinstance(value, list):
+        return 'must be a list of "HH:MM-HH:MM" strings'
+    for window in value:
+        try:
+            parse_window(window)
+        except (ValueError, AttributeError, TypeError) as e:
+            return f'has a bad window {window!r}: {e}'
+    return True
+
+
+# section -> key -> (type check, default or REQUIRED, value check or None)
+SCHEMA = {
+    'server': {
+        'url': (_string, REQUIRED, _http_url),
+        'timeout_seconds': (_number, 30, _at_least(1)),
+        'max_retry_attempts': (_integer, 10, _at_least(1)),
+        'retry_delay_seconds': (_number, 60, _at_least(0)),
+    },
+    'application': {
+        'startup_delay_seconds': (_number, 0, _at_least(0)),
+    },
+    'proxy': {
+        'url': (_string, None, _proxy_url),
+        'pac_url': (_string, None, None),
+        'bypass': (_string_list, [], None),
+    },
+    'schedule': {
+        'windows': (lambda v: True, [], _windows),
+        'jitter_seconds': (_number, 0, _at_least(0)),
+    },
+    'logs': {
+        'collector_url': (_string, None, _http_url),
+        'batch_kb': (_number, 64, _at_least(1)),
+        'max_kb_per_run': (_number, 1024, _at_least(1)),
+        'max_kbps': (_number, 32, _at_least(1)),
+        'max_seconds': (_number, 30, _at_least(1)),
+    },
+    'update': {
+        'manifest_url': (_string, None, _https_url),
+        'check_interval_hours': (_number, 24, _at_least(0)),
+    },
+}
+TOP_LEVEL = {
+    'version': (_string, '1.0.0', None),
+}
+
+
+def _check(name, value, spec, errors):
+    type_ok, default, check = spec
+    if not type_ok(value):
+        errors.append(f"{name} has the wrong type ({type(value).__name__})")
+        return default
+    result = check(value) if check else True
+    if result is not True:
+        errors.append(f"{name} {result}")
+    return value
+
+
+def validate(raw):
+    """Check a parsed config.json against SCHEMA and return it with defaults filled in.
+
+    Every problem is collected and reported in a single ConfigError, so a
+    broken file is fixed in one go. Unknown keys are kept as they are.
+    """
+    if not isinstance(raw, dict):
+        raise ConfigError("config.json must contain a JSON object")
+    errors = []
+    config = dict(raw)
+    for section, keys in SCHEMA.items():
+        values = raw.get(section, {})
+        if not isinstance(values, dict):
+            errors.append(f"{section} must be an object")
+            values = {}
+        checked = dict(values)
+        for key, spec in keys.items():
+            name = f"{section}.{key}"
+            if key in values:
+                checked[key] = _check(name, values[key], spec, errors)
+            elif spec[1] is REQUIRED:
+                errors.append(f"{name} is required")
+            else:
+                checked[key] = spec[1]
+        config[section] = checked
+    for key, spec in TOP_LEVEL.items():
+        config[key] = _check(key, raw[key], spec, errors) if key in raw else spec[1]
+    if errors:
+        raise ConfigError('; '.join(errors))
+    return config
+
+
+_cache = {}
+
+
+def load_config(path):
+    """Return the validated config at path, re-reading it only when its mtime or size changes."""
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise ConfigError(f"Cannot read {path}: {e}")
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    try:
+        with open(path, 'r') as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot parse {path}: {e}")
+    try:
+        config = validate(raw)
+    except ConfigError as e:
+        raise ConfigError(f"{path}: {e}")
+    _cache[path] = (key, config)
+    return config
+
+
+def find_config(candidates):
+    """First existing path among candidates (earlier ones override later ones), else the last."""
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[-1]
+
+
+class ConfigStore:
+    """The resident monitors' view of config.json, hot-reloaded when the file changes.
+
+    refresh() costs a stat() when nothing changed, so the monitors call it
+    as they handle each event rather than watching the file. A bad edit is
+    reported and leaves the last good snapshot in place, with the error kept
+    in .error until the file is fixed.
+    """
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.path = None
+        self.config = None
+        self.error = None
+
+    def refresh(self):
+        """Reload if the file changed; return True when a new snapshot was taken."""
+        path = find_config(self.candidates)
+        try:
+            config = load_config(path)
+        except ConfigError as e:
+            if str(e) != self.error:
+                logger.error(f"Invalid configuration, keeping the previous one: {e}")
+            self.error = str(e)
+            return False
+        self.error = None
+        if config is self.config:
+            return False
+        if self.config is not None:
+            logger.info(f"Configuration reloaded from {path}")
+        self.path = path
+        self.config = config
+        return True
+
+
+def load_logging_conf(path, default_level='INFO', default_max_mb=10.0):
+    """Read level and max_size_mb from the [logging] section of logging.conf.
+
+    Returns (level_name, max_bytes). Only the two keys the clients use are
+    understood, so configparser does not have to be loaded or kept alive.
+    A missing file gives the defaults; bad values raise ConfigError.
+    """
+    level = default_level
+    max_mb = default_max_mb
+    if os.path.exists(path):
+        section = None
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line[0] in '#;':
+                    continue
+                if line.startswith('[') and line.endswith(']'):
+                    section = line[1:-1].strip()
+                    continue
+                if section != 'logging' or '=' not in line:
+                    continue
+                key, value = (part.strip() for part in line.split('=', 1))
+                if key == 'level':
+                    level = value.upper()
+                    if not isinstance(logging.getLevelName(level), int):
+                        raise ConfigError(f"{path}: unknown log level {value!r}")
+                elif key == 'max_size_mb':
+                    try:
+                        max_mb = float(value)
+                    except ValueError:
+                        raise ConfigError(f"{path}: max_size_mb must be a number, not {value!r}")
+                    if max_mb < 0:
+                        raise ConfigError(f"{path}: max_size_mb must not be negative")
+    return level, int(max_mb * 1024 * 1024)
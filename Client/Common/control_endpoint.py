@@ -0,0 +1,366 @@
+import contextlib
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+import monitor_core
+
+logger = logging.getLogger('PowerMonitor')
+
+MAX_MESSAGE = 65536
+CLIENT_TIMEOUT = 2.0
+# Refuse connections from other machines on the Windows pipe
+PIPE_REJECT_REMOTE_CLIENTS = 0x8
+# Fail instead of joining a pipe someone else created first
+FILE_FLAG_FIRST_PIPE_INSTANCE = 0x00080000
+
+
+def default_address(app_support):
+    """Unix socket in the app-support directory, or a per-user named pipe on Windows."""
+    if sys.platform == 'win32':
+        return '\\\\.\\pipe\\AttendanceTrackerMonitor-' + os.environ.get('USERNAME', 'default')
+    return os.path.join(app_support, 'power_monitor.sock')
+
+
+class ControlCommands:
+    """Answers control requests from the monitor's in-memory state.
+
+    Requests and replies are single JSON objects, one per line:
+
+        {"cmd": "status"}     last event, decision and outcome, next check-in
+        {"cmd": "metrics"}    event/decision counters, uptime and memory
+        {"cmd": "trigger"}    start a check-in now (MANUAL event)
+        {"cmd": "reload"}     re-read config.json and rebuild the schedule
+        {"cmd": "report", "pid": 123, "user": "name", "outcome": null|"accepted"|...}
+                              sent by the tracker when it starts and finishes
+        {"cmd": "update"}     a tracker staged an update; swap it in once idle
+        {"cmd": "probe", "user": optional}
+                              reach the check-in server without checking in;
+                              the outcome shows up as last_probe in status
+
+    status and metrics are read straight from the core, under lock when the
+    backend passes the one it holds while handling events. The others change
+    state, so when the endpoint is served from a helper thread they are
+    handed to run_on_main and acknowledged as queued. probe(user) starts a
+    probe on the backend's check-in engine and returns at once; backends
+    without one leave it None.
+    """
+
+    def __init__(self, core, run_on_main=None, lock=None, probe=None):
+        self.core = core
+        self.run_on_main = run_on_main
+        self.lock = lock or contextlib.nullcontext()
+        self.probe = probe
+
+    def handle(self, data):
+        try:
+            request = json.loads(data.decode('utf-8'))
+            cmd = request['cmd']
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {'ok': False, 'error': f"bad request: {e}"}
+        else:
+            try:
+                reply = self._dispatch(cmd, request)
+            except Exception as e:
+                logger.error(f"Control command {cmd!r} failed: {e}", exc_info=True)
+                reply = {'ok': False, 'error': str(e)}
+        return (json.dumps(reply) + '\n').encode('utf-8')
+
+    def _dispatch(self, cmd, request):
+        if cmd == 'status':
+            with self.lock:
+                return {'ok': True, **self.core.status()}
+        if cmd == 'metrics':
+            with self.lock:
+                metrics = {'ok': True, 'uptime': time.time() - self.core.started, **self.core.stats()}
+            if self.core.memory:
+                metrics['memory'] = self.core.memory.snapshot()
+            return metrics
+        if cmd == 'trigger':
+            logger.info("Check-in requested through the control endpoint")
+            return self._change(lambda: {'decision': self.core.handle(monitor_core.MANUAL)})
+        if cmd == 'reload':
+            logger.info("Configuration reload requested through the control endpoint")
+            return self._change(lambda: self.core.reload_config(force=True))
+        if cmd == 'report':
+            pid = int(request['pid'])
+            user = request.get('user')
+            outcome = request.get('outcome')
+            if outcome is None:
+                return self._change(lambda: self.core.tracker_started(pid, user))
+            return self._change(lambda: self.core.record_outcome(outcome, user))
+        if cmd == 'update':
+            return self._change(self.core.update_staged)
+        if cmd == 'probe':
+            if not self.probe:
+                return {'ok': False, 'error': "this monitor does not host a check-in engine"}
+            user = request.get('user')
+            return self._change(lambda: self.probe(user))
+        return {'ok': False, 'error': f"unknown command {cmd!r}"}
+
+    def _change(self, action):
+        if self.run_on_main:
+            self.run_on_main(action)
+            return {'ok': True, 'queued': True}
+        return {'ok': True, **(action() or {})}
+
+
+def _read_message(conn):
+    data = b''
+    while b'\n' not in data and len(data) < MAX_MESSAGE:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class UnixControlServer:
+    """Control endpoint on a Unix domain socket only the owning user can open.
+
+    The Linux monitor registers fileno() with its selector and calls
+    handle_ready() when it is readable; the macOS monitor runs
+    serve_forever() on a helper thread.
+    """
+
+    def __init__(self, path, commands):
+        self.path = path
+        self.commands = commands
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self.sock.bind(path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen(8)
+        logger.info(f"Control endpoint listening on {path}")
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _serve(self, conn):
+        with conn:
+            conn.settimeout(CLIENT_TIMEOUT)
+            try:
+                conn.sendall(self.commands.handle(_read_message(conn)))
+            except OSError as e:
+                logger.warning(f"Control client went away: {e}")
+
+    def handle_ready(self):
+        self.sock.setblocking(False)
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            self._serve(conn)
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # closed
+            self._serve(conn)
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class PipeControlServer:
+    """Control endpoint on a named pipe, served from a helper thread on Windows.
+
+    Only the monitor's own account and SYSTEM may open the pipe, and the
+    first instance is created with FILE_FLAG_FIRST_PIPE_INSTANCE: if some
+    other process already holds the name, the endpoint stays off rather
+    than share it. The next instance is created before the current one is
+    closed, so the name is never free for anyone else to take.
+    """
+
+    def __init__(self, name, commands):
+        import win32event
+        self.name = name
+        self.commands = commands
+        self.running = True
+        self.stopping = win32event.CreateEvent(None, True, False, None)
+
+    @staticmethod
+    def _security():
+        import ntsecuritycon
+        import win32api
+        import win32security
+        token = win32security.OpenProcessToken(win32api.GetCurrentProcess(), win32security.TOKEN_QUERY)
+        owner = win32security.GetTokenInformation(token, win32security.TokenUser)[0]
+        system = win32security.CreateWellKnownSid(win32security.WinLocalSystemSid)
+        dacl = win32security.ACL()
+        for sid in (owner, system):
+            # FILE_GENERIC_WRITE includes FILE_CREATE_PIPE_INSTANCE, which the next instances need
+            dacl.AddAccessAllowedAce(win32security.ACL_REVISION,
+                                     ntsecuritycon.FILE_GENERIC_READ | ntsecuritycon.FILE_GENERIC_WRITE, sid)
+        descriptor = win32security.SECURITY_DESCRIPTOR()
+        descriptor.SetSecurityDescriptorDacl(1, dacl, 0)
+        attributes = win32security.SECURITY_ATTRIBUTES()
+        attributes.SECURITY_DESCRIPTOR = descriptor
+        return attributes
+
+    def serve_forever(self):
+        import pywintypes
+        import win32file
+        import win32pipe
+        import winerror
+        security = self._security()
+
+        def create(first):
+            return win32pipe.CreateNamedPipe(
+                self.name,
+                win32pipe.PIPE_ACCESS_DUPLEX | win32file.FILE_FLAG_OVERLAPPED
+                | (FILE_FLAG_FIRST_PIPE_INSTANCE if first else 0),
+                win32pipe.PIPE_TYPE_MESSAGE | win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_WAIT
+                | PIPE_REJECT_REMOTE_CLIENTS,
+                win32pipe.PIPE_UNLIMITED_INSTANCES, MAX_MESSAGE, MAX_MESSAGE, 0, security)
+
+        try:
+            handle = create(first=True)
+        except pywintypes.error as e:
+            logger.error(f"Control endpoint unavailable, {self.name} is already taken: {e}")
+            return
+        logger.info(f"Control endpoint listening on {self.name}")
+        while self.running:
+            try:
+                overlapped = _overlapped()
+                if win32pipe.ConnectNamedPipe(handle, overlapped) == winerror.ERROR_IO_PENDING:
+                    _pipe_wait(handle, overlapped, None, self.stopping)
+            except TimeoutError:
+                break  # closed
+            except pywintypes.error as e:
+                logger.warning(f"Control client went away: {e}")
+                win32pipe.DisconnectNamedPipe(handle)
+                continue
+            try:
+                following = create(first=False)
+            except pywintypes.error as e:
+                logger.error(f"Control endpoint stopped, could not create the next instance: {e}")
+                following = None
+            try:
+                _pipe_write(handle, self.commands.handle(_pipe_read(handle, CLIENT_TIMEOUT)), CLIENT_TIMEOUT)
+                win32file.FlushFileBuffers(handle)
+            except (pywintypes.error, TimeoutError) as e:
+                logger.warning(f"Control client went away: {e}")
+            finally:
+                try:
+                    win32pipe.DisconnectNamedPipe(handle)
+                except pywintypes.error:
+                    pass
+                win32file.CloseHandle(handle)
+            if following is None:
+                return
+            handle = following
+        win32file.CloseHandle(handle)
+
+    def close(self):
+        import win32event
+        self.running = False
+        win32event.SetEvent(self.stopping)
+
+
+def _overlapped():
+    import pywintypes
+    import win32event
+    overlapped = pywintypes.OVERLAPPED()
+    overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+    return overlapped
+
+
+def _pipe_wait(handle, overlapped, timeout, stop=None):
+    """Wait for overlapped I/O on a pipe and return its byte count.
+
+    Raises TimeoutError, with the I/O cancelled, when timeout seconds pass
+    (None waits for ever) or the stop event is set first.
+    """
+    import pywintypes
+    import win32event
+    import win32file
+    events = [overlapped.hEvent] + ([stop] if stop else [])
+    wait = win32event.INFINITE if timeout is None else int(max(0, timeout) * 1000)
+    if win32event.WaitForMultipleObjects(events, False, wait) != win32event.WAIT_OBJECT_0:
+        win32file.CancelIo(handle)
+        try:
+            # The cancelled I/O still completes; wait for it so its buffer is not written to later
+            win32file.GetOverlappedResult(handle, overlapped, True)
+        except pywintypes.error:
+            pass
+        raise TimeoutError("control pipe did not answer in time")
+    return win32file.GetOverlappedResult(handle, overlapped, False)
+
+
+def _pipe_read(handle, timeout):
+    import win32file
+    buffer = win32file.AllocateReadBuffer(MAX_MESSAGE)
+    overlapped = _overlapped()
+    win32file.ReadFile(handle, buffer, overlapped)
+    return bytes(buffer[:_pipe_wait(handle, overlapped, timeout)])
+
+
+def _pipe_write(handle, data, timeout):
+    import win32file
+    overlapped = _overlapped()
+    win32file.WriteFile(handle, data, overlapped)
+    _pipe_wait(handle, overlapped, timeout)
+
+
+def _pipe_request(address, data, timeout):
+    import pywintypes
+    import win32con
+    import win32file
+    import win32pipe
+    import winerror
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            # Waits for a free instance while the monitor is serving another client
+            win32pipe.WaitNamedPipe(address, max(1, int((deadline - time.monotonic()) * 1000)))
+            try:
+                handle = win32file.CreateFile(address, win32con.GENERIC_READ | win32con.GENERIC_WRITE, 0, None,
+                                              win32con.OPEN_EXISTING, win32file.FILE_FLAG_OVERLAPPED, None)
+                break
+            except pywintypes.error as e:
+                # Another client took the instance between the wait and the open
+                if e.winerror != winerror.ERROR_PIPE_BUSY or time.monotonic() >= deadline:
+                    raise
+        try:
+            win32pipe.SetNamedPipeHandleState(handle, win32pipe.PIPE_READMODE_MESSAGE, None, None)
+            _pipe_write(handle, data, deadline - time.monotonic())
+            return _pipe_read(handle, deadline - time.monotonic())
+        finally:
+            win32file.CloseHandle(handle)
+    except pywintypes.error as e:
+        raise OSError(e.winerror, e.strerror) from e
+
+
+def request(address, payload, timeout=CLIENT_TIMEOUT):
+    """Send one control request to a running monitor and return its reply.
+
+    Raises OSError when no monitor is listening, or TimeoutError (an
+    OSError too) when it does not answer within timeout seconds.
+    """
+    data = (json.dumps(payload) + '\n').encode('utf-8')
+    if sys.platform == 'win32':
+        reply = _pipe_request(address, data, timeout)
+    else:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(data)
+            reply = _read_message(sock)
+    return json.loads(reply.decode('utf-8'))
@@ -0,0 +1,377 @@
+"""Content-addressed delta updates for the installed client binaries.
+
+Enabled by an "update": {"manifest_url": ...} section in config.json. The
+tracker looks for a new release after its check-in, at most once every
+check_interval_hours. Everything is verified against the manifest, so
+the manifest itself has to come from a server that is trusted: the config
+refuses a manifest_url that isn't https, unless it is on localhost. File
+modes in the manifest are capped at 0755.
+
+A release is published as a manifest plus a directory of chunks (see
+Tools/publish_update.py). The manifest lists every installed file with
+its hash and its content-defined chunks:
+
+    {"version": "1.2.0", "platform": "linux", "chunks_url": "chunks/",
+     "files": {"AttendanceTracker": {"sha256": ..., "size": ..., "mode": 493,
+                                     "chunks": [{"sha256": ..., "size": ...}, ...]}}}
+
+Chunk boundaries depend only on the bytes around them (a gear rolling
+hash), so a library that didn't change between two PyInstaller bundles
+lands in the same chunks even when everything before it moved. The
+tracker rebuilds each changed file in the staging directory from the
+chunks it already has in the installed copy, downloads the rest (stored
+zlib-compressed under chunks_url/<sha256>), and checks every chunk and
+the finished file against the manifest. Nothing is staged unless all of
+it verifies.
+
+The monitor swaps staged files in with apply_staged() once no check-in
+is in flight, then restarts itself. Each file is replaced by rename, and
+a running executable is first moved aside to <name>.update-old, which
+Windows allows. A failure part-way puts the swapped files back.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import zlib
+from urllib.parse import urljoin
+
+logger = logging.getLogger('AttendanceTracker')
+# The tracker stages updates; swapping them in happens in the monitor
+monitor_logger = logging.getLogger('PowerMonitor')
+
+PLATFORM = 'win32' if sys.platform == 'win32' else 'darwin' if sys.platform == 'darwin' else 'linux'
+
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+# A boundary wherever the top 16 bits of the hash are zero: 64 KiB chunks on average
+BOUNDARY_MASK = 0xFFFF << 48
+HASH_MASK = (1 << 64) - 1
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'little') for i in range(256)]
+
+STAGING_DIR = 'update'
+OLD_SUFFIX = '.update-old'
+
+
+class UpdateError(Exception):
+    """The manifest or a chunk is unusable; nothing was staged."""
+
+
+def chunk_spans(data):
+    """(offset, size) of each content-defined chunk of data."""
+    spans = []
+    start, length = 0, len(data)
+    gear, mask, hash_mask = GEAR, BOUNDARY_MASK, HASH_MASK
+    while start < length:
+        end = min(start + MAX_CHUNK, length)
+        cut = end
+        h = 0
+        # Bytes before MIN_CHUNK can't end a chunk, so they aren't hashed either
+        for i in range(start + MIN_CHUNK, end):
+            h = ((h << 1) + gear[data[i]]) & hash_mask
+            if not h & mask:
+                cut = i + 1
+                break
+        spans.append((start, cut - start))
+        start = cut
+    return spans
+
+
+def chunk_data(data):
+    return [{'sha256': hashlib.sha256(data[offset:offset + size]).hexdigest(), 'size': size}
+            for offset, size in chunk_spans(data)]
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(version, files, chunk_dir, platform=PLATFORM):
+    """Chunk each installed-name -> local-path in files into chunk_dir and return the manifest."""
+    os.makedirs(chunk_dir, exist_ok=True)
+    manifest = {'version': version, 'platform': platform, 'chunks_url': 'chunks/', 'files': {}}
+    for name, path in files.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        chunks = chunk_data(data)
+        offset = 0
+        for chunk in chunks:
+            chunk_path = os.path.join(chunk_dir, chunk['sha256'])
+            if not os.path.exists(chunk_path):
+                with open(chunk_path + '.tmp', 'wb') as out:
+                    out.write(zlib.compress(data[offset:offset + chunk['size']], 9))
+                os.replace(chunk_path + '.tmp', chunk_path)
+            offset += chunk['size']
+        manifest['files'][name] = {'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data),
+                                   'mode': os.stat(path).st_mode & 0o777, 'chunks': chunks}
+    return manifest
+
+
+def _check_manifest(manifest):
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('files'), dict):
+        raise UpdateError("manifest has no files")
+    if manifest.get('platform') != PLATFORM:
+        raise UpdateError(f"manifest is for {manifest.get('platform')!r}, not {PLATFORM!r}")
+    for name, entry in manifest['files'].items():
+        # Names come from the server; keep them inside the install directory. A drive
+        # (C:foo is relative to C:'s current directory) or any other colon could leave it on Windows
+        if (os.path.isabs(name) or os.path.splitdrive(name)[0] or ':' in name
+                or '..' in name.replace('\\', '/').split('/')):
+            raise UpdateError(f"manifest names a file outside the install directory: {name!r}")
+        try:
+            if (sum(chunk['size'] for chunk in entry['chunks']) != entry['size'] or len(entry['sha256']) != 64
+                    or not isinstance(entry.get('mode', 0o755), int)):
+                raise UpdateError(f"manifest entry for {name} is inconsistent")
+        except (KeyError, TypeError) as e:
+            raise UpdateError(f"manifest entry for {name} is malformed: {e}")
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, value):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(value, f)
+    os.replace(path + '.tmp', path)
+
+
+class Updater:
+    """Stages the files of a newer release into <install_dir>/update/staged.
+
+    fetch(url) returns the body of a GET as bytes and raises on failure.
+    """
+
+    def __init__(self, install_dir, fetch):
+        self.install_dir = install_dir
+        self.fetch = fetch
+        self.state_dir = os.path.join(install_dir, STAGING_DIR)
+        self.staged_dir = os.path.join(self.state_dir, 'staged')
+        self.check_path = os.path.join(self.state_dir, 'check.json')
+        self.downloaded = 0
+        self.reused = 0
+
+    def due(self, interval_hours):
+        last = _read_json(self.check_path) or {}
+        return time.time() - last.get('last_check', 0) >= interval_hours * 3600
+
+    def check(self, manifest_url):
+        """Stage whatever differs from manifest_url's release; return the staged manifest, or None if up to date."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        _write_json(self.check_path, {'last_check': time.time()})
+        try:
+            manifest = json.loads(self.fetch(manifest_url))
+        except ValueError as e:
+            raise UpdateError(f"manifest is not JSON: {e}")
+        _check_manifest(manifest)
+        changed = {}
+        for name, entry in manifest['files'].items():
+            target = os.path.join(self.install_dir, name)
+            try:
+                if sha256_file(target) == entry['sha256']:
+                    continue
+            except OSError:
+                pass
+            changed[name] = entry
+        staged = staged_update(self.install_dir)
+        if not changed or (staged and staged['version'] == manifest['version']):
+            return None
+        logger.info(f"Update {manifest['version']} changes {', '.join(changed)}")
+        shutil.rmtree(self.staged_dir, ignore_errors=True)
+        chunks_url = urljoin(manifest_url, manifest.get('chunks_url', 'chunks/'))
+        for name, entry in changed.items():
+            self._stage_file(name, entry, chunks_url)
+        staged = dict(manifest, files=changed)
+        # Written last: the monitor only ever sees a staging directory that is complete
+        _write_json(os.path.join(self.state_dir, 'staged.json'), staged)
+        logger.info(f"Staged update {manifest['version']}: downloaded {self.downloaded} bytes, "
+                    f"reused {self.reused} bytes already installed")
+        return staged
+
+    def _local_chunks(self, name):
+        """The installed copy of name and where each of its chunks sits in it."""
+        try:
+            with open(os.path.join(self.install_dir, name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return b'', {}
+        index = {}
+        installed = (_read_json(os.path.join(self.state_dir, 'installed.json')) or {}).get(name)
+        if installed and installed.get('sha256') == hashlib.sha256(data).hexdigest():
+            # Installed by a previous update, so its chunk list is on record and needn't be recomputed
+            offset = 0
+            for chunk in installed['chunks']:
+                index.setdefault(chunk['sha256'], (offset, chunk['size']))
+                offset += chunk['size']
+        else:
+            for offset, size in chunk_spans(data):
+                index.setdefault(hashlib.sha256(data[offset:offset + size]).hexdigest(), (offset, size))
+        return data, index
+
+    def _download(self, chunks_url, chunk):
+        body = self.fetch(urljoin(chunks_url, chunk['sha256']))
+        self.downloaded += len(body)
+        try:
+            # Never inflate more than the chunk can hold
+            inflater = zlib.decompressobj()
+            data = inflater.decompress(body, chunk['size'] + 1)
+        except zlib.error as e:
+            raise UpdateError(f"chunk {chunk['sha256']} is corrupt: {e}")
+        if len(data) != chunk['size'] or hashlib.sha256(data).hexdigest() != chunk['sha256']:
+            raise UpdateError(f"chunk {chunk['sha256']} does not match its hash")
+        return data
+
+    def _stage_file(self, name, entry, chunks_url):
+        local, index = self._local_chunks(name)
+        path = os.path.join(self.staged_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.sha256()
+        with open(path, 'wb') as out:
+            for chunk in entry['chunks']:
+                if chunk['sha256'] in index:
+                    offset, size = index[chunk['sha256']]
+                    data = local[offset:offset + size]
+                    self.reused += size
+                else:
+                    data = self._download(chunks_url, chunk)
+                digest.update(data)
+                out.write(data)
+        if digest.hexdigest() != entry['sha256']:
+            raise UpdateError(f"rebuilt {name} does not match its hash")
+        # Never more than rwxr-xr-x: a server can't make a file setuid or writable by others
+        os.chmod(path, entry.get('mode', 0o755) & 0o755)
+
+
+def staged_update(install_dir):
+    """The manifest of a complete staged update, or None."""
+    staged = _read_json(os.path.join(install_dir, STAGING_DIR, 'staged.json'))
+    return staged if isinstance(staged, dict) and isinstance(staged.get('files'), dict) else None
+
+
+def apply_staged(install_dir):
+    """Swap a staged update into install_dir; return the names replaced ([] if none, or on failure)."""
+    state_dir = os.path.join(install_dir, STAGING_DIR)
+    staged = staged_update(install_dir)
+    if not staged:
+        return []
+    discard = False
+    swapped = []
+    try:
+        for name, entry in staged['files'].items():
+            source = os.path.join(state_dir, 'staged', name)
+            if sha256_file(source) != entry['sha256']:
+                discard = True
+                raise UpdateError(f"staged {name} was modified")
+        for name in staged['files']:
+            target = os.path.join(install_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                os.replace(target, target + OLD_SUFFIX)
+            swapped.append(name)
+            os.replace(os.path.join(state_dir, 'staged', name), target)
+    except (OSError, UpdateError) as e:
+        monitor_logger.error(f"Could not apply update {staged.get('version')}, keeping the installed version: {e}")
+        for name in reversed(swapped):
+            target = os.path.join(install_dir, name)
+            source = os.path.join(state_dir, 'staged', name)
+            try:
+                # Keep the staged copy so the update can be tried again
+                if os.path.exists(target) and not os.path.exists(source):
+                    os.replace(target, source)
+                if os.path.exists(target + OLD_SUFFIX):
+                    os.replace(target + OLD_SUFFIX, target)
+            except OSError as restore_error:
+                monitor_logger.error(f"Could not restore {name}: {restore_error}")
+        if discard:
+            os.remove(os.path.join(state_dir, 'staged.json'))
+        return []
+    installed_path = os.path.join(state_dir, 'installed.json')
+    try:
+        _write_json(installed_path, dict(_read_json(installed_path) or {}, **staged['files']))
+    except OSError as e:
+        monitor_logger.warning(f"Could not record the installed chunk lists: {e}")
+    os.remove(os.path.join(state_dir, 'staged.json'))
+    shutil.rmtree(os.path.join(state_dir, 'staged'), ignore_errors=True)
+    remove_old(install_dir, swapped)
+    monitor_logger.info(f"Applied update {staged.get('version')}: replaced {', '.join(swapped)}")
+    return swapped
+
+
+def remove_old(install_dir, names=None):
+    """Delete the copies apply_staged moved aside; one still running on Windows stays until next time.
+
+    Without names, every leftover in install_dir is looked for, as a monitor does on startup.
+    """
+    if names is None:
+        names = [os.path.relpath(os.path.join(root, f), install_dir)[:-len(OLD_SUFFIX)]
+                 for root, _, files in os.walk(install_dir) for f in files if f.endswith(OLD_SUFFIX)]
+    for name in names:
+        try:
+            os.remove(os.path.join(install_dir, name + OLD_SUFFIX))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            monitor_logger.info(f"Leaving {name}{OLD_SUFFIX} for later: {e}")
+
+
+def check_for_update(settings, install_dir, fetch):
+    """Stage the release at the "update" section's manifest_url if a check is due; return its manifest if staged.
+
+    Skipped while another process is staging or applying an update.
+    """
+    import single_flight
+    updater = Updater(install_dir, fetch)
+    if not updater.due(settings['check_interval_hours']):
+        return None
+    staged = []
+    if not single_flight.SingleFlight(install_dir, name='update').run_if_idle(
+            lambda: staged.append(updater.check(settings['manifest_url']))):
+        logger.info("An update is already in progress in another process")
+        return None
+    return staged[0]
+
+
+def apply_if_idle(install_dir):
+    """apply_staged() unless a tracker is staging an update right now, in which case None."""
+    import single_flight
+    swapped = []
+    if not single_flight.SingleFlight(install_dir, name='update').run_if_idle(
+            lambda: swapped.extend(apply_staged(install_dir))):
+        return None
+    return swapped
+
+
+def runs_from(install_dir):
+    """False for a frozen binary installed elsewhere, such as a machine-wide install the installers update."""
+    if not getattr(sys, 'frozen', False):
+        return True
+    return os.path.realpath(sys.executable).startswith(os.path.join(os.path.realpath(install_dir), ''))
+
+
+def replaces_self(install_dir, names):
+    """Whether names include the program this process is running."""
+    running = os.path.realpath(sys.executable if getattr(sys, 'frozen', False) else sys.argv[0])
+    return any(os.path.realpath(os.path.join(install_dir, name)) == running for name in names)
+
+
+def restart_argv():
+    """The command line that starts this program again."""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable] + sys.argv[1:]
+    return [sys.executable] + sys.argv
+
+
+def restart_env():
+    # A PyInstaller onefile bootloader would otherwise take the new process for its own child
+    return dict(os.environ, PYINSTALLER_RESET_ENVIRONMENT='1')
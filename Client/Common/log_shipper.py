@@ -0,0 +1,257 @@
+"""Ship new lines of the client logs to a collector, a bounded amount at a time.
+
+Enabled by a "logs": {"collector_url": ...} section in config.json. The
+tracker runs one pass after each check-in. A pass reads each log from
+where the last one stopped, gzips up to batch_kb of whole lines into a
+JSON batch and POSTs it:
+
+    {"host": ..., "user": ..., "file": "outputat.log", "inode": 1234,
+     "generation": 0, "offset": 0, "end": 5120, "lines": [...]}
+
+file, inode, generation and offset identify a batch, so a collector can
+drop the duplicate when a batch is resent after a reply was lost. The
+generation goes up whenever a file has to be shipped again from the top.
+
+Checkpoints are byte offsets stored with the file's inode and a checksum
+of its first bytes, in log_shipper.json. When the log was rotated the rest
+of the old file is shipped from its ".1" backup first. A log that was
+truncated or rewritten in place starts again from the top.
+
+A pass stops after max_kb_per_run or max_seconds. Batches are spaced so
+the upload never exceeds max_kbps, and the pass runs in a thread of its
+own at background priority, so whatever the tracker does afterwards (the
+update check) keeps its normal priority. When the collector fails, no pass runs again until an
+exponentially growing backoff (or its Retry-After) has passed; the
+checkpoint stays where it was, so nothing is lost.
+"""
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+
+logger = logging.getLogger('AttendanceTracker')
+
+HEAD_BYTES = 256
+COMPRESS_LEVEL = 6
+BASE_BACKOFF = 60
+MAX_BACKOFF = 6 * 3600
+
+
+class CollectorError(Exception):
+    """The collector refused a batch; retry_after is its Retry-After in seconds, if it sent one."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _head(f, length):
+    f.seek(0)
+    return zlib.crc32(f.read(length))
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After', '')
+    return int(value) if value.strip().isdigit() else None
+
+
+def lower_priority():
+    """Run the calling thread, not the whole process, at background CPU and I/O priority."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        elif sys.platform == 'darwin':
+            # setpriority(PRIO_DARWIN_THREAD, 0, PRIO_DARWIN_BG) throttles just this thread
+            PRIO_DARWIN_THREAD, PRIO_DARWIN_BG = 3, 0x1000
+            os.setpriority(PRIO_DARWIN_THREAD, 0, PRIO_DARWIN_BG)
+        else:
+            # Linux keeps a nice value per thread; os.nice() would lower every thread for good
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (OSError, AttributeError) as e:
+        logger.debug(f"Could not lower priority for log shipping: {e}")
+
+
+class LogShipper:
+    """One shipping pass over a fixed list of log files.
+
+    post(data, headers) sends one gzipped batch and returns the response;
+    exceptions and non-2xx replies count as collector failures. settings is
+    the validated "logs" section of config.json.
+    """
+
+    def __init__(self, files, state_path, post, settings, source=None, clock=time.monotonic, sleep=time.sleep):
+        self.files = files
+        self.state_path = state_path
+        self.post = post
+        self.batch_bytes = int(settings['batch_kb'] * 1024)
+        self.max_bytes = int(settings['max_kb_per_run'] * 1024)
+        self.rate = settings['max_kbps'] * 1024
+        self.max_seconds = settings['max_seconds']
+        self.source = source or {}
+        self.clock = clock
+        self.sleep = sleep
+        self.state = self._load()
+        self.started = None
+        self.shipped = 0
+
+    def _load(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if isinstance(state, dict):
+                return state
+        except (OSError, ValueError):
+            pass
+        return {'files': {}, 'failures': 0, 'next_attempt': 0}
+
+    def _save(self):
+        tmp_path = self.state_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"Failed to save log shipping checkpoint: {e}")
+
+    def _segments(self, path, mark):
+        """(path, start offset, inode, generation) of each file with unshipped lines of the log, oldest first."""
+        try:
+            current = os.stat(path)
+        except OSError:
+            current = None
+        if mark:
+            for candidate, st in ((path, current), (path + '.1', None)):
+                try:
+                    st = st or os.stat(candidate)
+                except OSError:
+                    continue
+                if st.st_ino != mark['inode'] or st.st_size < mark['offset']:
+                    continue
+                with open(candidate, 'rb') as f:
+                    if _head(f, mark['head_len']) != mark['head']:
+                        continue
+                generation = mark.get('generation', 0)
+                if candidate == path:
+                    return [(path, mark['offset'], st.st_ino, generation)]
+                # Rotated since the last pass: finish the backup, then start on the new file
+                segments = [(candidate, mark['offset'], st.st_ino, generation)]
+                return segments + ([(path, 0, current.st_ino, generation)] if current else [])
+            logger.warning(f"Lost track of {os.path.basename(path)} (rotated twice or rewritten), "
+                           f"shipping it from the start")
+            # The same inode may come back with new contents, so its offsets must not look like resends
+            return [(path, 0, current.st_ino, mark.get('generation', 0) + 1)] if current else []
+        return [(path, 0, current.st_ino, 0)] if current else []
+
+    def _mark(self, f, inode, generation, offset):
+        head_len = min(offset, HEAD_BYTES)
+        return {'inode': inode, 'generation': generation, 'offset': offset, 'head_len': head_len,
+                'head': _head(f, head_len)}
+
+    def _send(self, name, inode, generation, offset, end, data):
+        body = dict(self.source, file=name, inode=inode, generation=generation, offset=offset, end=end,
+                    lines=data.decode('utf-8', errors='replace').splitlines())
+        compressed = gzip.compress(json.dumps(body).encode('utf-8'), compresslevel=COMPRESS_LEVEL)
+        try:
+            response = self.post(compressed, {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        except Exception as e:
+            raise CollectorError(f"could not reach the collector: {e}")
+        if not 200 <= response.status_code < 300:
+            raise CollectorError(f"collector answered {response.status_code}", _retry_after(response))
+        return len(compressed)
+
+    def _budget_left(self):
+        return self.shipped < self.max_bytes and self.clock() - self.started < self.max_seconds
+
+    def _ship_log(self, path):
+        """Ship the unshipped lines of one log; False once the pass is out of budget."""
+        name = os.path.basename(path)
+        for segment, offset, inode, generation in self._segments(path, self.state['files'].get(name)):
+            with open(segment, 'rb') as f:
+                while True:
+                    if not self._budget_left():
+                        return False
+                    f.seek(offset)
+                    data = f.read(min(self.batch_bytes, self.max_bytes - self.shipped))
+                    cut = data.rfind(b'\n') + 1
+                    if cut:
+                        data = data[:cut]
+                    elif segment == path and len(data) < self.batch_bytes:
+                        # A partial last line waits until it's complete; a rotated backup won't grow any more
+                        break
+                    if not data:
+                        break
+                    sent_at = self.clock()
+                    wire_bytes = self._send(name, inode, generation, offset, offset + len(data), data)
+                    offset += len(data)
+                    self.shipped += len(data)
+                    self.state['files'][name] = self._mark(f, inode, generation, offset)
+                    self._save()
+                    # Space batches out so the upload stays under max_kbps
+                    self.sleep(max(0.0, wire_bytes / self.rate - (self.clock() - sent_at)))
+                if segment == path:
+                    self.state['files'][name] = self._mark(f, inode, generation, offset)
+        return True
+
+    def ship(self):
+        """Ship what fits in this pass's budget; return the number of log bytes shipped."""
+        now = time.time()
+        if self.state.get('next_attempt', 0) > now:
+            logger.info(f"Log collector backing off for another {int(self.state['next_attempt'] - now)} seconds")
+            return 0
+        self.started = self.clock()
+        self.shipped = 0
+        try:
+            for path in self.files:
+                try:
+                    if not self._ship_log(path):
+                        logger.info(f"Log shipping budget used up after {self.shipped} bytes")
+                        break
+                except OSError as e:
+                    logger.warning(f"Could not read {path} for shipping: {e}")
+        except CollectorError as e:
+            failures = self.state.get('failures', 0) + 1
+            delay = min(BASE_BACKOFF * 2 ** (failures - 1), MAX_BACKOFF)
+            if e.retry_after:
+                delay = max(delay, min(e.retry_after, MAX_BACKOFF))
+            self.state.update(failures=failures, next_attempt=time.time() + delay)
+            logger.warning(f"Log shipping failed ({e}), retrying in {delay} seconds")
+            self._save()
+            return self.shipped
+        self.state.update(failures=0, next_attempt=0)
+        self._save()
+        if self.shipped:
+            logger.info(f"Shipped {self.shipped} bytes of logs")
+        return self.shipped
+
+
+def ship_logs(settings, files, directory, post, source=None):
+    """Run one shipping pass at low priority unless another process is already shipping.
+
+    The pass runs in its own thread so only it is lowered; this waits for it
+    and raises whatever it raised.
+    """
+    import single_flight
+    shipper = LogShipper(files, os.path.join(directory, 'log_shipper.json'), post, settings, source)
+    outcome = {}
+
+    def run():
+        lower_priority()
+        try:
+            outcome['ran'] = single_flight.SingleFlight(directory, name='logship').run_if_idle(shipper.ship)
+        except BaseException as e:
+            outcome['error'] = e
+
+    worker = threading.Thread(target=run, name='log-shipper')
+    worker.start()
+    worker.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    if not outcome['ran']:
+        logger.info("Logs are already being shipped by another process")
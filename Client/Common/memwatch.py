@@ -0,0 +1,91 @@
+import logging
+import os
+import sys
+
+logger = logging.getLogger('PowerMonitor')
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unknown."""
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        counters = _win32_memory_counters()
+        return counters.WorkingSetSize if counters else None
+    return None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if sys.platform == 'win32':
+        counters = _win32_memory_counters()
+        return counters.PeakWorkingSetSize if counters else None
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _win32_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+
+class MemoryReporter:
+    """Logs steady-state and peak memory of the resident monitor.
+
+    RSS figures come from the OS. When tracemalloc is enabled the Python
+    heap's current and peak allocation are logged as well. Reports are only
+    made when the monitor is already awake for an event, never on a timer.
+    """
+
+    def __init__(self, use_tracemalloc=False):
+        self.use_tracemalloc = use_tracemalloc
+        if use_tracemalloc:
+            import tracemalloc
+            tracemalloc.start()
+
+    def snapshot(self):
+        report = {'rss': current_rss(), 'peak_rss': peak_rss()}
+        if self.use_tracemalloc:
+            import tracemalloc
+            report['py_current'], report['py_peak'] = tracemalloc.get_traced_memory()
+        return report
+
+    def report(self, label):
+        try:
+            figures = ', '.join(f"{key}={_kb(value)}" for key, value in self.snapshot().items())
+            logger.info(f"Memory {label}: {figures}")
+        except Exception as e:
+            logger.warning(f"Memory report failed: {e}")
+
+
+def _kb(value):
+    return 'n/a' if value is None else f"{value // 1024}KB"
+
+
+def reporter_from_env():
+    """Create the monitor's reporter; POWER_MONITOR_MEMORY=tracemalloc adds heap tracing."""
+    return MemoryReporter(use_tracemalloc=(os.environ.get('POWER_MONITOR_MEMORY') == 'tracemalloc'))
@@ -0,0 +1,541 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger('PowerMonitor')
+
+# Abstract events consumed by the core. Platform backends translate their
+# native notifications (WM_POWERBROADCAST, WTS session changes, Cocoa
+# notifications) into these before handing them over.
+WAKE = 'wake'
+UNLOCK = 'unlock'
+LOGON = 'logon'
+STARTUP = 'startup'
+SUSPEND = 'suspend'
+LOCK = 'lock'
+LOGOFF = 'logoff'
+SHUTDOWN = 'shutdown'
+# Fired by the monitor's own check-in schedule rather than the OS
+TIMER = 'timer'
+# Requested through the monitor's control endpoint
+MANUAL = 'manual'
+
+LAUNCH_EVENTS = frozenset([WAKE, UNLOCK, LOGON, STARTUP, TIMER, MANUAL])
+
+# Decisions returned by LaunchPolicy.decide
+LAUNCH = 'launch'
+SKIP_RECENT = 'skip_recent'
+SKIP_RUNNING = 'skip_running'
+SKIP_RETRY_CAP = 'skip_retry_cap'
+SKIP_BAD_CONFIG = 'skip_bad_config'
+SKIP_NO_SESSION = 'skip_no_session'
+IGNORE = 'ignore'
+SKIP_DONE = 'skip_done'
+# Reported by MonitorCore.handle when the launcher itself failed
+LAUNCH_FAILED = 'launch_failed'
+
+# Win32 message and wParam values, kept as plain integers so recorded traces
+# can be translated again off-device
+WM_POWERBROADCAST = 0x0218
+WM_WTSSESSION_CHANGE = 0x02B1
+WM_QUERYENDSESSION = 0x0011
+WM_ENDSESSION = 0x0016
+
+PBT_APMSUSPEND = 0x4
+PBT_APMRESUMESUSPEND = 0x7
+PBT_APMRESUMEAUTOMATIC = 0x12
+
+WTS_SESSION_LOGON = 0x5
+WTS_SESSION_LOGOFF = 0x6
+WTS_SESSION_LOCK = 0x7
+WTS_SESSION_UNLOCK = 0x8
+
+WIN32_POWER_EVENTS = {
+    PBT_APMRESUMEAUTOMATIC: WAKE,
+    PBT_APMRESUMESUSPEND: WAKE,
+    PBT_APMSUSPEND: SUSPEND,
+}
+
+WIN32_SESSION_EVENTS = {
+    WTS_SESSION_UNLOCK: UNLOCK,
+    WTS_SESSION_LOGON: LOGON,
+    WTS_SESSION_LOGOFF: LOGOFF,
+    WTS_SESSION_LOCK: LOCK,
+}
+
+COCOA_EVENTS = {
+    'NSWorkspaceDidWakeNotification': WAKE,
+    'NSWorkspaceWillSleepNotification': SUSPEND,
+    'com.apple.screenIsUnlocked': UNLOCK,
+    'com.apple.screenIsLocked': LOCK,
+    'com.apple.sessionDidBecomeActive': LOGON,
+}
+
+
+def from_win32(msg, wparam):
+    """Translate a Win32 window message into an abstract event, or None."""
+    if msg == WM_POWERBROADCAST:
+        return WIN32_POWER_EVENTS.get(wparam)
+    if msg == WM_WTSSESSION_CHANGE:
+        return WIN32_SESSION_EVENTS.get(wparam)
+    if msg == WM_ENDSESSION and wparam:
+        return SHUTDOWN
+    return None
+
+
+def from_cocoa(name):
+    """Translate a Cocoa notification name into an abstract event, or None."""
+    return COCOA_EVENTS.get(name)
+
+
+class LaunchPolicy:
+    """Decides whether an event should start AttendanceTracker.
+
+    Holds the retry cap and the debounce window that used to live inside
+    the platform launchApp implementations. Time is passed in by the caller
+    so the policy can be driven from recorded traces.
+    """
+
+    __slots__ = ('min_event_interval', 'max_retries', 'retry_reset_interval', 'last_event_time', 'retry_count')
+
+    def __init__(self, min_event_interval=5, max_retries=10, retry_reset_interval=3600):
+        self.min_event_interval = min_event_interval
+        self.max_retries = max_retries
+        self.retry_reset_interval = retry_reset_interval
+        self.last_event_time = 0
+        self.retry_count = 0
+
+    def fresh(self):
+        """A policy with the same limits and no history, for another user."""
+        return LaunchPolicy(self.min_event_interval, self.max_retries, self.retry_reset_interval)
+
+    def decide(self, event, now, is_tracker_running):
+        if event not in LAUNCH_EVENTS:
+            return IGNORE
+        if now - self.last_event_time > self.retry_reset_interval and self.retry_count:
+            self.retry_count = 0
+            logger.info("Reset retry counter due to time elapsed")
+        if self.retry_count >= self.max_retries:
+            logger.error(f"Maximum retry attempts ({self.max_retries}) reached.")
+            return SKIP_RETRY_CAP
+        if event != MANUAL and now - self.last_event_time < self.min_event_interval:
+            logger.info("Skipping launch due to recent event")
+            return SKIP_RECENT
+        if is_tracker_running():
+            logger.info("AttendanceTracker is already running")
+            self.retry_count = 0
+            return SKIP_RUNNING
+        self.last_event_time = now
+        self.retry_count += 1
+        logger.info(f"Launch attempt {self.retry_count} of {self.max_retries}")
+        return LAUNCH
+
+
+class UserState:
+    """One user's launch policy and check-in progress, and on a machine-wide monitor their config and schedule."""
+
+    __slots__ = ('policy', 'tracker_pid', 'waiters', 'last_outcome', 'config', 'schedule')
+
+    def __init__(self, policy, config=None):
+        self.policy = policy
+        self.tracker_pid = None
+        self.waiters = 0
+        self.last_outcome = None
+        self.config = config
+        self.schedule = None
+
+    def status(self):
+        status = {'tracker_pid': self.tracker_pid, 'waiters': self.waiters, 'last_outcome': self.last_outcome}
+        if self.config is not None:
+            status['config_error'] = self.config.error
+        return status
+
+
+class EventRecorder:
+    """Appends every event the monitor sees to a JSON-lines trace file.
+
+    Each record carries the seconds since the recorder was opened, the
+    backend that produced it, the abstract event and the raw platform
+    fields, so Tools/replay_trace.py can feed it back through the core.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.started = time.monotonic()
+        self._fh = open(path, 'a', buffering=1)
+
+    def record(self, event, raw=None, user=None):
+        entry = {
+            't': round(time.monotonic() - self.started, 6),
+            'source': self.source,
+            'event': event,
+        }
+        if user:
+            entry['user'] = user
+        if raw:
+            entry['raw'] = raw
+        try:
+            self._fh.write(json.dumps(entry) + '\n')
+        except Exception as e:
+            logger.error(f"Failed to record event {event}: {e}")
+
+    def close(self):
+        self._fh.close()
+
+
+def recorder_from_env(source):
+    """Open a recorder when POWER_MONITOR_TRACE names a trace file."""
+    path = os.environ.get('POWER_MONITOR_TRACE')
+    if not path:
+        return None
+    try:
+        recorder = EventRecorder(path, source)
+        logger.info(f"Recording events to {path}")
+        return recorder
+    except Exception as e:
+        logger.error(f"Failed to open event trace {path}: {e}")
+        return None
+
+
+class StatusFile:
+    """Publishes the monitor's state as a small JSON file, only when it changes.
+
+    This replaces periodic heartbeat logging: the file's content and mtime
+    show what the monitor last did without the process ever waking up on a
+    timer to say so.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._last = None
+
+    def publish(self, status):
+        if status == self._last:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.path)
+            self._last = dict(status)
+        except Exception as e:
+            logger.error(f"Failed to write status file {self.path}: {e}")
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class MonitorCore:
+    """Platform-neutral event handling shared by every power monitor.
+
+    launcher(event, user) starts AttendanceTracker for user and returns True
+    on success; is_tracker_running(user) reports whether one is already
+    running. Both are supplied by the platform backend, as is the clock when
+    replaying.
+
+    A per-user monitor has no SessionTable and every event is its own
+    user's. A machine-wide monitor passes sessions: session events then
+    name the user they came from, and machine events (wake, timer, ...)
+    are handled once for each user with an unlocked session. Debounce,
+    retries and check-in progress are kept per user in a UserState.
+
+    With a CheckinSchedule, set_timer(delay) is called after every event
+    with the seconds until the next scheduled check-in (or None for no
+    timer). The backend keeps exactly one OS timer armed for that delay and
+    hands a TIMER event back when it fires.
+
+    With a ConfigStore, config.json is re-checked as each event is handled
+    and make_schedule(config) rebuilds the schedule when it changes. While
+    the file is invalid no tracker is launched, since it could only fail.
+
+    A machine-wide monitor serves users whose trackers each read their own
+    config.json and record their own last check-in, so it passes
+    user_config(user) instead, returning the ConfigStore their tracker
+    reads. Each user's config is then checked as above and
+    make_schedule(config, user) gives them their own schedule; a TIMER
+    starts check-ins only for the users whose schedule is due.
+
+    nudge(event) is called for WAKE and SUSPEND before any launch decision,
+    so a tracker already waiting to retry can go at once after a wake, or
+    checkpoint before the machine sleeps.
+
+    With apply_update, a staged self-update (see delta_update) is swapped
+    in once no check-in is running: apply_update() returns False while
+    the backend still has a tracker to wait for, and is tried again as
+    each check-in finishes. It restarts the monitor when it replaced it.
+    """
+
+    def __init__(self, launcher, is_tracker_running, policy=None, recorder=None, clock=time.time,
+                 status_path=None, memory=None, schedule=None, set_timer=None, nudge=None,
+                 config=None, make_schedule=None, user=None, sessions=None, apply_update=None,
+                 user_config=None):
+        self.launcher = launcher
+        self.is_tracker_running = is_tracker_running
+        self.policy = policy or LaunchPolicy()
+        self.recorder = recorder
+        self.clock = clock
+        self.status_file = StatusFile(status_path) if status_path else None
+        self.memory = memory
+        self.schedule = schedule
+        self.set_timer = set_timer
+        self.nudge = nudge
+        self.config = config
+        self.make_schedule = make_schedule
+        self.user = user
+        self.sessions = sessions
+        self.apply_update = apply_update
+        self.user_config = user_config if sessions is not None else None
+        self.update_pending = False
+        self.users = {user: UserState(self.policy)}
+        self.next_checkin = None
+        self.started = clock()
+        self.event_counts = {}
+        self.decision_counts = {}
+        self.launches = 0
+        self.launch_failures = 0
+        self.last_event = None
+        self.last_event_time = None
+        self.last_decision = None
+        self.last_probe = None
+        if config and config.refresh() and make_schedule:
+            self.schedule = make_schedule(config.config)
+        self.rearm_timer()
+        self._publish_status()
+
+    def state(self, user=None):
+        """The UserState for user; a per-user monitor only ever has its own."""
+        if user is None or self.sessions is None:
+            user = self.user
+        state = self.users.get(user)
+        if state is None:
+            config = self.user_config(user) if self.user_config else None
+            state = self.users[user] = UserState(self.policy.fresh(), config)
+            if config is not None and config.refresh() and self.make_schedule:
+                state.schedule = self.make_schedule(config.config, user)
+        return state
+
+    def config_for(self, user=None):
+        """The ConfigStore user's tracker goes by, or None when the monitor was given none."""
+        return self._config_for(self.state(user))
+
+    def _config_for(self, state):
+        return state.config if state.config is not None else self.config
+
+    def _schedule_for(self, state):
+        return state.schedule if state.config is not None else self.schedule
+
+    def _users_for(self, event, user):
+        if user is not None or self.sessions is None:
+            return [user]
+        if event == TIMER and self.user_config:
+            return self._due_users()
+        return self.sessions.active_users()
+
+    def _due_users(self):
+        """The users whose own scheduled check-in is due; the due ones without an unlocked session miss it."""
+        now = datetime.fromtimestamp(self.clock())
+        active = self.sessions.active_users()
+        due = []
+        for user, state in list(self.users.items()):
+            next_checkin = state.schedule.next_checkin(now) if state.schedule else None
+            if next_checkin is None or next_checkin > now:
+                continue
+            if user in active:
+                due.append(user)
+            else:
+                # Marked so the timer moves on to the next window instead of firing again at once
+                state.schedule.mark_fired(now)
+                logger.info(f"Scheduled check-in for {user} missed, no unlocked session")
+        return due
+
+    def handle(self, event, raw=None, user=None):
+        """Handle one abstract event and return the decision taken.
+
+        When a machine event is handled for several users, LAUNCH is
+        returned if any of them launched.
+        """
+        if self.recorder:
+            self.recorder.record(event, raw, user)
+        self.event_counts[event] = self.event_counts.get(event, 0) + 1
+        if self.config or self.user_config:
+            self.reload_config()
+        if self.nudge and event in (WAKE, SUSPEND):
+            self.nudge(event)
+        if event not in LAUNCH_EVENTS:
+            decision = IGNORE
+        else:
+            decisions = [self._decide(event, target) for target in self._users_for(event, user)]
+            if not decisions:
+                logger.info(f"No unlocked session to check in for after {event}")
+                decision = SKIP_NO_SESSION
+            else:
+                decision = next((d for d in (LAUNCH, LAUNCH_FAILED) if d in decisions), decisions[0])
+        self.decision_counts[decision] = self.decision_counts.get(decision, 0) + 1
+        self.last_event = event
+        self.last_event_time = self.clock()
+        self.last_decision = decision
+        self.rearm_timer()
+        self._publish_status()
+        return decision
+
+    def _decide(self, event, user):
+        state = self.state(user)
+        schedule = self._schedule_for(state)
+        config = self._config_for(state)
+        for_user = f" for {user}" if user and self.sessions is not None else ""
+        if event == TIMER and schedule:
+            now = datetime.fromtimestamp(self.clock())
+            schedule.mark_fired(now)
+            if schedule.done_today(now):
+                logger.info(f"Scheduled check-in{for_user} skipped, already checked in today")
+                return SKIP_DONE
+        if config and config.error:
+            logger.error(f"Not launching AttendanceTracker{for_user}, configuration is invalid: {config.error}")
+            return SKIP_BAD_CONFIG
+        decision = state.policy.decide(event, self.clock(), lambda: self.is_tracker_running(user))
+        if decision == LAUNCH and schedule:
+            # Any check-in started inside a window covers that window's scheduled one
+            schedule.mark_fired(datetime.fromtimestamp(self.clock()))
+        if decision == LAUNCH:
+            if self.launcher(event, user):
+                self.launches += 1
+            else:
+                self.launch_failures += 1
+                decision = LAUNCH_FAILED
+            self.report_memory(f"after {event} launch")
+            state.waiters = 0
+        elif decision == SKIP_RUNNING:
+            # Attached to the check-in in flight; it reports one outcome for all of us
+            state.waiters += 1
+        return decision
+
+    def tracker_started(self, pid, user=None):
+        """Note the tracker that has taken the flight and is now checking in."""
+        logger.info(f"AttendanceTracker PID {pid} started a check-in{f' for {user}' if user else ''}")
+        self.state(user).tracker_pid = pid
+        self._publish_status()
+
+    def record_outcome(self, outcome, user=None):
+        """Note the outcome of the check-in that just finished, shared by every trigger that waited on it."""
+        state = self.state(user)
+        logger.info(f"Check-in{f' for {user}' if user else ''} finished: {outcome}, "
+                    f"shared with {state.waiters} later trigger(s)")
+        state.last_outcome = outcome
+        state.tracker_pid = None
+        state.waiters = 0
+        self._publish_status()
+        self.try_update()
+
+    def record_probe(self, result):
+        """Note how the last probe of the check-in server went, for status."""
+        self.last_probe = result
+        self._publish_status()
+
+    def update_staged(self):
+        """Note that a tracker staged an update, and apply it now if nothing is running."""
+        if not self.apply_update:
+            logger.info("Ignoring staged update, this monitor does not update itself")
+            return {'update_pending': False}
+        logger.info("An update was staged")
+        self.update_pending = True
+        self._publish_status()
+        self.try_update()
+        return {'update_pending': self.update_pending}
+
+    def try_update(self):
+        """Apply a pending update unless a check-in is still running."""
+        if not self.update_pending:
+            return
+        if any(state.tracker_pid for state in self.users.values()) or not self.apply_update():
+            logger.info("Update waits for the running check-in to finish")
+            return
+        self.update_pending = False
+        self._publish_status()
+
+    def rearm_timer(self):
+        """Recompute the next scheduled check-in and hand its delay to the backend."""
+        if not self.set_timer:
+            return
+        now = self.clock()
+        schedules = [self.schedule] + [state.schedule for state in self.users.values()]
+        times = [t for t in (s.next_checkin(datetime.fromtimestamp(now)) for s in schedules if s) if t]
+        self.next_checkin = min(times).timestamp() if times else None
+        self.set_timer(None if self.next_checkin is None else max(0.0, self.next_checkin - now))
+
+    def reload_config(self, force=False):
+        """Pick up config.json changes (or rebuild from it when forced) and report the result."""
+        if not self.config and not self.user_config:
+            return {'changed': False}
+        changed = False
+        if self.config:
+            changed = self.config.refresh()
+            if (changed or force) and self.config.config is not None and self.make_schedule:
+                self.schedule = self.make_schedule(self.config.config)
+        errors = {}
+        for user, state in list(self.users.items()):
+            if state.config is None:
+                continue
+            user_changed = state.config.refresh()
+            changed = changed or user_changed
+            if (user_changed or force) and state.config.config is not None and self.make_schedule:
+                state.schedule = self.make_schedule(state.config.config, user)
+            if state.config.error:
+                errors[user] = state.config.error
+        if changed or force:
+            self.rearm_timer()
+            self._publish_status()
+        result = {'changed': changed, 'config_error': self.config.error if self.config else None,
+                  'next_checkin': self.next_checkin}
+        if self.user_config:
+            result['user_config_errors'] = errors
+        return result
+
+    def status(self):
+        status = {
+            'pid': os.getpid(),
+            'started': self.started,
+            'last_event': self.last_event,
+            'last_event_time': self.last_event_time,
+            'last_decision': self.last_decision,
+            'launches': self.launches,
+            'launch_failures': self.launch_failures,
+            'next_checkin': self.next_checkin,
+            **self.state().status(),
+            'config_error': self.config.error if self.config else None,
+            'update_pending': self.update_pending,
+            'last_probe': self.last_probe,
+        }
+        if self.sessions is not None:
+            status['sessions'] = self.sessions.summary()
+            status['users'] = {user: state.status() for user, state in self.users.items() if user != self.user}
+        return status
+
+    def report_memory(self, label):
+        if self.memory:
+            self.memory.report(label)
+
+    def _publish_status(self):
+        if self.status_file:
+            self.status_file.publish(self.status())
+
+    def stats(self):
+        return {
+            'events': dict(self.event_counts),
+            'decisions': dict(self.decision_counts),
+            'launches': self.launches,
+            'launch_failures': self.launch_failures,
+            'retry_count': self.policy.retry_count,
+        }
+
+    def close(self):
+        if self.status_file:
+            self.status_file.remove()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
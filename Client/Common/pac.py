@@ -0,0 +1,1235 @@
+"""Evaluate proxy auto-config (PAC) files without a JavaScript engine.
+
+PAC files are JavaScript. This module interprets the part of the language
+that PAC files deployed on corporate networks are written in:
+- functions, global variables, var/let/const;
+- if/else, for (including for-in), while, do-while, switch,
+  break/continue and try/catch/throw;
+- array literals and indexing, regex literals;
+- JavaScript's operators;
+- the String, Array and RegExp methods such files call, plus parseInt,
+  parseFloat, isNaN, String and Number;
+- every PAC helper function, including weekdayRange, dateRange and
+  timeRange, and Microsoft's IPv6 "Ex" variants.
+
+Anything else (object literals, closures, new, Math, Date) raises PacError
+naming the construct and its line, so the caller can say why it fell back
+to its other proxy sources instead of guessing.
+"""
+import ipaddress
+import math
+import re
+import socket
+import time
+
+
+class PacError(ValueError):
+    """Raised when a PAC file cannot be parsed or uses unsupported JavaScript."""
+
+
+class _ScriptError(PacError):
+    """A JavaScript runtime error (undefined variable, ...), which the script's own try/catch can handle."""
+
+
+class _Thrown(Exception):
+    """A value thrown by the script's throw statement."""
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+
+TOKEN = re.compile(r'''
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>>>>=|===|!==|>>>|<<=|>>=|\+\+|--|[-+*/%&|^]=|==|!=|<=|>=|&&|\|\||<<|>>|[!<>+\-*/%&|^~(){}\[\],;.=?:])
+''', re.VERBOSE | re.DOTALL)
+REGEX = re.compile(r'/((?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+)/([A-Za-z]*)')
+ESCAPE = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|\n|.)')
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0', '\n': ''}
+# After one of these a "/" starts a regex literal rather than a division
+REGEX_AFTER_NAMES = {'return', 'typeof', 'case', 'in', 'do', 'else', 'throw'}
+KEYWORDS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+ASSIGNMENTS = {'=', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', '>>>='}
+MAX_CALL_DEPTH = 32
+# Loop iterations allowed per FindProxyForURL call, so a runaway loop fails instead of hanging the tracker
+MAX_STEPS = 100000
+_NO_RETURN = object()
+_BREAK = object()
+_CONTINUE = object()
+
+
+def _unescape(text):
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in 'xu' and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return ESCAPES.get(escape, escape)
+    return ESCAPE.sub(replace, text)
+
+
+class _Regex:
+    """A compiled regex literal; JavaScript syntax and Python's re agree on what PAC files use."""
+
+    FLAGS = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'g': 0, 'u': 0}
+
+    def __init__(self, source, flags):
+        self.source = source
+        self.flags = flags
+        self.is_global = 'g' in flags
+        options = 0
+        for flag in flags:
+            if flag not in self.FLAGS:
+                raise PacError(f"unsupported regex flag {flag!r} in /{source}/{flags}")
+            options |= self.FLAGS[flag]
+        try:
+            self.pattern = re.compile(source.replace('(?<', '(?P<').replace('(?P<=', '(?<=').replace('(?P<!', '(?<!'),
+                                      options)
+        except re.error as e:
+            raise PacError(f"bad regex /{source}/{flags}: {e}")
+
+
+def tokenize(source):
+    """(kind, value, line) tuples; kind is value, name, op or end."""
+    tokens = []
+    pos = 0
+    line = 1
+    while pos < len(source):
+        previous = tokens[-1] if tokens else None
+        if source[pos] == '/' and source[pos + 1:pos + 2] not in ('/', '*') and (
+                previous is None
+                or (previous[0] == 'op' and previous[1] not in (')', ']'))
+                or (previous[0] == 'name' and previous[1] in REGEX_AFTER_NAMES)):
+            match = REGEX.match(source, pos)
+            if not match:
+                raise PacError(f"unterminated regex literal at line {line}")
+            tokens.append(('value', _Regex(match.group(1), match.group(2)), line))
+            pos = match.end()
+            continue
+        match = TOKEN.match(source, pos)
+        if not match:
+            raise PacError(f"unexpected character {source[pos]!r} at line {line}")
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'number':
+            if text[:2].lower() == '0x':
+                value = int(text, 16)
+            elif any(c in text for c in '.eE'):
+                value = float(text)
+            else:
+                value = int(text)
+            tokens.append(('value', value, line))
+        elif kind == 'string':
+            tokens.append(('value', _unescape(text[1:-1]), line))
+        elif kind != 'space':
+            tokens.append((kind, text, line))
+        line += text.count('\n')
+    tokens.append(('end', None, line))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing nested tuples.
+
+    Statements end with their line number: ('var', [(name, expr)], line),
+    ('if', cond, then, otherwise, line), ('for', init, cond, update, body,
+    line), ('forin', name, expr, body, line), ('while', cond, body, line),
+    ('do', body, cond, line), ('switch', expr, [(test, [stmt])], line),
+    ('try', body, name, handler, finally, line), ('throw', expr, line),
+    ('return', expr, line), ('break', line), ('continue', line),
+    ('expr', expr, line), ('block', [stmt], line).
+    Expressions: ('value', v), ('name', n), ('array', [e]), ('not', e),
+    ('neg', e), ('pos', e), ('bitnot', e), ('typeof', e), ('op', symbol,
+    left, right), ('and', l, r), ('or', l, r), ('cond', test, yes, no),
+    ('assign', symbol, target, value), ('update', symbol, target, prefix),
+    ('seq', [e]), ('call', callee, [args]), ('member', obj, name),
+    ('index', obj, expr).
+    """
+
+    def __init__(self, source):
+        self.tokens = tokenize(source)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)][:2]
+
+    def line(self):
+        return self.tokens[min(self.pos, len(self.tokens) - 1)][2]
+
+    def error(self, message):
+        return PacError(f"{message} at line {self.line()}")
+
+    def accept(self, text):
+        kind, value = self.peek()
+        if kind in ('op', 'name') and value == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise self.error(f"expected {text!r}, found {self.peek()[1]!r}")
+
+    def name(self):
+        kind, value = self.peek()
+        if kind != 'name':
+            raise self.error(f"expected a name, found {value!r}")
+        self.pos += 1
+        return value
+
+    def program(self):
+        """({name: (params, body)}, statements run once to set up the globals)."""
+        functions = {}
+        body = []
+        while self.peek()[0] != 'end':
+            if self.accept('function'):
+                name = self.name()
+                self.expect('(')
+                params = []
+                while not self.accept(')'):
+                    if params:
+                        self.expect(',')
+                    params.append(self.name())
+                self.expect('{')
+                functions[name] = (params, self.block())
+            else:
+                body.append(self.statement())
+        return functions, ('block', body, 1)
+
+    def block(self):
+        line = self.line()
+        body = []
+        while not self.accept('}'):
+            if self.peek()[0] == 'end':
+                raise self.error("missing '}'")
+            body.append(self.statement())
+        return ('block', body, line)
+
+    def declarations(self, line):
+        names = []
+        while True:
+            name = self.name()
+            names.append((name, self.assignment() if self.accept('=') else ('value', None)))
+            if not self.accept(','):
+                return ('var', names, line)
+
+    def statement(self):
+        line = self.line()
+        if self.accept('{'):
+            return self.block()
+        if self.accept(';'):
+            return ('block', [], line)
+        if self.accept('var') or self.accept('let') or self.accept('const'):
+            statement = self.declarations(line)
+        elif self.accept('if'):
+            self.expect('(')
+            test = self.expression()
+            self.expect(')')
+            then = self.statement()
+            otherwise = self.statement() if self.accept('else') else ('block', [], line)
+            return ('if', test, then, otherwise, line)
+        elif self.accept('for'):
+            return self.for_statement(line)
+        elif self.accept('while'):
+            self.expect('(')
+            test = self.expression()
+            self.expect(')')
+            return ('while', test, self.statement(), line)
+        elif self.accept('do'):
+            body = self.statement()
+            self.expect('while')
+            self.expect('(')
+            test = self.expression()
+            self.expect(')')
+            statement = ('do', body, test, line)
+        elif self.accept('switch'):
+            return self.switch_statement(line)
+        elif self.accept('try'):
+            return self.try_statement(line)
+        elif self.accept('break'):
+            statement = ('break', line)
+        elif self.accept('continue'):
+            statement = ('continue', line)
+        elif self.accept('throw'):
+            statement = ('throw', self.expression(), line)
+        elif self.accept('return'):
+            value = ('value', None) if self.peek() in (('op', ';'), ('op', '}')) else self.expression()
+            statement = ('return', value, line)
+        else:
+            kind, value = self.peek()
+            if kind == 'name' and value in ('function', 'class', 'with', 'import', 'export'):
+                raise self.error(f"unsupported statement {value!r}")
+            statement = ('expr', self.expression(), line)
+        self.accept(';')
+        return statement
+
+    def for_statement(self, line):
+        self.expect('(')
+        kind, value = self.peek()
+        declared = kind == 'name' and value in ('var', 'let', 'const')
+        if self.peek(1 + declared) == ('name', 'in'):
+            self.pos += declared
+            name = self.name()
+            self.expect('in')
+            items = self.expression()
+            self.expect(')')
+            return ('forin', name, items, self.statement(), line)
+        if self.accept(';'):
+            init = ('block', [], line)
+        else:
+            if self.accept('var') or self.accept('let') or self.accept('const'):
+                init = self.declarations(line)
+            else:
+                init = ('expr', self.expression(), line)
+            self.expect(';')
+        test = ('value', True) if self.peek() == ('op', ';') else self.expression()
+        self.expect(';')
+        update = ('value', None) if self.peek() == ('op', ')') else self.expression()
+        self.expect(')')
+        return ('for', init, test, update, self.statement(), line)
+
+    def switch_statement(self, line):
+        self.expect('(')
+        subject = self.expression()
+        self.expect(')')
+        self.expect('{')
+        cases = []
+        while not self.accept('}'):
+            if self.accept('case'):
+                test = self.expression()
+            elif self.accept('default'):
+                test = None
+            else:
+                raise self.error(f"expected 'case' or 'default', found {self.peek()[1]!r}")
+            self.expect(':')
+            body = []
+            while self.peek() not in (('name', 'case'), ('name', 'default'), ('op', '}')):
+                if self.peek()[0] == 'end':
+                    raise self.error("missing '}'")
+                body.append(self.statement())
+            cases.append((test, body))
+        return ('switch', subject, cases, line)
+
+    def try_statement(self, line):
+        self.expect('{')
+        body = self.block()
+        name = handler = finally_block = None
+        if self.accept('catch'):
+            if self.accept('('):
+                name = self.name()
+                self.expect(')')
+            self.expect('{')
+            handler = self.block()
+        if self.accept('finally'):
+            self.expect('{')
+            finally_block = self.block()
+        if handler is None and finally_block is None:
+            raise self.error("try without catch or finally")
+        return ('try', body, name, handler, finally_block, line)
+
+    def expression(self):
+        node = self.assignment()
+        if self.peek() != ('op', ','):
+            return node
+        nodes = [node]
+        while self.accept(','):
+            nodes.append(self.assignment())
+        return ('seq', nodes)
+
+    def assignment(self):
+        target = self.conditional()
+        kind, value = self.peek()
+        if kind == 'op' and value in ASSIGNMENTS:
+            if target[0] not in ('name', 'index'):
+                raise self.error(f"cannot assign to this expression with {value!r}")
+            self.pos += 1
+            return ('assign', value, target, self.assignment())
+        return target
+
+    def conditional(self):
+        test = self.binary(0)
+        if self.accept('?'):
+            yes = self.assignment()
+            self.expect(':')
+            return ('cond', test, yes, self.assignment())
+        return test
+
+    LEVELS = [('||',), ('&&',), ('|',), ('^',), ('&',), ('==', '!=', '===', '!=='), ('<', '>', '<=', '>='),
+              ('<<', '>>', '>>>'), ('+', '-'), ('*', '/', '%')]
+
+    def binary(self, level):
+        if level == len(self.LEVELS):
+            return self.unary()
+        left = self.binary(level + 1)
+        while True:
+            kind, value = self.peek()
+            if kind != 'op' or value not in self.LEVELS[level]:
+                return left
+            self.pos += 1
+            right = self.binary(level + 1)
+            if value == '||':
+                left = ('or', left, right)
+            elif value == '&&':
+                left = ('and', left, right)
+            else:
+                left = ('op', value, left, right)
+
+    def unary(self):
+        for symbol, kind in (('!', 'not'), ('-', 'neg'), ('+', 'pos'), ('~', 'bitnot'), ('typeof', 'typeof')):
+            if self.accept(symbol):
+                return (kind, self.unary())
+        for symbol in ('++', '--'):
+            if self.accept(symbol):
+                return ('update', symbol, self.assignable(self.unary()), True)
+        return self.postfix()
+
+    def assignable(self, node):
+        if node[0] not in ('name', 'index'):
+            raise self.error("++ and -- need a variable or an array element")
+        return node
+
+    def postfix(self):
+        node = self.primary()
+        while True:
+            if self.accept('.'):
+                node = ('member', node, self.name())
+            elif self.accept('['):
+                node = ('index', node, self.expression())
+                self.expect(']')
+            elif self.accept('('):
+                args = []
+                while not self.accept(')'):
+                    if args:
+                        self.expect(',')
+                    args.append(self.assignment())
+                node = ('call', node, args)
+            elif self.peek() in (('op', '++'), ('op', '--')):
+                symbol = self.peek()[1]
+                self.pos += 1
+                return ('update', symbol, self.assignable(node), False)
+            else:
+                return node
+
+    def primary(self):
+        kind, value = self.peek()
+        if kind == 'value':
+            self.pos += 1
+            return ('value', value)
+        if kind == 'name':
+            if value in ('new', 'function', 'this', 'delete', 'void', 'instanceof', 'class'):
+                raise self.error(f"unsupported {value!r}")
+            self.pos += 1
+            if value in KEYWORDS:
+                return ('value', KEYWORDS[value])
+            return ('name', value)
+        if self.accept('('):
+            node = self.expression()
+            self.expect(')')
+            return node
+        if self.accept('['):
+            items = []
+            while not self.accept(']'):
+                if items:
+                    self.expect(',')
+                    if self.accept(']'):
+                        break  # trailing comma
+                items.append(self.assignment())
+            return ('array', items)
+        if (kind, value) == ('op', '{'):
+            raise self.error("unsupported object literal")
+        raise self.error(f"unexpected {value!r}")
+
+
+def _text(value):
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (math.inf, -math.inf):
+            return 'Infinity' if value > 0 else '-Infinity'
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, list):
+        return ','.join('' if item is None else _text(item) for item in value)
+    if isinstance(value, _Regex):
+        return f'/{value.source}/{value.flags}'
+    if isinstance(value, _Function):
+        return f'function {value.name}() {{ [code] }}'
+    return str(value)
+
+
+def _number(value):
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return 0
+        try:
+            return int(text, 16) if text[:2].lower() == '0x' else float(text)
+        except ValueError:
+            return math.nan
+    if isinstance(value, list):
+        return _number(_text(value))
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return math.nan
+
+
+def _int32(value):
+    number = _number(value)
+    if number != number or number in (math.inf, -math.inf):
+        return 0
+    number = int(number) & 0xFFFFFFFF
+    return number - 0x100000000 if number & 0x80000000 else number
+
+
+def _kind(value):
+    return 'number' if isinstance(value, (int, float)) and not isinstance(value, bool) else type(value)
+
+
+def _equal(left, right, strict):
+    if _kind(left) == _kind(right):
+        return left is right if isinstance(left, (list, _Regex)) else left == right
+    if strict or left is None or right is None:
+        return False
+    return _number(left) == _number(right)
+
+
+def _typeof(value):
+    if value is None:
+        return 'undefined'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, _Function):
+        return 'function'
+    return 'object'
+
+
+class _Function:
+    """A function named in an expression rather than called, e.g. typeof dnsResolveEx."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+def _addresses(host, family=socket.AF_UNSPEC):
+    try:
+        return list(dict.fromkeys(info[4][0] for info in socket.getaddrinfo(host, None, family)))
+    except (OSError, UnicodeError):
+        return []
+
+
+def _resolve(host):
+    addresses = _addresses(host, socket.AF_INET)
+    return addresses[0] if addresses else None
+
+
+def _source_address(family, probe):
+    # A connected UDP socket reveals the source address without sending anything
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.connect((probe, 53))
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+def _my_ip_address():
+    return _source_address(socket.AF_INET, '192.0.2.1') or '127.0.0.1'
+
+
+def _my_ip_address_ex():
+    found = [_source_address(socket.AF_INET6, '2001:db8::1'), _source_address(socket.AF_INET, '192.0.2.1')]
+    return ';'.join(address for address in found if address) or '127.0.0.1'
+
+
+def _is_in_net(host, pattern, mask):
+    address = host if _is_ip(host) else _resolve(host)
+    if not address:
+        return False
+    try:
+        mask = int(ipaddress.IPv4Address(mask))
+        return int(ipaddress.IPv4Address(address)) & mask == int(ipaddress.IPv4Address(pattern)) & mask
+    except ValueError:
+        return False
+
+
+def _is_in_net_ex(host, prefix):
+    try:
+        network = ipaddress.ip_network(prefix, strict=False)
+    except ValueError:
+        return False
+    for address in ([host] if _is_ip(host) else _addresses(host)):
+        try:
+            if ipaddress.ip_address(address) in network:
+                return True
+        except (ValueError, TypeError):
+            continue
+    return False
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _convert_addr(address):
+    try:
+        return int(ipaddress.IPv4Address(address))
+    except ValueError:
+        return 0
+
+
+def _sort_ip_address_list(addresses):
+    try:
+        parsed = [ipaddress.ip_address(a.strip()) for a in addresses.split(';') if a.strip()]
+    except (ValueError, AttributeError):
+        return False
+    # IPv6 first, as Microsoft's implementation orders them
+    return ';'.join(str(a) for a in sorted(parsed, key=lambda a: (-a.version, int(a))))
+
+
+def _sh_exp_match(text, pattern):
+    # Only * and ? are special in shell expressions as PAC defines them; [ and ] match themselves
+    regex = ''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern)
+    return re.fullmatch(regex, text, re.DOTALL) is not None
+
+
+DAYS = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+
+def _clock(args):
+    """The arguments without a trailing "GMT", and the time they are to be checked against."""
+    if args and args[-1] == 'GMT':
+        return list(args[:-1]), time.gmtime()
+    return list(args), time.localtime()
+
+
+def _in_range(value, start, end):
+    # A range that ends before it starts wraps around: FRI-MON, 22:00-06:00, NOV-FEB
+    return start <= value <= end if start <= end else value >= start or value <= end
+
+
+def _weekday_range(*args):
+    args, now = _clock(args)
+    if not 1 <= len(args) <= 2:
+        return False
+    try:
+        days = [DAYS.index(_text(day).upper()) for day in args]
+    except ValueError:
+        return False
+    today = (now.tm_wday + 1) % 7
+    return _in_range(today, days[0], days[-1])
+
+
+def _time_range(*args):
+    args, now = _clock(args)
+    numbers = [_number(arg) for arg in args]
+    if not numbers or any(n != n or n in (math.inf, -math.inf) for n in numbers):
+        return False
+    numbers = [int(n) for n in numbers]
+    if len(numbers) == 1:
+        return now.tm_hour == numbers[0]
+    if len(numbers) == 2:
+        # The end hour is exclusive: timeRange(9, 17) stops at 17:00
+        start, end = numbers
+        return start <= now.tm_hour < end if start <= end else now.tm_hour >= start or now.tm_hour < end
+    if len(numbers) == 4:
+        start = numbers[0] * 3600 + numbers[1] * 60
+        end = numbers[2] * 3600 + numbers[3] * 60 + 59
+    elif len(numbers) == 6:
+        start = numbers[0] * 3600 + numbers[1] * 60 + numbers[2]
+        end = numbers[3] * 3600 + numbers[4] * 60 + numbers[5]
+    else:
+        return False
+    return _in_range(now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec, start, end)
+
+
+def _date_fields(values):
+    """{'year'|'month'|'day': n} for one end of a dateRange, or None."""
+    fields = {}
+    for value in values:
+        if isinstance(value, str) and value.upper() in MONTHS:
+            field, number = 'month', MONTHS.index(value.upper())
+        else:
+            number = _number(value)
+            if number != number or number in (math.inf, -math.inf):
+                return None
+            number = int(number)
+            field = 'day' if number < 32 else 'year'
+        if field in fields:
+            return None
+        fields[field] = number
+    return fields
+
+
+def _date_range(*args):
+    args, now = _clock(args)
+    if not 1 <= len(args) <= 6 or (len(args) > 1 and len(args) % 2):
+        return False
+    half = max(1, len(args) // 2)
+    start, end = _date_fields(args[:half]), _date_fields(args[-half:])
+    if not start or start.keys() != end.keys():
+        return False
+    # Compare only the fields given: dateRange(1, 15) is days 1-15 of whatever month this is
+    keys = [key for key in ('year', 'month', 'day') if key in start]
+    today = {'year': now.tm_year, 'month': now.tm_mon - 1, 'day': now.tm_mday}
+    value, low, high = (tuple(fields[key] for key in keys) for fields in (today, start, end))
+    if 'year' in start and low > high:
+        return False
+    return _in_range(value, low, high)
+
+
+def _parse_int(text, radix=None):
+    text = _text(text).strip()
+    radix = int(_number(radix)) if radix is not None else 0
+    match = re.match(r'([+-]?)(0[xX])?([0-9a-zA-Z]*)', text)
+    sign, prefix, digits = match.groups()
+    if radix == 0:
+        radix = 16 if prefix else 10
+    elif prefix and radix != 16:
+        digits = ''
+    valid = ''
+    for c in digits:
+        if int(c, 36) >= radix:
+            break
+        valid += c
+    if not valid or not 2 <= radix <= 36:
+        return math.nan
+    return int(sign + valid, radix)
+
+
+def _parse_float(text):
+    match = re.match(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?Infinity)', _text(text))
+    if not match:
+        return math.nan
+    number = float(match.group(1).replace('Infinity', 'inf'))
+    return int(number) if number.is_integer() and 'e' not in match.group(1).lower() and '.' not in match.group(1) \
+        else number
+
+
+BUILTINS = {
+    'isPlainHostName': lambda host: '.' not in host,
+    'dnsDomainIs': lambda host, domain: host.lower().endswith(domain.lower()),
+    'localHostOrDomainIs': lambda host, hostdom: host == hostdom or ('.' not in host and hostdom.startswith(host + '.')),
+    'isResolvable': lambda host: _resolve(host) is not None,
+    'isResolvableEx': lambda host: bool(_addresses(host)),
+    'isInNet': _is_in_net,
+    'isInNetEx': _is_in_net_ex,
+    'dnsResolve': _resolve,
+    'dnsResolveEx': lambda host: ';'.join(_addresses(host)),
+    'convert_addr': _convert_addr,
+    'myIpAddress': _my_ip_address,
+    'myIpAddressEx': _my_ip_address_ex,
+    'sortIpAddressList': _sort_ip_address_list,
+    'getClientVersion': lambda: '1.0',
+    'dnsDomainLevels': lambda host: host.count('.'),
+    'shExpMatch': _sh_exp_match,
+    'weekdayRange': _weekday_range,
+    'dateRange': _date_range,
+    'timeRange': _time_range,
+    'alert': lambda *args: None,
+    'parseInt': _parse_int,
+    'parseFloat': _parse_float,
+    'isNaN': lambda value: _number(value) != _number(value),
+    'String': lambda value='': _text(value),
+    'Number': lambda value=0: _number(value),
+}
+
+# Helpers whose answer depends on when they are asked
+TIME_HELPERS = ('weekdayRange', 'dateRange', 'timeRange')
+
+
+def _index_of(items, item, start=0):
+    for i in range(max(0, int(_number(start))), len(items)):
+        if _equal(items[i], item, True):
+            return i
+    return -1
+
+
+def _slice(length, start=None, end=None):
+    def clamp(value, default):
+        if value is None:
+            return default
+        value = int(_number(value))
+        return max(0, length + value) if value < 0 else min(value, length)
+    return clamp(start, 0), clamp(end, length)
+
+
+def _substring(s, start, end=None):
+    start = min(max(0, int(_number(start))), len(s))
+    end = len(s) if end is None else min(max(0, int(_number(end))), len(s))
+    return s[min(start, end):max(start, end)]
+
+
+def _substr(s, start, length=None):
+    start, _ = _slice(len(s), start)
+    return s[start:] if length is None else s[start:start + max(0, int(_number(length)))]
+
+
+def _split(s, separator=None, limit=None):
+    if separator is None:
+        parts = [s]
+    elif isinstance(separator, _Regex):
+        parts = separator.pattern.split(s) if s else []
+    elif separator == '':
+        parts = list(s)
+    else:
+        parts = s.split(_text(separator))
+    return parts if limit is None else parts[:max(0, int(_number(limit)))]
+
+
+def _replacement(template):
+    # $1, $& and $$ in a JavaScript replacement string
+    return lambda match: re.sub(r'\$(\d\d?|&|\$)', lambda m: '$' if m.group(1) == '$' else (
+        match.group(0) if m.group(1) == '&' else (match.group(int(m.group(1))) or '')), template)
+
+
+def _replace(s, pattern, replacement):
+    replacement = _text(replacement)
+    if isinstance(pattern, _Regex):
+        return pattern.pattern.sub(_replacement(replacement), s, count=0 if pattern.is_global else 1)
+    pattern = _text(pattern)
+    at = s.find(pattern)
+    if at < 0:
+        return s
+    return s[:at] + _replacement(replacement)(re.match(re.escape(pattern), s[at:])) + s[at + len(pattern):]
+
+
+def _match(s, pattern):
+    regex = pattern if isinstance(pattern, _Regex) else _Regex(re.escape(_text(pattern)), '')
+    if regex.is_global:
+        found = [m.group(0) for m in regex.pattern.finditer(s)]
+        return found or None
+    match = regex.pattern.search(s)
+    return [match.group(0), *match.groups()] if match else None
+
+
+def _search(s, pattern):
+    regex = pattern if isinstance(pattern, _Regex) else _Regex(re.escape(_text(pattern)), '')
+    match = regex.pattern.search(s)
+    return match.start() if match else -1
+
+
+STRING_METHODS = {
+    'toLowerCase': lambda s: s.lower(),
+    'toUpperCase': lambda s: s.upper(),
+    'indexOf': lambda s, sub, start=0: s.find(_text(sub), max(0, int(_number(start)))),
+    'lastIndexOf': lambda s, sub: s.rfind(_text(sub)),
+    'includes': lambda s, sub: _text(sub) in s,
+    'charAt': lambda s, i=0: s[int(_number(i))] if 0 <= int(_number(i)) < len(s) else '',
+    'charCodeAt': lambda s, i=0: ord(s[int(_number(i))]) if 0 <= int(_number(i)) < len(s) else math.nan,
+    'substring': _substring,
+    'substr': _substr,
+    'slice': lambda s, start=None, end=None: s[slice(*_slice(len(s), start, end))],
+    'startsWith': lambda s, prefix: s.startswith(_text(prefix)),
+    'endsWith': lambda s, suffix: s.endswith(_text(suffix)),
+    'trim': lambda s: s.strip(),
+    'split': _split,
+    'replace': _replace,
+    'match': _match,
+    'search': _search,
+    'concat': lambda s, *more: s + ''.join(_text(m) for m in more),
+    'toString': lambda s: s,
+}
+ARRAY_METHODS = {
+    'indexOf': _index_of,
+    'includes': lambda items, item: _index_of(items, item) >= 0,
+    'join': lambda items, separator=',': _text(separator).join('' if i is None else _text(i) for i in items),
+    'push': lambda items, *more: (items.extend(more), len(items))[1],
+    'pop': lambda items: items.pop() if items else None,
+    'shift': lambda items: items.pop(0) if items else None,
+    'concat': lambda items, *more: items + [x for m in more for x in (m if isinstance(m, list) else [m])],
+    'slice': lambda items, start=None, end=None: items[slice(*_slice(len(items), start, end))],
+    'reverse': lambda items: (items.reverse(), items)[1],
+    'toString': lambda items: _text(items),
+}
+REGEX_METHODS = {
+    'test': lambda regex, s: regex.pattern.search(_text(s)) is not None,
+    'exec': lambda regex, s: _match(_text(s), _Regex(regex.source, regex.flags.replace('g', ''))),
+}
+
+
+class _Scope:
+    __slots__ = ('names', 'parent')
+
+    def __init__(self, names, parent=None):
+        self.names = names
+        self.parent = parent
+
+    def find(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return scope
+            scope = scope.parent
+        return None
+
+
+class PacScript:
+    """A parsed PAC file; find_proxy() runs its FindProxyForURL.
+
+    Microsoft's FindProxyForURLEx is used instead when the file defines it.
+    After find_proxy(), time_dependent says whether the answer came by way
+    of weekdayRange, dateRange or timeRange, and so may change by itself.
+    """
+
+    def __init__(self, source):
+        self.functions, setup = _Parser(source).program()
+        self.entry = next((name for name in ('FindProxyForURLEx', 'FindProxyForURL') if name in self.functions), None)
+        if self.entry is None:
+            raise PacError("no FindProxyForURL function")
+        self.globals = _Scope({})
+        self.line = 1
+        self.time_dependent = False
+        self._evaluate(lambda: self._run(setup, self.globals, 0))
+
+    def find_proxy(self, url, host):
+        """Return FindProxyForURL's answer, e.g. "PROXY proxy:8080; DIRECT"."""
+        self.time_dependent = False
+        return _text(self._evaluate(lambda: self._call(self.entry, [url, host], 0)))
+
+    def _evaluate(self, action):
+        self.steps = 0
+        try:
+            return action()
+        except _ScriptError as e:
+            raise PacError(f"{e} at line {self.line}")
+        except _Thrown as e:
+            raise PacError(f"uncaught exception {_text(e.value)!r} at line {self.line}")
+        except PacError:
+            raise
+        except RecursionError:
+            raise PacError(f"expression nested too deeply at line {self.line}")
+        except (TypeError, AttributeError, ValueError, IndexError, KeyError, OverflowError) as e:
+            raise PacError(f"evaluation failed at line {self.line}: {e}")
+
+    def _call(self, name, args, depth):
+        if name in self.functions:
+            if depth > MAX_CALL_DEPTH:
+                raise PacError("function calls nested too deeply")
+            params, body = self.functions[name]
+            scope = _Scope(dict(zip(params, args + [None] * (len(params) - len(args)))), self.globals)
+            line = self.line
+            result = self._run(body, scope, depth)
+            self.line = line
+            return None if result is _NO_RETURN else result
+        if name in BUILTINS:
+            if name in TIME_HELPERS:
+                self.time_dependent = True
+            return BUILTINS[name](*args)
+        # A ReferenceError in JavaScript, so a try/catch probing for a helper can handle it
+        raise _ScriptError(f"unsupported function {name}()")
+
+    def _step(self):
+        self.steps += 1
+        if self.steps > MAX_STEPS:
+            raise PacError(f"loop ran more than {MAX_STEPS} times at line {self.line}")
+
+    def _loop_body(self, body, scope, depth):
+        """Run one iteration; returns _BREAK, None to go on, or a return value."""
+        self._step()
+        result = self._run(body, scope, depth)
+        if result is _BREAK:
+            return _BREAK
+        if result is _CONTINUE or result is _NO_RETURN:
+            return None
+        return result
+
+    def _run(self, statement, scope, depth):
+        """Run a statement; returns _NO_RETURN, _BREAK, _CONTINUE or the value of a return."""
+        kind = statement[0]
+        self.line = statement[-1]
+        if kind == 'block':
+            for inner in statement[1]:
+                result = self._run(inner, scope, depth)
+                if result is not _NO_RETURN:
+                    return result
+        elif kind == 'var':
+            for name, value in statement[1]:
+                scope.names[name] = self._eval(value, scope, depth)
+        elif kind == 'if':
+            branch = statement[2] if self._truthy(self._eval(statement[1], scope, depth)) else statement[3]
+            return self._run(branch, scope, depth)
+        elif kind == 'for':
+            _, init, test, update, body, _ = statement
+            self._run(init, scope, depth)
+            while self._truthy(self._eval(test, scope, depth)):
+                result = self._loop_body(body, scope, depth)
+                if result is _BREAK:
+                    break
+                if result is not None:
+                    return result
+                self._eval(update, scope, depth)
+        elif kind == 'forin':
+            _, name, items, body, _ = statement
+            items = self._eval(items, scope, depth)
+            if isinstance(items, (list, str)):
+                for index in range(len(items)):
+                    (scope.find(name) or scope).names[name] = str(index)
+                    result = self._loop_body(body, scope, depth)
+                    if result is _BREAK:
+                        break
+                    if result is not None:
+                        return result
+            elif items is not None:
+                raise PacError(f"for-in over a {_typeof(items)} is not supported at line {statement[-1]}")
+        elif kind in ('while', 'do'):
+            body, test = (statement[2], statement[1]) if kind == 'while' else (statement[1], statement[2])
+            while kind == 'do' or self._truthy(self._eval(test, scope, depth)):
+                kind = 'while'
+                result = self._loop_body(body, scope, depth)
+                if result is _BREAK:
+                    break
+                if result is not None:
+                    return result
+        elif kind == 'switch':
+            return self._switch(statement, scope, depth)
+        elif kind == 'try':
+            return self._try(statement, scope, depth)
+        elif kind == 'break':
+            return _BREAK
+        elif kind == 'continue':
+            return _CONTINUE
+        elif kind == 'throw':
+            raise _Thrown(self._eval(statement[1], scope, depth))
+        elif kind == 'return':
+            return self._eval(statement[1], scope, depth)
+        else:
+            self._eval(statement[1], scope, depth)
+        return _NO_RETURN
+
+    def _switch(self, statement, scope, depth):
+        _, subject, cases, _ = statement
+        value = self._eval(subject, scope, depth)
+        start = None
+        for i, (test, _) in enumerate(cases):
+            if test is not None and _equal(value, self._eval(test, scope, depth), True):
+                start = i
+                break
+        if start is None:
+            start = next((i for i, (test, _) in enumerate(cases) if test is None), None)
+        if start is None:
+            return _NO_RETURN
+        # Cases fall through into the next one until a break
+        for _, body in cases[start:]:
+            for inner in body:
+                result = self._run(inner, scope, depth)
+                if result is _BREAK:
+                    return _NO_RETURN
+                if result is not _NO_RETURN:
+                    return result
+        return _NO_RETURN
+
+    def _try(self, statement, scope, depth):
+        _, body, name, handler, finally_block, _ = statement
+        try:
+            result = self._run(body, scope, depth)
+        except (_Thrown, _ScriptError) as e:
+            if handler is None:
+                raise
+            if name:
+                scope.names[name] = e.value if isinstance(e, _Thrown) else str(e)
+            result = self._run(handler, scope, depth)
+        finally:
+            if finally_block is not None:
+                ending = self._run(finally_block, scope, depth)
+                if ending is not _NO_RETURN:
+                    return ending
+        return result
+
+    @staticmethod
+    def _truthy(value):
+        if isinstance(value, (list, _Regex, _Function)):
+            return True
+        return value not in (None, False, 0, '') and value == value
+
+    def _lookup(self, name, scope):
+        found = scope.find(name)
+        if found is not None:
+            return found.names[name]
+        if name in self.functions or name in BUILTINS:
+            return _Function(name)
+        raise _ScriptError(f"{name} is not defined")
+
+    def _store(self, target, value, scope, depth):
+        if target[0] == 'name':
+            # Assigning a name that was never declared creates a global, as sloppy-mode JavaScript does
+            (scope.find(target[1]) or self.globals).names[target[1]] = value
+            return value
+        items = self._eval(target[1], scope, depth)
+        index = self._eval(target[2], scope, depth)
+        if not isinstance(items, list):
+            raise PacError(f"cannot assign to an element of a {_typeof(items)}")
+        index = int(_number(index))
+        if index < 0:
+            raise PacError("cannot assign to a negative array index")
+        items.extend([None] * (index + 1 - len(items)))
+        items[index] = value
+        return value
+
+    def _eval(self, node, scope, depth):
+        kind = node[0]
+        if kind == 'value':
+            return node[1]
+        if kind == 'name':
+            return self._lookup(node[1], scope)
+        if kind == 'array':
+            return [self._eval(item, scope, depth) for item in node[1]]
+        if kind == 'not':
+            return not self._truthy(self._eval(node[1], scope, depth))
+        if kind == 'neg':
+            return -_number(self._eval(node[1], scope, depth))
+        if kind == 'pos':
+            return _number(self._eval(node[1], scope, depth))
+        if kind == 'bitnot':
+            return ~_int32(self._eval(node[1], scope, depth))
+        if kind == 'typeof':
+            if node[1][0] == 'name' and scope.find(node[1][1]) is None and node[1][1] not in self.functions \
+                    and node[1][1] not in BUILTINS:
+                return 'undefined'
+            return _typeof(self._eval(node[1], scope, depth))
+        if kind == 'and':
+            left = self._eval(node[1], scope, depth)
+            return self._eval(node[2], scope, depth) if self._truthy(left) else left
+        if kind == 'or':
+            left = self._eval(node[1], scope, depth)
+            return left if self._truthy(left) else self._eval(node[2], scope, depth)
+        if kind == 'cond':
+            return self._eval(node[2] if self._truthy(self._eval(node[1], scope, depth)) else node[3], scope, depth)
+        if kind == 'op':
+            return self._operator(node[1], self._eval(node[2], scope, depth), self._eval(node[3], scope, depth))
+        if kind == 'seq':
+            value = None
+            for inner in node[1]:
+                value = self._eval(inner, scope, depth)
+            return value
+        if kind == 'assign':
+            _, symbol, target, value = node
+            value = self._eval(value, scope, depth)
+            if symbol != '=':
+                value = self._operator(symbol[:-1], self._eval(target, scope, depth), value)
+            return self._store(target, value, scope, depth)
+        if kind == 'update':
+            _, symbol, target, prefix = node
+            old = _number(self._eval(target, scope, depth))
+            new = old + 1 if symbol == '++' else old - 1
+            self._store(target, new, scope, depth)
+            return new if prefix else old
+        if kind == 'member':
+            target = self._eval(node[1], scope, depth)
+            if node[2] == 'length' and isinstance(target, (str, list)):
+                return len(target)
+            if isinstance(target, _Regex) and node[2] in ('source', 'global'):
+                return target.source if node[2] == 'source' else target.is_global
+            raise PacError(f"unsupported property .{node[2]} of a {_typeof(target)} at line {self.line}")
+        if kind == 'index':
+            target = self._eval(node[1], scope, depth)
+            key = self._eval(node[2], scope, depth)
+            if key == 'length' and isinstance(target, (str, list)):
+                return len(target)
+            if isinstance(target, (str, list)):
+                index = _number(key)
+                if index == index and index in range(len(target)):
+                    return target[int(index)]
+                return None
+            raise PacError(f"cannot index a {_typeof(target)} at line {self.line}")
+        # call
+        callee = node[1]
+        args = [self._eval(arg, scope, depth) for arg in node[2]]
+        if callee[0] == 'name':
+            found = scope.find(callee[1])
+            name = callee[1]
+            if found is not None:
+                value = found.names[name]
+                if not isinstance(value, _Function):
+                    raise _ScriptError(f"{name} is not a function")
+                name = value.name
+            return self._call(name, args, depth + 1)
+        if callee[0] == 'member':
+            if callee[1] in (('name', 'Math'), ('name', 'Date')) and scope.find(callee[1][1]) is None:
+                raise PacError(f"unsupported {callee[1][1]}.{callee[2]}() at line {self.line}")
+            target = self._eval(callee[1], scope, depth)
+            for kind_of, methods in ((str, STRING_METHODS), (list, ARRAY_METHODS), (_Regex, REGEX_METHODS)):
+                if isinstance(target, kind_of) and callee[2] in methods:
+                    return methods[callee[2]](target, *args)
+            raise PacError(f"unsupported method .{callee[2]}() of a {_typeof(target)} at line {self.line}")
+        raise PacError(f"unsupported call at line {self.line}")
+
+    @staticmethod
+    def _operator(symbol, left, right):
+        if symbol == '+':
+            if isinstance(left, (str, list)) or isinstance(right, (str, list)):
+                return _text(left) + _text(right)
+            return _number(left) + _number(right)
+        if symbol in ('==', '==='):
+            return _equal(left, right, symbol == '===')
+        if symbol in ('!=', '!=='):
+            return not _equal(left, right, symbol == '!==')
+        if symbol in ('<', '>', '<=', '>='):
+            if not (isinstance(left, str) and isinstance(right, str)):
+                left, right = _number(left), _number(right)
+            return {'<': left < right, '>': left > right, '<=': left <= right, '>=': left >= right}[symbol]
+        if symbol in ('&', '|', '^', '<<', '>>', '>>>'):
+            a, b = _int32(left), _int32(right)
+            if symbol == '>>>':
+                return (a & 0xFFFFFFFF) >> (b & 31)
+            if symbol in ('<<', '>>'):
+                return _int32(a << (b & 31)) if symbol == '<<' else a >> (b & 31)
+            return {'&': a & b, '|': a | b, '^': a ^ b}[symbol]
+        a, b = _number(left), _number(right)
+        if symbol == '-':
+            return a - b
+        if symbol == '*':
+            return a * b
+        if symbol == '/':
+            if b == 0:
+                return math.nan if a == 0 or a != a else math.copysign(math.inf, a) * math.copysign(1, b)
+            result = a / b
+            return int(result) if isinstance(a, int) and isinstance(b, int) and result.is_integer() else result
+        # %
+        if b == 0 or a != a or b != b or a in (math.inf, -math.inf):
+            return math.nan
+        result = math.fmod(a, b)
+        return int(result) if isinstance(a, int) and isinstance(b, int) else result
+
+
+def proxy_list(result):
+    """Turn a FindProxyForURL answer into proxy URLs in order, None standing for DIRECT.
+
+    "PROXY a:8080; SOCKS b:1080; DIRECT" -> ['http://a:8080', 'socks5h://b:1080', None]
+    """
+    proxies = []
+    for entry in result.split(';'):
+        parts = entry.split()
+        if not parts:
+            continue
+        kind = parts[0].upper()
+        if kind == 'DIRECT':
+            proxies.append(None)
+        elif len(parts) == 2 and kind in ('PROXY', 'HTTP'):
+            proxies.append(f'http://{parts[1]}')
+        elif len(parts) == 2 and kind == 'HTTPS':
+            proxies.append(f'https://{parts[1]}')
+        elif len(parts) == 2 and kind in ('SOCKS', 'SOCKS5', 'SOCKS4'):
+            proxies.append(f'socks5h://{parts[1]}' if kind != 'SOCKS4' else f'socks4://{parts[1]}')
+        else:
+            raise PacError(f"unrecognised proxy entry {entry.strip()!r}")
+    return proxies
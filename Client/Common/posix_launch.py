@@ -0,0 +1,51 @@
+import os
+import signal
+
+
+def spawn_detached(argv, env=None, blocked_signals=()):
+    """Start argv in its own session with stdio on /dev/null and return its PID.
+
+    Uses os.posix_spawn so the resident monitors never need to import
+    subprocess. The child inherits the caller's working directory. Signals
+    in blocked_signals start out blocked in the child and stay pending until
+    it unblocks them, so they can't hit it before its handlers are set up.
+    SIGCHLD goes back to its default: the macOS monitor ignores it to have
+    its trackers reaped, and an ignored SIGCHLD survives exec, where it
+    would make the tracker's own waitpid() fail with ECHILD.
+    """
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+        (os.POSIX_SPAWN_DUP2, 1, 2),
+    ]
+    return os.posix_spawn(argv[0], argv, os.environ if env is None else env,
+                          file_actions=file_actions, setsid=True, setsigmask=blocked_signals,
+                          setsigdef=(signal.SIGCHLD,))
+
+
+def spawn_as(argv, user, env, blocked_signals=()):
+    """spawn_detached for a monitor running as root: the child runs as user (a pwd entry).
+
+    posix_spawn can't change credentials, so this forks instead; the Linux
+    monitor is single-threaded, which keeps fork safe. The child starts in
+    the user's home directory.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        # Until exec the child still has the monitor's handlers and wakeup pipe
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.setsid()
+        null = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(null, fd)
+        os.initgroups(user.pw_name, user.pw_gid)
+        os.setgid(user.pw_gid)
+        os.setuid(user.pw_uid)
+        os.chdir(user.pw_dir)
+        signal.pthread_sigmask(signal.SIG_SETMASK, blocked_signals)
+        os.execve(argv[0], argv, env)
+    finally:
+        os._exit(127)
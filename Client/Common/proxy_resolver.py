@@ -0,0 +1,436 @@
+"""Decide which proxy the check-in goes through, once per host.
+
+requests looks proxies up again on every call (the environment, and on
+Windows the registry) and knows nothing about PAC files, so proxied
+networks paid for a lookup per attempt and then a failed direct connection.
+ProxyResolver reads every source once, evaluates the PAC file if there is
+one, and caches the answer per host until invalidate() is called after a
+network change.
+
+Every check-in is a new tracker process, so given a cache_path the PAC
+file and the routes it gave are also kept on disk (PacCache). A later
+tracker on the same network reuses them without fetching or running the
+file again, until its max-age runs out (then it is revalidated with its
+ETag) or a network change calls invalidate().
+
+Sources, the first one that configures anything wins:
+
+  1. config.json "proxy": {"url": ...} or {"pac_url": ...}, plus "bypass"
+  2. HTTP_PROXY / HTTPS_PROXY / ALL_PROXY and NO_PROXY in the environment
+  3. the system: WinINet settings in the registry on Windows,
+     scutil --proxy on macOS, GNOME's auto-config URL on Linux
+
+Within a source a PAC file beats static proxies, as it does in browsers.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from fnmatch import fnmatchcase
+from ipaddress import ip_address, ip_network
+from urllib.parse import urlsplit
+
+import pac
+
+logger = logging.getLogger('AttendanceTracker')
+
+PAC_TIMEOUT = 5
+SYSTEM_TIMEOUT = 5
+# How long a fetched PAC file is used without asking again, when its server doesn't say
+PAC_MAX_AGE = 3600
+
+
+def _with_scheme(address):
+    return address if '://' in address else f'http://{address}'
+
+
+def _bypassed(host, patterns):
+    """NO_PROXY / ProxyOverride / ExceptionsList style matching."""
+    host = host.lower().rstrip('.')
+    for pattern in patterns:
+        pattern = pattern.strip().lower()
+        if not pattern:
+            continue
+        if pattern == '*':
+            return True
+        if pattern == '<local>':
+            if '.' not in host:
+                return True
+            continue
+        if '/' in pattern:
+            try:
+                if ip_address(host) in ip_network(pattern, strict=False):
+                    return True
+            except ValueError:
+                pass
+            continue
+        if '*' in pattern or '?' in pattern:
+            if fnmatchcase(host, pattern):
+                return True
+            continue
+        domain = pattern.lstrip('.')
+        if host == domain or host.endswith('.' + domain):
+            return True
+    return False
+
+
+def environment_settings(environ=None):
+    environ = os.environ if environ is None else environ
+    proxies = {}
+    for scheme in ('http', 'https', 'all'):
+        value = environ.get(f'{scheme}_proxy') or environ.get(f'{scheme.upper()}_PROXY')
+        if value:
+            proxies[scheme] = _with_scheme(value)
+    if not proxies:
+        return None
+    no_proxy = environ.get('no_proxy') or environ.get('NO_PROXY') or ''
+    return {'pac_url': None, 'proxies': proxies, 'bypass': no_proxy.split(',')}
+
+
+def _windows_settings():
+    import winreg
+    try:
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER,
+                            r'Software\Microsoft\Windows\CurrentVersion\Internet Settings') as key:
+            def value(name, default):
+                try:
+                    return winreg.QueryValueEx(key, name)[0]
+                except OSError:
+                    return default
+            enabled = value('ProxyEnable', 0)
+            server = value('ProxyServer', '')
+            override = value('ProxyOverride', '')
+            pac_url = value('AutoConfigURL', None)
+    except OSError:
+        return None
+    proxies = {}
+    if enabled and server:
+        if '=' in server:
+            # "http=proxy:80;https=proxy:443": the https entry is still reached over plain HTTP
+            for part in server.split(';'):
+                scheme, _, address = part.partition('=')
+                if address.strip() and scheme.strip().lower() in ('http', 'https'):
+                    proxies[scheme.strip().lower()] = _with_scheme(address.strip())
+        else:
+            proxies = {'http': _with_scheme(server), 'https': _with_scheme(server)}
+    if not (proxies or pac_url):
+        return None
+    return {'pac_url': pac_url, 'proxies': proxies, 'bypass': override.split(';')}
+
+
+def _macos_settings():
+    try:
+        output = subprocess.run(['scutil', '--proxy'], capture_output=True, text=True,
+                                timeout=SYSTEM_TIMEOUT).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    values, exceptions, in_exceptions = {}, [], False
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('ExceptionsList'):
+            in_exceptions = True
+        elif in_exceptions:
+            if line == '}':
+                in_exceptions = False
+            elif ' : ' in line:
+                exceptions.append(line.split(' : ', 1)[1])
+        elif ' : ' in line:
+            key, value = line.split(' : ', 1)
+            values[key] = value
+    proxies = {}
+    for scheme, prefix in (('http', 'HTTP'), ('https', 'HTTPS')):
+        if values.get(f'{prefix}Enable') == '1' and values.get(f'{prefix}Proxy'):
+            proxies[scheme] = f"http://{values[f'{prefix}Proxy']}:{values.get(f'{prefix}Port', '80')}"
+    pac_url = values.get('ProxyAutoConfigURLString') if values.get('ProxyAutoConfigEnable') == '1' else None
+    if not (proxies or pac_url):
+        return None
+    if values.get('ExcludeSimpleHostnames') == '1':
+        exceptions.append('<local>')
+    return {'pac_url': pac_url, 'proxies': proxies, 'bypass': exceptions}
+
+
+def _gnome_settings():
+    # Manual GNOME proxies are exported to the environment by the session; only auto needs reading
+    gsettings = shutil.which('gsettings')
+    if not gsettings:
+        return None
+    try:
+        def get(key):
+            result = subprocess.run([gsettings, 'get', 'org.gnome.system.proxy', key], capture_output=True,
+                                    text=True, timeout=SYSTEM_TIMEOUT)
+            return result.stdout.strip().strip("'")
+        if get('mode') != 'auto':
+            return None
+        pac_url = get('autoconfig-url')
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return {'pac_url': pac_url, 'proxies': {}, 'bypass': []} if pac_url else None
+
+
+def system_settings():
+    if sys.platform == 'win32':
+        return _windows_settings()
+    if sys.platform == 'darwin':
+        return _macos_settings()
+    return _gnome_settings()
+
+
+def _max_age(headers):
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'max-age\s*=\s*(\d+)', cache_control)
+    return int(match.group(1)) if match else PAC_MAX_AGE
+
+
+def fetch_pac(pac_url, cached=None):
+    """The text of a PAC file from an http(s)/file URL or a plain path, and how long it may be reused.
+
+    cached is an earlier PacCache entry for pac_url; its ETag makes the
+    request conditional, and a 304 answer gives its body back.
+    """
+    if '://' not in pac_url:
+        with open(pac_url, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read(), None, 0
+    # The PAC file itself is always fetched directly, never through a proxy
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    request = urllib.request.Request(pac_url)
+    if cached and cached.get('etag'):
+        request.add_header('If-None-Match', cached['etag'])
+    try:
+        with opener.open(request, timeout=PAC_TIMEOUT) as response:
+            body = response.read().decode('utf-8', errors='replace')
+            return body, response.headers.get('ETag'), _max_age(response.headers)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            return cached['body'], cached.get('etag'), _max_age(e.headers)
+        raise
+
+
+def load_pac(pac_url):
+    """Fetch and parse a PAC file from an http(s)/file URL or a plain path."""
+    return pac.PacScript(fetch_pac(pac_url)[0])
+
+
+def network_id():
+    """The address this machine would reach the internet from; changes with the network.
+
+    Connecting a UDP socket sends nothing, it only asks the kernel for a route.
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(('192.0.2.1', 9))  # TEST-NET-1, never actually reached
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+class PacCache:
+    """PAC files and the routes they gave, in a JSON file shared by successive trackers.
+
+    Entries are keyed by PAC URL and hold the text, its ETag, when it needs
+    asking again and the network it was fetched on, with the routes per
+    "scheme host". An entry from another network is not used. Routes that
+    came from weekdayRange, dateRange or timeRange are never stored.
+    """
+
+    def __init__(self, path, network=network_id):
+        self.path = path
+        self.network = network()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def get(self, pac_url):
+        entry = self._load().get(pac_url)
+        return entry if entry and entry.get('network') == self.network else None
+
+    def put(self, pac_url, entry):
+        self._load()[pac_url] = dict(entry, network=self.network)
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            logger.warning(f"Could not save the proxy cache {self.path}: {e}")
+
+    def clear(self):
+        self.entries = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove the proxy cache {self.path}: {e}")
+
+
+class ProxyResolver:
+    """Per-host proxy answers from config.json, the environment and the system.
+
+    candidates(url) returns the proxies to try in order, each as a requests
+    `proxies` dict ({} means connect directly). Settings and the PAC file are
+    loaded on first use and cached with the answers until invalidate().
+    With a cache_path the PAC file and its answers outlive the process; the
+    file is only parsed once a host comes up that the cache has no answer for.
+    """
+
+    def __init__(self, proxy_config=None, environment=environment_settings, system=system_settings,
+                 cache_path=None):
+        self.proxy_config = proxy_config or {}
+        self.sources = [('config.json', self._config_settings), ('environment', environment), ('system', system)]
+        self.disk = PacCache(cache_path) if cache_path else None
+        self.settings = None
+        self.pac = None
+        self.script = None
+        self.pac_error = None
+        self.cache = {}
+
+    def _config_settings(self):
+        config = self.proxy_config
+        if not (config.get('url') or config.get('pac_url') or config.get('bypass')):
+            return None
+        proxies = {'http': config['url'], 'https': config['url']} if config.get('url') else {}
+        return {'pac_url': config.get('pac_url'), 'proxies': proxies, 'bypass': config.get('bypass') or []}
+
+    def _load(self):
+        self.settings = {'pac_url': None, 'proxies': {}, 'bypass': []}
+        for name, source in self.sources:
+            try:
+                settings = source()
+            except Exception as e:
+                logger.warning(f"Could not read {name} proxy settings: {e}")
+                continue
+            if settings:
+                self.settings = settings
+                logger.info(f"Using {name} proxy settings: proxies={settings['proxies']}, "
+                            f"pac_url={settings['pac_url']}")
+                break
+        self.pac = None
+        self.script = None
+        self.pac_error = None
+        if self.settings['pac_url']:
+            try:
+                self.pac = self._fetch_pac(self.settings['pac_url'])
+            except (OSError, ValueError) as e:
+                self.pac_error = f"{self.settings['pac_url']}: {e}"
+                logger.warning(f"Ignoring PAC file {self.pac_error}")
+
+    def _fetch_pac(self, pac_url):
+        """The PacCache entry for pac_url, fetched again only if it has run out."""
+        cached = self.disk.get(pac_url) if self.disk else None
+        if cached and cached['expires'] > time.time():
+            logger.info(f"Using PAC file {pac_url} as cached, with {len(cached['routes'])} route(s)")
+            return cached
+        body, etag, max_age = fetch_pac(pac_url, cached)
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        # Answers from the same text still hold; a changed file starts over
+        routes = cached['routes'] if cached and cached['sha256'] == digest else {}
+        entry = {'body': body, 'etag': etag, 'sha256': digest, 'expires': time.time() + max_age, 'routes': routes}
+        if self.disk and max_age:
+            self.disk.put(pac_url, entry)
+        return entry
+
+    def _pac_script(self):
+        if self.script is None and self.pac_error is None:
+            try:
+                self.script = pac.PacScript(self.pac['body'])
+            except ValueError as e:
+                self.pac_error = f"{self.settings['pac_url']}: {e}"
+                logger.warning(f"Ignoring PAC file {self.pac_error}")
+        return self.script
+
+    def invalidate(self):
+        """Forget settings, the PAC file and cached answers, on disk too; the next lookup reloads them."""
+        self.settings = None
+        self.pac = None
+        self.script = None
+        self.pac_error = None
+        self.cache.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def candidates(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname)
+        if key not in self.cache:
+            if self.settings is None:
+                self._load()
+            self.cache[key], failure = self._resolve(url, parts)
+            routes = ', '.join(p.get(parts.scheme, '') or 'DIRECT' for p in self.cache[key])
+            if failure:
+                # Not a resolution: the PAC file was meant to decide and could not
+                logger.warning(f"Proxy route for {parts.hostname} is a fallback to {routes}, "
+                               f"the PAC file could not be used: {failure}")
+            else:
+                logger.info(f"Proxy route for {parts.hostname}: {routes}")
+        return self.cache[key]
+
+    def _resolve(self, url, parts):
+        """(routes, why the PAC file was not used or None)."""
+        host = parts.hostname or ''
+        if _bypassed(host, self.settings['bypass']):
+            return [{}], None
+        failure = self.pac_error
+        if self.pac:
+            key = f"{parts.scheme} {host}"
+            if key in self.pac['routes']:
+                return self.pac['routes'][key], None
+            script = self._pac_script()
+            if script:
+                try:
+                    proxies = pac.proxy_list(script.find_proxy(url, host))
+                    routes = [{'http': p, 'https': p} if p else {} for p in proxies] or [{}]
+                    if not script.time_dependent and self.disk and self.pac['expires'] > time.time():
+                        self.pac['routes'][key] = routes
+                        self.disk.put(self.settings['pac_url'], self.pac)
+                    return routes, None
+                except pac.PacError as e:
+                    failure = str(e)
+        proxy = self.settings['proxies'].get(parts.scheme) or self.settings['proxies'].get('all')
+        return [{'http': proxy, 'https': proxy}] if proxy else [{}], failure
+
+
+def session():
+    """A requests session that takes its proxies only from a ProxyResolver."""
+    import requests
+    s = requests.Session()
+    # trust_env would re-read the environment and registry proxies on every request
+    s.trust_env = False
+    s.verify = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE') or True
+    return s
+
+
+def _request(method, http, candidates, url, **kwargs):
+    import requests
+    for i, proxies in enumerate(candidates):
+        try:
+            return http.request(method, url, proxies=proxies, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.InvalidSchema) as e:
+            if i == len(candidates) - 1:
+                raise
+            logger.warning(f"Route via {proxies.get('http') or 'DIRECT'} failed, trying the next one: {e}")
+
+
+def post(http, candidates, url, **kwargs):
+    """POST url over each of a resolver's candidate routes in turn until one of them connects."""
+    return _request('POST', http, candidates, url, **kwargs)
+
+
+def get(http, candidates, url, **kwargs):
+    """GET url the same way as post()."""
+    return _request('GET', http, candidates, url, **kwargs)
@@ -0,0 +1,64 @@
+import sys
+
+
+class Session:
+    """What a machine-wide monitor remembers about one login session."""
+
+    __slots__ = ('user', 'uid', 'locked', 'app_support')
+
+    def __init__(self, user, uid=None, locked=False, app_support=None):
+        self.user = user
+        self.uid = uid
+        self.locked = locked
+        self.app_support = app_support
+
+
+class SessionTable:
+    """Login sessions a machine-wide monitor is tracking, keyed by the OS session id.
+
+    Each entry is a handful of slots and user names are interned, so a
+    terminal server with hundreds of sessions costs little more than a
+    workstation with one. The core only asks which users are active; the
+    platform backend keeps the table current from its session notifications.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+
+    def add(self, session_id, user, uid=None, locked=False, app_support=None):
+        session = Session(sys.intern(user), uid, locked, app_support)
+        self.sessions[session_id] = session
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def remove(self, session_id):
+        return self.sessions.pop(session_id, None)
+
+    def set_locked(self, session_id, locked):
+        session = self.sessions.get(session_id)
+        if session:
+            session.locked = locked
+        return session
+
+    def find(self, user):
+        """One of user's sessions as (session_id, Session), preferring an unlocked one."""
+        found = (None, None)
+        for session_id, session in self.sessions.items():
+            if session.user == user:
+                if not session.locked:
+                    return session_id, session
+                if found[0] is None:
+                    found = (session_id, session)
+        return found
+
+    def active_users(self):
+        """Users with at least one unlocked session, each once, in a stable order."""
+        return sorted({session.user for session in self.sessions.values() if not session.locked})
+
+    def summary(self):
+        users = {}
+        for session in self.sessions.values():
+            users[session.user] = users.get(session.user, 0) + 1
+        return {'sessions': len(self.sessions), 'users': users}
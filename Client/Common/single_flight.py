@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+
+logger = logging.getLogger('AttendanceTracker')
+
+# Outcomes of a check-in, shared with every trigger that attached to it
+ACCEPTED = 'accepted'
+ALREADY = 'already'
+FAILED = 'failed'
+
+
+class SingleFlight:
+    """Runs at most one check-in at a time across every process of the install.
+
+    The first caller takes the flight lock (flock on POSIX, a named mutex on
+    Windows) and runs the check-in. Anyone arriving while it is in flight
+    blocks on the same lock instead of starting a second one; the lock's
+    release is their notification, and the result file tells them the
+    outcome they share. The OS drops the lock if the holder dies, so a
+    crashed check-in never leaves the others stuck.
+    """
+
+    def __init__(self, directory, name='checkin'):
+        self.lock_path = os.path.join(directory, f'{name}.flight')
+        self.result_path = os.path.join(directory, f'{name}.result')
+        # Global so a machine-wide monitor sees it from another session; keyed by directory so users don't share it
+        key = zlib.crc32(os.path.normcase(os.path.abspath(directory)).encode('utf-8'))
+        self.mutex_name = f'Global\\AttendanceTracker-{name}-flight-{key:08x}'
+
+    def run(self, operation):
+        """Run operation() unless one is in flight; return (outcome, shared)."""
+        arrived = time.time()
+        handle = self._acquire(blocking=False)
+        if handle is None:
+            logger.info("A check-in is already in flight, waiting for its outcome")
+            handle = self._acquire(blocking=True)
+            result = self.last_result()
+            if result and result.get('finished', 0) >= arrived:
+                self._release(handle)
+                logger.info(f"Sharing outcome of the in-flight check-in: {result['outcome']}")
+                return result['outcome'], True
+        outcome = FAILED
+        try:
+            outcome = operation()
+        finally:
+            self._write_result(outcome)
+            self._release(handle)
+        return outcome, False
+
+    def run_if_idle(self, operation):
+        """Run operation() only if nothing is in flight; return whether it ran."""
+        handle = self._acquire(blocking=False)
+        if handle is None:
+            return False
+        try:
+            operation()
+        finally:
+            self._release(handle)
+        return True
+
+    def in_flight(self):
+        """True while some process holds the flight lock."""
+        handle = self._acquire(blocking=False)
+        if handle is None:
+            return True
+        self._release(handle)
+        return False
+
+    def last_result(self):
+        try:
+            with open(self.result_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, outcome):
+        tmp_path = self.result_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'outcome': outcome, 'finished': time.time(), 'pid': os.getpid()}, f)
+            os.replace(tmp_path, self.result_path)
+        except OSError as e:
+            logger.error(f"Failed to record check-in outcome: {e}")
+
+    if sys.platform == 'win32':
+        def _acquire(self, blocking):
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.CreateMutexW.restype = wintypes.HANDLE
+            handle = kernel32.CreateMutexW(None, False, self.mutex_name)
+            # WAIT_OBJECT_0, or WAIT_ABANDONED when the previous holder died
+            if kernel32.WaitForSingleObject(wintypes.HANDLE(handle), 0xFFFFFFFF if blocking else 0) in (0, 0x80):
+                return handle
+            kernel32.CloseHandle(wintypes.HANDLE(handle))
+            return None
+
+        def _release(self, handle):
+            import ctypes
+            from ctypes import wintypes
+            ctypes.windll.kernel32.ReleaseMutex(wintypes.HANDLE(handle))
+            ctypes.windll.kernel32.CloseHandle(wintypes.HANDLE(handle))
+    else:
+        def _acquire(self, blocking):
+            import fcntl
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+                return None
+
+        def _release(self, fd):
+            # Closing the descriptor drops the flock
+            os.close(fd)
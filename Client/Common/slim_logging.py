@@ -0,0 +1,43 @@
+import logging
+import os
+
+
+class SizeRotatingFileHandler(logging.FileHandler):
+    """Size-capped log file handler for the resident monitors.
+
+    Behaves like logging.handlers.RotatingFileHandler without importing
+    logging.handlers (and with it pickle, queue, heapq and copy, none of
+    which the monitors otherwise use) into a process that stays resident
+    all day. With backup_count=0 the file is truncated once it reaches
+    max_bytes instead of growing without bound.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, encoding=None):
+        super().__init__(filename, mode='a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def emit(self, record):
+        try:
+            if self.max_bytes > 0 and self.stream is not None:
+                self.stream.seek(0, 2)
+                if self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes:
+                    self.do_rollover()
+        except Exception:
+            self.handleError(record)
+            return
+        super().emit(record)
+
+    def do_rollover(self):
+        self.stream.close()
+        self.stream = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.baseFilename}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.baseFilename}.{i + 1}")
+            os.replace(self.baseFilename, self.baseFilename + '.1')
+            self.stream = self._open()
+        else:
+            self.stream = open(self.baseFilename, 'w', encoding=self.encoding)
+
@@ -0,0 +1,256 @@
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger('AttendanceTracker')
+
+# Why a wait ended
+TIMEOUT = 'timeout'
+RESUME = 'resume'
+NETWORK = 'network'
+
+# POSIX monitors nudge the tracker with these; Windows uses the named events below
+RESUME_SIGNAL = getattr(signal, 'SIGUSR1', None)
+SUSPEND_SIGNAL = getattr(signal, 'SIGUSR2', None)
+TRACKER_SIGNALS = tuple(s for s in (RESUME_SIGNAL, SUSPEND_SIGNAL) if s is not None)
+RESUME_EVENT_NAME = 'Local\\AttendanceTrackerResume'
+SUSPEND_EVENT_NAME = 'Local\\AttendanceTrackerSuspend'
+
+# Upper bound on a single blocking call, so a missed nudge costs at most this much
+MAX_SLICE = 30.0
+# Let addresses settle after a change before retrying
+NETWORK_SETTLE = 1.0
+
+# rtnetlink (Linux) and routing socket (macOS) message types for address changes
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR_LINUX = 20
+RTM_NEWADDR_BSD = 0xc
+RTM_IFINFO_BSD = 0xe
+
+
+def _clock():
+    # CLOCK_BOOTTIME keeps counting while suspended, so deadlines expire across a sleep
+    if hasattr(time, 'CLOCK_BOOTTIME'):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    return time.monotonic()
+
+
+deadline_clock = _clock
+
+
+class Waiter:
+    """Deadline-based sleeps that a resume or network change cuts short.
+
+    wait(seconds) returns TIMEOUT when the deadline passes, RESUME when the
+    monitor reports the machine woke up, or NETWORK when an interface gains
+    an address. When the monitor reports an imminent suspend, on_suspend is
+    called straight away, even in the middle of a request (from the signal
+    handler on POSIX, from a watcher thread on Windows), so the caller can
+    checkpoint within the OS suspend deadline; the wait itself carries on
+    until resume.
+    """
+
+    def __init__(self, on_suspend=None, watch_network=True):
+        self.on_suspend = on_suspend
+        self.net_sock = None
+        if sys.platform == 'win32':
+            self._init_win32(watch_network)
+        else:
+            self._init_posix(watch_network)
+
+    def wait(self, seconds):
+        return self.wait_until(deadline_clock() + max(0.0, seconds))
+
+    def wait_until(self, deadline):
+        if sys.platform == 'win32':
+            return self._wait_win32(deadline)
+        return self._wait_posix(deadline)
+
+    def _suspend(self):
+        logger.info("Suspend notification received, checkpointing")
+        if self.on_suspend:
+            try:
+                self.on_suspend()
+            except Exception as e:
+                logger.error(f"Suspend checkpoint failed: {e}")
+
+    # POSIX: a signal wakeup pipe plus an address-change socket, both fed to select()
+
+    def _init_posix(self, watch_network):
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        signal.set_wakeup_fd(self.wakeup_w)
+        signal.signal(RESUME_SIGNAL, lambda s, f: None)
+        signal.signal(SUSPEND_SIGNAL, lambda s, f: self._suspend())
+        # The monitor spawns us with these blocked so an early nudge can't kill us; take them now
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, TRACKER_SIGNALS)
+        if watch_network:
+            try:
+                if sys.platform.startswith('linux'):
+                    self.net_sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                    self.net_sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+                else:
+                    self.net_sock = socket.socket(getattr(socket, 'AF_ROUTE', 17), socket.SOCK_RAW, 0)
+                self.net_sock.setblocking(False)
+            except OSError as e:
+                logger.warning(f"Network change notifications unavailable: {e}")
+                self.net_sock = None
+
+    def _address_changed(self):
+        changed = False
+        while True:
+            try:
+                data = self.net_sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return changed
+            if sys.platform.startswith('linux'):
+                offset = 0
+                while offset + 16 <= len(data):
+                    length, msg_type = struct.unpack_from('=IH', data, offset)
+                    changed = changed or msg_type == RTM_NEWADDR_LINUX
+                    offset += max(16, (length + 3) & ~3)
+            elif len(data) >= 4:
+                changed = changed or data[3] in (RTM_NEWADDR_BSD, RTM_IFINFO_BSD)
+
+    def _wait_posix(self, deadline):
+        fds = [self.wakeup_r] + ([self.net_sock] if self.net_sock else [])
+        while True:
+            remaining = deadline - deadline_clock()
+            if remaining <= 0:
+                return TIMEOUT
+            ready, _, _ = select.select(fds, [], [], min(remaining, MAX_SLICE))
+            if self.wakeup_r in ready:
+                try:
+                    signums = os.read(self.wakeup_r, 64)
+                except BlockingIOError:
+                    signums = b''
+                if RESUME_SIGNAL in signums:
+                    return RESUME
+            if self.net_sock in ready and self._address_changed():
+                time.sleep(min(NETWORK_SETTLE, max(0.0, deadline - deadline_clock())))
+                self._address_changed()
+                return NETWORK
+
+    # Windows: named events the monitor sets, plus NotifyAddrChange's overlapped event
+
+    def _init_win32(self, watch_network):
+        import ctypes
+        from ctypes import wintypes
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.CreateEventW.restype = wintypes.HANDLE
+        self.resume_event = self.kernel32.CreateEventW(None, False, False, RESUME_EVENT_NAME)
+        self.suspend_event = self.kernel32.CreateEventW(None, False, False, SUSPEND_EVENT_NAME)
+        # A nudge meant for an earlier tracker must not end our first wait
+        self.kernel32.ResetEvent(wintypes.HANDLE(self.resume_event))
+        self.kernel32.ResetEvent(wintypes.HANDLE(self.suspend_event))
+        # The suspend event is the watcher's alone, so a nudge is heard while a request is in flight
+        self.stop_event = self.kernel32.CreateEventW(None, True, False, None)
+        self.suspend_watch = threading.Thread(target=self._watch_suspend, name='suspend-watch', daemon=True)
+        self.suspend_watch.start()
+        self.addr_event = None
+        if watch_network:
+            self.addr_event = self.kernel32.CreateEventW(None, False, False, None)
+            self.overlapped = _overlapped(self.addr_event)
+            self._arm_addr_change()
+
+    def _arm_addr_change(self):
+        import ctypes
+        from ctypes import wintypes
+        handle = wintypes.HANDLE()
+        result = ctypes.windll.iphlpapi.NotifyAddrChange(ctypes.byref(handle), ctypes.byref(self.overlapped))
+        if result not in (0, 997):  # NO_ERROR, ERROR_IO_PENDING
+            logger.warning(f"Network change notifications unavailable: error {result}")
+            self.addr_event = None
+
+    def _watch_suspend(self):
+        from ctypes import wintypes
+        handles = (wintypes.HANDLE * 2)(self.suspend_event, self.stop_event)
+        while self.kernel32.WaitForMultipleObjects(2, handles, False, 0xFFFFFFFF) == 0:  # INFINITE
+            self._suspend()
+
+    def _wait_win32(self, deadline):
+        from ctypes import wintypes
+        handles = [self.resume_event] + ([self.addr_event] if self.addr_event else [])
+        array = (wintypes.HANDLE * len(handles))(*handles)
+        while True:
+            remaining = deadline - deadline_clock()
+            if remaining <= 0:
+                return TIMEOUT
+            result = self.kernel32.WaitForMultipleObjects(len(handles), array, False,
+                                                          int(min(remaining, MAX_SLICE) * 1000))
+            if result == 0:
+                return RESUME
+            if result == 1:
+                self._arm_addr_change()
+                time.sleep(min(NETWORK_SETTLE, max(0.0, deadline - deadline_clock())))
+                return NETWORK
+
+    def close(self):
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            if self.addr_event:
+                ctypes.windll.iphlpapi.CancelIPChangeNotify(ctypes.byref(self.overlapped))
+            self.kernel32.SetEvent(wintypes.HANDLE(self.stop_event))
+            self.suspend_watch.join(1)
+            for handle in (self.resume_event, self.suspend_event, self.stop_event, self.addr_event):
+                if handle:
+                    self.kernel32.CloseHandle(wintypes.HANDLE(handle))
+            return
+        signal.set_wakeup_fd(-1)
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+        if self.net_sock:
+            self.net_sock.close()
+
+
+def _overlapped(event):
+    import ctypes
+    from ctypes import wintypes
+
+    class OVERLAPPED(ctypes.Structure):
+        _fields_ = [
+            ('Internal', ctypes.c_size_t),
+            ('InternalHigh', ctypes.c_size_t),
+            ('Offset', wintypes.DWORD),
+            ('OffsetHigh', wintypes.DWORD),
+            ('hEvent', wintypes.HANDLE),
+        ]
+
+    return OVERLAPPED(hEvent=event)
+
+
+def nudge_tracker(suspend, pids=(), sessions=()):
+    """Tell a running tracker the machine is suspending (suspend=True) or has resumed.
+
+    On POSIX the given tracker PIDs are signalled; on Windows the named
+    events are set if a tracker has created them, in this session or, for
+    a machine-wide monitor, in each of the given session ids.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.OpenEventW.restype = wintypes.HANDLE
+        name = SUSPEND_EVENT_NAME if suspend else RESUME_EVENT_NAME
+        names = [name.replace('Local\\', f'Session\\{session_id}\\', 1) for session_id in sessions] or [name]
+        for name in names:
+            handle = kernel32.OpenEventW(0x0002, False, name)  # EVENT_MODIFY_STATE
+            if handle:
+                kernel32.SetEvent(wintypes.HANDLE(handle))
+                kernel32.CloseHandle(wintypes.HANDLE(handle))
+        return
+    signum = SUSPEND_SIGNAL if suspend else RESUME_SIGNAL
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
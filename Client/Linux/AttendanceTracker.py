@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+import datetime
+import sys
+import os
+
+print(f"[{datetime.datetime.now()}] AttendanceTracker starting with PID: {os.getpid()} (before imports)",
+      file=sys.stderr)
+
+import socket
+import getpass
+import logging
+from logging.handlers import RotatingFileHandler
+import traceback
+import atexit
+
+# Shared platform-neutral modules live in Client/Common (bundled via the spec's pathex)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import async_checkin
+import checkin_lease
+import client_config
+import control_endpoint
+import delta_update
+import log_shipper
+import proxy_resolver
+import single_flight
+import waits
+
+# Setup paths
+APP_SUPPORT = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'AttendanceTracker')
+LOG_DIR = os.path.join(APP_SUPPORT, 'Logs')
+os.makedirs(LOG_DIR, exist_ok=True)
+ATT_LOCK_FILE = os.path.join(APP_SUPPORT, 'attendance_tracker.lock')
+LEASE_FILE = os.path.join(LOG_DIR, 'lease.json')
+# PAC file and the routes it gave, reused by the next tracker on the same network
+PROXY_CACHE_FILE = os.path.join(LOG_DIR, 'proxy_cache.json')
+# A machine-wide monitor runs the shared binary for each user, so config.json may only live beside it
+INSTALL_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+# Check-ins name the user so several people sharing one machine are told apart
+USER = getpass.getuser()
+
+# Log file for AttendanceTracker
+log_file = os.path.join(LOG_DIR, 'outputat.log')
+
+# Configure logging
+logger = logging.getLogger('AttendanceTracker')
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers
+for handler in logger.handlers[:]:
+    logger.removeHandler(handler)
+
+# Read logging config
+config_file = os.path.join(APP_SUPPORT, 'logging.conf')
+try:
+    log_level, max_bytes = client_config.load_logging_conf(config_file)
+except (client_config.ConfigError, OSError) as e:
+    print(f"[{datetime.datetime.now()}] Failed to parse logging.conf: {e}", file=sys.stderr)
+    if os.path.exists(ATT_LOCK_FILE):
+        try:
+            os.remove(ATT_LOCK_FILE)
+        except OSError as e:
+            print(f"[{datetime.datetime.now()}] Failed to remove lock file: {e}", file=sys.stderr)
+    sys.exit(1)
+
+# Set log level
+logger.setLevel(getattr(logging, log_level, logging.INFO))
+
+# Add rotating file handler
+try:
+    handler = RotatingFileHandler(log_file, mode='a', maxBytes=max_bytes, backupCount=1)
+    handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    logger.addHandler(handler)
+except Exception as e:
+    print(f"[{datetime.datetime.now()}] Failed to set up file logging: {e}", file=sys.stderr)
+
+# Add stderr handler as fallback
+stderr_handler = logging.StreamHandler(sys.stderr)
+stderr_handler.setLevel(logging.INFO)
+stderr_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+logger.addHandler(stderr_handler)
+
+# Optional console handler for debugging
+if os.environ.get('DEBUG'):
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    logger.addHandler(console_handler)
+
+logger.info("AttendanceTracker logging initialized at process start")
+
+
+# Create lock file with PID
+def create_lock_file():
+    try:
+        with open(ATT_LOCK_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+            f.flush()
+            os.fsync(f.fileno())  # Ensure the write is flushed to disk
+        logger.info(f"Created lock file {ATT_LOCK_FILE} with PID: {os.getpid()}")
+    except Exception as e:
+        logger.error(f"Failed to create lock file {ATT_LOCK_FILE}: {str(e)}")
+        sys.exit(1)
+
+
+# Ensure lock file is removed on exit
+def cleanup_lock():
+    if os.path.exists(ATT_LOCK_FILE):
+        logger.info("Cleaning up attendance_tracker.lock on exit")
+        try:
+            os.remove(ATT_LOCK_FILE)
+        except OSError as e:
+            logger.error(f"Failed to remove lock file on exit: {e}")
+
+
+atexit.register(cleanup_lock)
+
+
+def checkpoint():
+    # The monitor says we're about to sleep; only quick, local work fits in the suspend deadline
+    for h in logger.handlers:
+        h.flush()
+    # A request in flight would only time out across the sleep; drop it and send it again after resume
+    async_checkin.cancel_running()
+
+
+# Suspend-aware waits; the monitor keeps its nudges blocked for us until this takes them over
+waiter = waits.Waiter(on_suspend=checkpoint)
+
+# Create lock file immediately after logging setup
+create_lock_file()
+
+
+def get_config():
+    config_path = client_config.find_config([os.path.join(LOG_DIR, 'config.json'),
+                                             os.path.join(APP_SUPPORT, 'config.json'),
+                                             os.path.join(INSTALL_DIR, 'config.json')])
+    logger.info(f"Attempting to load config from: {config_path}")
+    try:
+        return client_config.load_config(config_path)
+    except client_config.ConfigError as e:
+        # Refuse to start rather than fail half-way through a check-in on a missing key
+        logger.error(f"Invalid configuration, not checking in: {e}")
+        sys.exit(1)
+
+
+def get_hostname():
+    hostname = socket.gethostname()
+    return hostname.split('.')[0]
+
+
+def try_connect_with_retry(config, max_attempts=None, delay_seconds=None):
+    url = config['server']['url'] + '/checkin'
+    hostname = get_hostname()
+
+    logger.info(f"Starting connection attempts with hostname: {hostname}")
+    logger.info(f"Server URL: {url}")
+    logger.info(f"Max attempts: {max_attempts}, Delay: {delay_seconds} seconds")
+
+    max_attempts = max_attempts or config['server']['max_retry_attempts']
+    delay_seconds = delay_seconds or config['server']['retry_delay_seconds']
+    version = config['version']
+    lease = checkin_lease.load_lease(LEASE_FILE)
+    headers = checkin_lease.conditional_headers(lease)
+    # Proxy settings and the PAC answer are looked up once, not on every attempt
+    engine = async_checkin.CheckinEngine(proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE))
+    for attempt in range(max_attempts):
+        try:
+            client_time = datetime.datetime.now()
+            logger.info(f"Attempt {attempt + 1}/{max_attempts}: Sending request...")
+            logger.info(f"Request data: hostname={hostname}, user={USER}, time={client_time.isoformat()}")
+            # Name lookups, route probing and the request itself share the one timeout
+            response = async_checkin.run(engine.attempt(url, {
+                "hostname": hostname,
+                "client_time": client_time.isoformat(),
+                "version": version,
+                "user": USER
+            }, headers=headers, timeout=config['server']['timeout_seconds']))
+
+            if response.status_code == 200:
+                logger.info(f"Success: Server accepted check-in at {datetime.datetime.now()}")
+                save_success_date()
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                logger.handlers[0].flush()
+                return single_flight.ACCEPTED
+            elif response.status_code == 208:
+                logger.info(f"Server telling me that already checked in today at {datetime.datetime.now()}")
+                save_success_date()
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                logger.handlers[0].flush()
+                return single_flight.ALREADY
+            elif response.status_code == 304:
+                logger.info(f"Server confirmed my check-in is still current at {datetime.datetime.now()}")
+                save_success_date()
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                logger.handlers[0].flush()
+                return single_flight.ALREADY
+            else:
+                logger.error(f"Unexpected response: {response.status_code}")
+
+        except async_checkin.Cancelled:
+            logger.info(f"Attempt {attempt + 1}/{max_attempts} cancelled for suspend")
+        except async_checkin.CheckinError as e:
+            logger.error(f"Connection failed on attempt {attempt + 1}/{max_attempts}: {str(e)}")
+        except Exception as e:
+            logger.error(
+                f"Unexpected error on attempt {attempt + 1}/{max_attempts}: {str(e)} with traceback: {traceback.format_exc()}")
+
+        if attempt < max_attempts - 1:
+            logger.info(f"Waiting {delay_seconds} seconds before next attempt...")
+            reason = waiter.wait(delay_seconds)
+            if reason != waits.TIMEOUT:
+                logger.info(f"Retrying now after {reason} notification")
+            if reason == waits.NETWORK:
+                engine.resolver.invalidate()
+
+    logger.error(f"Failed to connect after {max_attempts} attempts")
+    return single_flight.FAILED
+
+
+def get_last_success_date():
+    date_file = os.path.join(LOG_DIR, 'last_success.txt')
+    try:
+        if os.path.exists(date_file):
+            with open(date_file, 'r') as f:
+                return f.read().strip()
+    except Exception as e:
+        logger.error(f"Error reading last success date: {str(e)} with traceback: {traceback.format_exc()}")
+    return None
+
+
+def save_success_date():
+    date_file = os.path.join(LOG_DIR, 'last_success.txt')
+    try:
+        os.makedirs(os.path.dirname(date_file), exist_ok=True)
+        with open(date_file, 'w') as f:
+            f.write(datetime.datetime.now().strftime('%Y-%m-%d'))
+    except Exception as e:
+        logger.error(f"Error saving success date: {str(e)} with traceback: {traceback.format_exc()}")
+
+
+def report_to_monitor(outcome=None):
+    # Tell the monitor we've started (no outcome) or finished, so it never has to poll for us
+    try:
+        control_endpoint.request(control_endpoint.default_address(APP_SUPPORT),
+                                 {'cmd': 'report', 'pid': os.getpid(), 'user': USER, 'outcome': outcome}, timeout=1)
+    except (OSError, ValueError) as e:
+        logger.info(f"Could not report to the power monitor: {e}")
+
+
+def check_in(config):
+    report_to_monitor()
+    logger.info("Config loaded, checking last success date")
+    waiter.wait(config['application']['startup_delay_seconds'])
+
+    lease = checkin_lease.load_lease(LEASE_FILE)
+    if checkin_lease.lease_active(lease):
+        logger.info(f"Check-in lease valid until {datetime.datetime.fromtimestamp(lease['valid_until'])}, "
+                    f"not contacting the server")
+        return single_flight.ALREADY
+
+    # Servers that grant leases decide when the next check-in is due; otherwise it's once per day
+    last_date = get_last_success_date()
+    today = datetime.datetime.now().strftime('%Y-%m-%d')
+    if last_date == today and (lease is None or lease.get('valid_until') is None):
+        logger.info(f"I found that I already checked in today at {datetime.datetime.now()}")
+        return single_flight.ALREADY
+
+    return try_connect_with_retry(config)
+
+
+def ship_logs(config):
+    # Optional: send what's new in our logs to the collector, within the configured budget
+    url = config['logs']['collector_url']
+    if not url:
+        return
+    resolver = proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE)
+    http = proxy_resolver.session()
+    try:
+        log_shipper.ship_logs(
+            config['logs'], [log_file, os.path.join(LOG_DIR, 'outputpw.log')], APP_SUPPORT,
+            lambda data, headers: proxy_resolver.post(http, resolver.candidates(url), url, data=data,
+                                                      headers=headers, timeout=config['server']['timeout_seconds']),
+            source={'host': get_hostname(), 'user': USER})
+    except Exception as e:
+        logger.error(f"Log shipping failed: {str(e)} with traceback: {traceback.format_exc()}")
+
+
+def check_for_update(config):
+    # Optional: stage a newer release for the monitor to swap in once nothing is running
+    url = config['update']['manifest_url']
+    if not url or not delta_update.runs_from(APP_SUPPORT):
+        return
+    resolver = proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE)
+    http = proxy_resolver.session()
+
+    def fetch(address):
+        response = proxy_resolver.get(http, resolver.candidates(address), address,
+                                      timeout=config['server']['timeout_seconds'])
+        response.raise_for_status()
+        return response.content
+    try:
+        staged = delta_update.check_for_update(config['update'], APP_SUPPORT, fetch)
+    except Exception as e:
+        logger.error(f"Update check failed: {str(e)} with traceback: {traceback.format_exc()}")
+        return
+    if staged:
+        try:
+            control_endpoint.request(control_endpoint.default_address(APP_SUPPORT), {'cmd': 'update'}, timeout=1)
+        except (OSError, ValueError) as e:
+            logger.info(f"Could not tell the power monitor about the update, it applies it when it next starts: {e}")
+
+
+def main():
+    logger.info(f"AttendanceTracker starting up in main with PID: {os.getpid()}")
+    logger.info(f"Current working directory: {os.getcwd()}")
+    logger.info(f"Log file path: {log_file}")
+    try:
+        config = get_config()
+        # Only one check-in runs at a time; if one is in flight we wait for it and take its outcome
+        outcome, shared = single_flight.SingleFlight(APP_SUPPORT).run(lambda: check_in(config))
+        logger.info(f"Check-in outcome: {outcome}{' (shared with the in-flight check-in)' if shared else ''}")
+        if not shared:
+            report_to_monitor(outcome)
+        logger.handlers[0].flush()
+        ship_logs(config)
+        check_for_update(config)
+        sys.exit(0 if outcome in (single_flight.ACCEPTED, single_flight.ALREADY) else 1)
+    except Exception as e:
+        logger.error(f"Error in main: {str(e)} with traceback: {traceback.format_exc()}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+import sys
+import os
+import logging
+import signal
+import fcntl
+import pwd
+import selectors
+import time
+from collections import deque
+
+try:
+    from jeepney import DBusAddress, HeaderFields, MatchRule, Properties, message_bus, new_method_call
+    from jeepney.io.blocking import open_dbus_connection
+    from jeepney.wrappers import unwrap_msg
+except ImportError as e:
+    print(f"Failed to import required modules: {e}")
+    print("Please ensure jeepney is installed: pip install jeepney")
+    sys.exit(1)
+
+# Shared platform-neutral modules live in Client/Common (bundled via the spec's pathex)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import checkin_schedule
+import client_config
+import control_endpoint
+import delta_update
+import memwatch
+import monitor_core
+from posix_launch import spawn_as, spawn_detached
+import sessions
+import single_flight
+from slim_logging import SizeRotatingFileHandler
+import waits
+
+# Run as root (a system service), one monitor checks in for every user logged in to the machine;
+# POWER_MONITOR_MACHINE_WIDE=0 or 1 decides instead, so the per-user mode can be checked as root
+MACHINE_WIDE = os.environ.get('POWER_MONITOR_MACHINE_WIDE', '1' if os.geteuid() == 0 else '0') == '1'
+
+# Setup paths
+if MACHINE_WIDE:
+    # Installed for every user (test_install.sh --machine-wide): the programs live where every user
+    # can run them and the monitor keeps its own logs and status under /var/lib. Each user's
+    # config.json and last check-in stay in their own home, where their tracker keeps them.
+    INSTALL_DIR = os.environ.get('POWER_MONITOR_INSTALL_DIR', '/opt/AttendanceTracker')
+    APP_SUPPORT = os.environ.get('POWER_MONITOR_STATE_DIR', '/var/lib/AttendanceTracker')
+else:
+    APP_SUPPORT = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'),
+                               'AttendanceTracker')
+    INSTALL_DIR = APP_SUPPORT
+LOG_DIR = os.path.join(APP_SUPPORT, 'Logs')
+os.makedirs(LOG_DIR, exist_ok=True)
+ATT_LOCK_FILE = os.path.join(APP_SUPPORT, 'attendance_tracker.lock')  # Lock file for AttendanceTracker
+# Held by the machine-wide monitor; per-user monitors step aside while it is
+MACHINE_LOCK = os.environ.get('POWER_MONITOR_MACHINE_LOCK', '/run/attendance-tracker-power-monitor.lock')
+
+# Log file for power_monitor
+log_file = os.path.join(LOG_DIR, 'outputpw.log')
+lock_file = MACHINE_LOCK if MACHINE_WIDE else os.path.join(APP_SUPPORT, 'power_monitor.lock')
+
+# Bus carrying the logind signals; overridable so a private dbus-daemon can stand in for it
+LOGIND_BUS = os.environ.get('POWER_MONITOR_LOGIND_BUS', 'SYSTEM')
+
+# Configure logging
+logger = logging.getLogger('PowerMonitor')
+logger.setLevel(logging.INFO)
+
+for handler in logger.handlers[:]:
+    logger.removeHandler(handler)
+
+config_file = os.path.join(INSTALL_DIR, 'logging.conf')
+log_level, max_bytes = 'INFO', 10 * 1024 * 1024
+try:
+    log_level, max_bytes = client_config.load_logging_conf(config_file)
+    logger.info(f"Configured max log size: {max_bytes} bytes")
+except Exception as e:
+    print(f"Failed to parse logging.conf: {e}", file=sys.stderr)
+
+logger.setLevel(getattr(logging, log_level, logging.INFO))
+
+handler = SizeRotatingFileHandler(log_file, max_bytes=max_bytes, backup_count=1)
+handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+logger.addHandler(handler)
+
+if os.environ.get('DEBUG'):
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    logger.addHandler(console_handler)
+
+logger.info("Power monitor logging initialized")
+
+LOGIND = DBusAddress('/org/freedesktop/login1', bus_name='org.freedesktop.login1',
+                     interface='org.freedesktop.login1.Manager')
+LOGIND_SESSION_INTERFACE = 'org.freedesktop.login1.Session'
+
+
+def user_app_support(user):
+    """Where a user's own tracker keeps its state, assuming the XDG default."""
+    return os.path.join(pwd.getpwnam(user).pw_dir, '.local', 'share', 'AttendanceTracker')
+
+
+def user_config(user):
+    """The config.json user's tracker reads: their own, else the one installed beside the shared program."""
+    own = user_app_support(user)
+    return client_config.ConfigStore([os.path.join(own, 'Logs', 'config.json'), os.path.join(own, 'config.json'),
+                                      os.path.join(INSTALL_DIR, 'config.json')])
+
+
+def last_success_path(user=None):
+    return os.path.join(user_app_support(user) if user else APP_SUPPORT, 'Logs', 'last_success.txt')
+
+
+class PowerMonitor:
+    """Resident monitor driven entirely by systemd-logind D-Bus signals.
+
+    The main loop blocks in select() on the bus socket and a signal wakeup
+    pipe, so it never wakes up unless logind or the kernel has something
+    to say.
+
+    A logind delay inhibitor is held while awake. PrepareForSleep(true)
+    nudges the trackers to stop what they are sending and only then lets
+    it go, so the suspend waits for the nudge; PrepareForSleep(false)
+    takes it again.
+
+    Lock and Unlock are watched on every logind session and looked up in
+    the session table. A per-user monitor keeps only its own user's
+    sessions there; a machine-wide one keeps every user session and starts
+    each user's tracker as that user, from the shared INSTALL_DIR, going by
+    that user's own config.json and last check-in.
+    """
+
+    def __init__(self, bus=LOGIND_BUS):
+        self.app_support = APP_SUPPORT
+        logger.info(f"Using app support dir: {self.app_support}")
+        self.machine_wide = MACHINE_WIDE
+        self.user = pwd.getpwuid(os.getuid()).pw_name
+        self.timer_deadline = None
+        self.flight = single_flight.SingleFlight(APP_SUPPORT)
+        self.sessions = sessions.SessionTable()
+        # Sessions looked up once and found not to be ours (greeters, other users)
+        self.ignored = set()
+        self.core = monitor_core.MonitorCore(
+            launcher=self.launchApp,
+            is_tracker_running=self.isTrackerRunning,
+            recorder=monitor_core.recorder_from_env('logind'),
+            status_path=os.path.join(APP_SUPPORT, 'power_monitor.status'),
+            memory=memwatch.reporter_from_env(),
+            config=None if self.machine_wide else client_config.ConfigStore([os.path.join(LOG_DIR, 'config.json'),
+                                                                            os.path.join(APP_SUPPORT, 'config.json')]),
+            user_config=user_config,
+            make_schedule=lambda config, user=None: checkin_schedule.schedule_from_config(
+                config, last_success_path(user)),
+            set_timer=self.setTimer,
+            nudge=self.nudge,
+            user=self.user,
+            sessions=self.sessions if self.machine_wide else None,
+            # A machine-wide install belongs to root and is updated by the installers
+            apply_update=None if self.machine_wide else self.applyUpdate,
+        )
+        self.running = True
+        self.restart = False
+        # Unreaped trackers: pid -> (user, launch time)
+        self.children = {}
+        self.control = None
+        self.selector = None
+        # Check-in engine for probes, started on first use and driven by the select() loop
+        self.engine = None
+        self.signals = deque()
+        # The delay inhibitor comes back as a file descriptor
+        self.conn = open_dbus_connection(bus=bus, enable_fds=True)
+        logger.info(f"Connected to {bus} bus as {self.conn.unique_name}")
+        self.inhibitor = None
+        self._subscribe()
+        self._load_sessions()
+        self._inhibit()
+
+    def _call(self, msg):
+        return unwrap_msg(self.conn.send_and_get_reply(msg, timeout=5))
+
+    def _load_sessions(self):
+        try:
+            listed = self._call(new_method_call(LOGIND, 'ListSessions'))[0]
+        except Exception as e:
+            logger.warning(f"Could not list logind sessions: {e}")
+            return
+        for session_id, uid, user, seat, path in listed:
+            if self.machine_wide or uid == os.getuid():
+                self._track_session(path)
+        logger.info(f"Watching {len(self.sessions.sessions)} logind session(s): {self.sessions.summary()['users']}")
+
+    def _track_session(self, path):
+        """The table entry for a logind session, looking it up on first sight; None if it isn't ours."""
+        session = self.sessions.get(path)
+        if session is not None or path in self.ignored:
+            return session
+        try:
+            props = self._call(Properties(DBusAddress(path, bus_name='org.freedesktop.login1',
+                                                      interface=LOGIND_SESSION_INTERFACE)).get_all())[0]
+        except Exception as e:
+            logger.warning(f"Could not look up session {path}: {e}")
+            return None
+        uid = props['User'][1][0]
+        # Greeter, lock-screen and background sessions have no one to check in for
+        if props['Class'][1] != 'user' or not (self.machine_wide or uid == os.getuid()):
+            self.ignored.add(path)
+            return None
+        user = props['Name'][1]
+        app_support = user_app_support(user) if self.machine_wide else APP_SUPPORT
+        return self.sessions.add(path, user, uid, props['LockedHint'][1], app_support)
+
+    def _inhibit(self):
+        """Take a logind delay lock, so a suspend waits (up to InhibitDelayMaxSec) until we let it go."""
+        if self.inhibitor is not None:
+            return
+        try:
+            fd = self._call(new_method_call(LOGIND, 'Inhibit', 'ssss', (
+                'sleep', 'AttendanceTracker', 'Let a check-in in flight stop cleanly before sleep', 'delay')))[0]
+        except Exception as e:
+            logger.warning(f"Could not take a sleep delay lock, suspend will not wait for the tracker: {e}")
+            return
+        self.inhibitor = fd.to_raw_fd()
+
+    def _release_inhibitor(self):
+        if self.inhibitor is not None:
+            os.close(self.inhibitor)
+            self.inhibitor = None
+
+    def _subscribe(self):
+        # Session signals are matched on every session path; _track_session sorts out whose they are
+        watched = [
+            (LOGIND.interface, 'PrepareForSleep', LOGIND.object_path),
+            (LOGIND.interface, 'SessionNew', LOGIND.object_path),
+            (LOGIND.interface, 'SessionRemoved', LOGIND.object_path),
+            (LOGIND_SESSION_INTERFACE, 'Lock', None),
+            (LOGIND_SESSION_INTERFACE, 'Unlock', None),
+        ]
+        for interface, member, path in watched:
+            rule = MatchRule(type='signal', sender='org.freedesktop.login1', interface=interface,
+                             member=member, path=path)
+            self._call(message_bus.AddMatch(rule))
+            # Signals arrive stamped with logind's unique name, so the local filter can't match on sender
+            self.conn.filter(MatchRule(type='signal', interface=interface, member=member, path=path),
+                             queue=self.signals)
+            logger.info(f"Added logind observer: {rule.serialise()}")
+
+    def _dispatch(self, msg):
+        member = msg.header.fields.get(HeaderFields.member)
+        path = msg.header.fields.get(HeaderFields.path)
+        raw = {'member': member, 'path': path, 'body': list(msg.body)}
+        if member == 'PrepareForSleep':
+            if msg.body[0]:
+                logger.info("====== SYSTEM SUSPEND EVENT DETECTED ======")
+                try:
+                    self.core.handle(monitor_core.SUSPEND, raw)
+                finally:
+                    # The tracker has been told; logind may go ahead
+                    self._release_inhibitor()
+            else:
+                logger.info("====== SYSTEM WAKE EVENT DETECTED ======")
+                self._inhibit()
+                self.core.handle(monitor_core.WAKE, raw)
+        elif member == 'SessionNew':
+            session = self._track_session(msg.body[1])
+            if session:
+                logger.info(f"====== LOGIN EVENT DETECTED ({session.user}) ======")
+                self.core.handle(monitor_core.LOGON, raw, session.user)
+        elif member == 'SessionRemoved':
+            self.ignored.discard(msg.body[1])
+            session = self.sessions.remove(msg.body[1])
+            if session:
+                logger.info(f"Session of {session.user} ended")
+                self.core.handle(monitor_core.LOGOFF, raw, session.user)
+        elif member in ('Lock', 'Unlock'):
+            session = self._track_session(path)
+            if session is None:
+                logger.debug(f"Ignoring {member} of session {path}")
+                return
+            session.locked = member == 'Lock'
+            if session.locked:
+                logger.info(f"Session of {session.user} locked")
+                self.core.handle(monitor_core.LOCK, raw, session.user)
+            else:
+                logger.info(f"====== SCREEN UNLOCK EVENT DETECTED ({session.user}) ======")
+                self.core.handle(monitor_core.UNLOCK, raw, session.user)
+
+    def nudge(self, event):
+        if event == monitor_core.SUSPEND and self.engine:
+            # Probes in flight would only come back failed after the resume
+            self.engine.cancel_all()
+        waits.nudge_tracker(event == monitor_core.SUSPEND, self.children)
+
+    def _engine(self):
+        # Only loaded once asked for, so a monitor nobody probes doesn't carry the loop thread or ssl
+        if self.engine is None:
+            import async_checkin
+            self.engine = async_checkin.EngineThread()
+            self.selector.register(self.engine, selectors.EVENT_READ, 'engine')
+        return self.engine
+
+    def probe(self, user=None):
+        """Reach the check-in server on the hosted engine as user's tracker would; the outcome goes to status."""
+        if self.machine_wide and not user:
+            return {'ok': False, 'error': "a machine-wide monitor probes with a user's config, name the user"}
+        config = self.core.config_for(user)
+        config.refresh()
+        if config.config is None:
+            return {'ok': False, 'error': f"no usable configuration to probe with: {config.error}"}
+        import async_checkin
+        import proxy_resolver
+        url = config.config['server']['url'] + '/checkin'
+        engine = async_checkin.CheckinEngine(proxy_resolver.ProxyResolver(config.config['proxy']))
+        started = time.monotonic()
+
+        def done(future):
+            result = {'url': url, 'user': user, 'finished': time.time(),
+                      'seconds': round(time.monotonic() - started, 3)}
+            if future.cancelled():
+                result['error'] = 'cancelled'
+            elif future.exception():
+                result['error'] = str(future.exception()) or type(future.exception()).__name__
+            else:
+                result['via'] = future.result()
+            logger.info(f"Probe of {url}: {result.get('via') or result['error']}")
+            self.core.record_probe(result)
+        logger.info(f"Probing {url}")
+        self._engine().submit(engine.probe(url, timeout=config.config['server']['timeout_seconds']), done)
+        return {'probing': url}
+
+    def _drain_bus(self):
+        while True:
+            try:
+                self.conn.recv_messages(timeout=0)
+            except TimeoutError:
+                break
+        while self.signals:
+            self._dispatch(self.signals.popleft())
+
+    def setTimer(self, delay):
+        # The only timer is the select() timeout, measured on a clock that keeps running while suspended
+        self.timer_deadline = None if delay is None else waits.deadline_clock() + delay
+        if delay is not None:
+            logger.info(f"Next scheduled check-in in {int(delay)} seconds")
+
+    def _timeout(self):
+        if self.timer_deadline is None:
+            return None
+        return max(0.0, self.timer_deadline - waits.deadline_clock())
+
+    def _flight(self, user):
+        if not self.machine_wide:
+            return self.flight
+        _, session = self.sessions.find(user)
+        return single_flight.SingleFlight(session.app_support if session else user_app_support(user))
+
+    def isTrackerRunning(self, user=None):
+        # Our own unreaped children count even before they take the flight lock
+        running = any(child_user == user for child_user, _ in self.children.values()) if self.machine_wide \
+            else bool(self.children)
+        if not running:
+            flight = self._flight(user)
+            # Never create the lock file as root in someone else's directory
+            running = os.path.exists(flight.lock_path) and flight.in_flight()
+        if running:
+            logger.info("A check-in is already in flight, attaching to its outcome")
+        return running
+
+    def launchApp(self, event=None, user=None):
+        try:
+            app_path = os.path.join(INSTALL_DIR, 'AttendanceTracker')
+            if not os.path.exists(app_path):
+                logger.error(f"AttendanceTracker not found at: {app_path}")
+                return False
+            logger.info(f"Attempting to launch AttendanceTracker from: {app_path}")
+            if self.machine_wide:
+                account = pwd.getpwnam(user)
+                env = {'HOME': account.pw_dir, 'USER': user, 'LOGNAME': user,
+                       'PATH': os.environ.get('PATH', os.defpath),
+                       'XDG_RUNTIME_DIR': f'/run/user/{account.pw_uid}'}
+                pid = spawn_as([app_path], account, env, blocked_signals=waits.TRACKER_SIGNALS)
+            else:
+                pid = spawn_detached([app_path], blocked_signals=waits.TRACKER_SIGNALS)
+            self.children[pid] = (user, time.time())
+            logger.info(f"Launched AttendanceTracker{f' for {user}' if self.machine_wide else ''} with PID: {pid}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to launch AttendanceTracker: {str(e)}", exc_info=True)
+            return False
+
+    def _reap_children(self):
+        for pid in list(self.children):
+            try:
+                reaped, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                self.children.pop(pid)
+                continue
+            if not reaped:
+                continue
+            user, launched = self.children.pop(pid)
+            logger.info(f"AttendanceTracker PID {pid} exited with code {os.waitstatus_to_exitcode(status)}")
+            if self.machine_wide:
+                # Trackers running as their user can't reach our endpoint; their result file says how it went
+                result = self._flight(user).last_result()
+                if result and result.get('finished', 0) >= launched:
+                    self.core.record_outcome(result['outcome'], user)
+                else:
+                    self.core.record_outcome(single_flight.FAILED, user)
+            elif self.core.state().tracker_pid == pid:
+                # It started a check-in but died before reporting the outcome
+                self.core.record_outcome(single_flight.FAILED)
+
+    def applyUpdate(self):
+        if self.flight.in_flight():
+            return False
+        swapped = delta_update.apply_if_idle(APP_SUPPORT)
+        if swapped is None:
+            return False
+        if delta_update.replaces_self(APP_SUPPORT, swapped):
+            logger.info("power_monitor was updated, restarting")
+            self.restart = True
+            self.running = False
+        return True
+
+    def restart_now(self):
+        # exec keeps our PID, so trackers still running would come back as strangers to reap
+        deadline = time.monotonic() + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap_children()
+            time.sleep(0.1)
+        argv = delta_update.restart_argv()
+        os.execve(argv[0], argv, delta_update.restart_env())
+
+    def run(self):
+        # Signals are delivered through a wakeup pipe so select() is the only place we block
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, lambda s, f: None)
+
+        selector = self.selector = selectors.DefaultSelector()
+        selector.register(self.conn.sock, selectors.EVENT_READ, 'bus')
+        selector.register(wakeup_r, selectors.EVENT_READ, 'signal')
+        try:
+            self.control = control_endpoint.UnixControlServer(
+                control_endpoint.default_address(APP_SUPPORT),
+                control_endpoint.ControlCommands(self.core, probe=self.probe))
+            selector.register(self.control, selectors.EVENT_READ, 'control')
+        except OSError as e:
+            logger.error(f"Control endpoint unavailable: {e}")
+
+        if not self.machine_wide:
+            delta_update.remove_old(APP_SUPPORT)
+            # Staged while no monitor was running to hear about it
+            if delta_update.staged_update(APP_SUPPORT):
+                self.core.update_staged()
+        if self.running:
+            logger.info("Launching AttendanceTracker on startup")
+            self.core.handle(monitor_core.STARTUP)
+        logger.info("====== Power Monitor Started ======")
+        self.core.report_memory("steady state after startup")
+        try:
+            while self.running:
+                self._drain_bus()
+                ready = selector.select(self._timeout())
+                if self.timer_deadline is not None and self._timeout() == 0:
+                    logger.info("====== SCHEDULED CHECK-IN ======")
+                    self.timer_deadline = None
+                    self.core.handle(monitor_core.TIMER)
+                for key, _ in ready:
+                    if key.data == 'control':
+                        self.control.handle_ready()
+                    elif key.data == 'engine':
+                        self.engine.handle_ready()
+                    elif key.data == 'signal':
+                        for signum in os.read(wakeup_r, 64):
+                            if signum == signal.SIGCHLD:
+                                self._reap_children()
+                                self.core.try_update()
+                            else:
+                                logger.info(f"Received signal {signum}, shutting down")
+                                self.running = False
+        finally:
+            signal.set_wakeup_fd(-1)
+            selector.close()
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    def cleanup(self):
+        logger.info("Cleaning up PowerMonitor")
+        if os.path.exists(ATT_LOCK_FILE):
+            logger.info("Removing attendance_tracker.lock on power_monitor shutdown")
+            try:
+                os.remove(ATT_LOCK_FILE)
+            except OSError as e:
+                logger.error(f"Failed to remove lock file: {e}")
+        if self.control:
+            self.control.close()
+        if self.engine:
+            self.engine.close()
+        self.core.close()
+        self._release_inhibitor()
+        self.conn.close()
+
+
+def machine_wide_monitor_running():
+    try:
+        fd = os.open(MACHINE_LOCK, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def ensure_single_instance():
+    if not MACHINE_WIDE and machine_wide_monitor_running():
+        logger.info("A machine-wide power_monitor is running, exiting")
+        sys.exit(0)
+    lock_fd = open(lock_file, 'w')
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        lock_fd.write(str(os.getpid()))
+        lock_fd.flush()
+        logger.info(f"Acquired lock, PID: {os.getpid()}")
+        return lock_fd
+    except IOError:
+        lock_fd.close()
+        logger.warning("Another instance of power_monitor is already running, exiting")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    logger.info("Power monitor script starting")
+    os.chdir(APP_SUPPORT)  # Launched trackers inherit this working directory
+    lock_fd = ensure_single_instance()
+    try:
+        monitor = PowerMonitor()
+    except Exception as e:
+        logger.error(f"Monitor initialization failed, exiting: {e}", exc_info=True)
+        sys.exit(1)
+    logger.info(f"Running with PID: {os.getpid()}")
+    try:
+        monitor.run()
+    except Exception as e:
+        logger.error(f"Event loop crashed: {str(e)}", exc_info=True)
+    finally:
+        monitor.cleanup()
+        fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        lock_fd.close()
+        try:
+            os.remove(lock_file)
+        except OSError:
+            pass
+    if monitor.restart:
+        monitor.restart_now()
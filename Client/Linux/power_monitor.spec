@@ -0,0 +1,72 @@
+# -*- mode: python ; coding: utf-8 -*-
+import os
+
+# TRACKER_PACKAGING=onedir: nothing to unpack to a temp dir on each launch, no UPX to
+# inflate and bytecode compiled ahead with -OO (see Tools/bench_startup.py)
+ONEDIR = os.environ.get('TRACKER_PACKAGING', 'onefile') == 'onedir'
+
+a = Analysis(
+    ['power_monitor.py'],
+    pathex=['../Common'],
+    binaries=[],
+    datas=[],
+    hiddenimports=['jeepney', 'jeepney.io.blocking'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[],
+    noarchive=False,
+    optimize=2 if ONEDIR else 0,
+)
+
+pyz = PYZ(a.pure)
+
+if ONEDIR:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='power_monitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+        # Beside the other program in the install directory, so each needs its own
+        contents_directory='power_monitor_internal',
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        name='power_monitor',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='power_monitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
@@ -0,0 +1,100 @@
+#!/bin/bash
+
+# Color codes for output
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+YELLOW='\033[1;33m'
+NC='\033[0m'
+
+SERVICE_NAME="attendancetracker-powermonitor.service"
+
+# Application directories. "test_install.sh --machine-wide" installs one power monitor for every
+# user of the machine instead: a system service run as root, with the programs under /opt where
+# each user's tracker can run them. Every user's config.json and last check-in stay in their home;
+# the config.json installed beside the programs is the fallback.
+if [ "$1" = "--machine-wide" ]; then
+    if [ "$(id -u)" -ne 0 ]; then
+        echo "The machine-wide installation must be run as root: sudo $0 --machine-wide"
+        exit 1
+    fi
+    APP_SUPPORT_DIR="/opt/AttendanceTracker"
+    LOG_DIR="/var/lib/AttendanceTracker/Logs"
+    SYSTEMD_DIR="/etc/systemd/system"
+    SYSTEMCTL="systemctl"
+    AFTER="systemd-logind.service"
+    WANTED_BY="multi-user.target"
+else
+    APP_SUPPORT_DIR="${XDG_DATA_HOME:-$HOME/.local/share}/AttendanceTracker"
+    LOG_DIR="$APP_SUPPORT_DIR/Logs"
+    SYSTEMD_DIR="${XDG_CONFIG_HOME:-$HOME/.config}/systemd/user"
+    SYSTEMCTL="systemctl --user"
+    AFTER="graphical-session.target"
+    WANTED_BY="default.target"
+fi
+
+# Set up logging
+LOG_FILE="$LOG_DIR/installation.log"
+mkdir -p "$LOG_DIR" "$APP_SUPPORT_DIR"
+
+# Logging function
+log() {
+    local message="$*"
+    local timestamp=$(date '+%Y-%m-%d %H:%M:%S')
+    echo "$timestamp: $message" >> "$LOG_FILE"
+    echo -e "$message"
+}
+
+# Stop any existing power_monitor
+log "Stopping any existing power_monitor processes..."
+$SYSTEMCTL stop "$SERVICE_NAME" 2>/dev/null || true
+pkill -f "$APP_SUPPORT_DIR/power_monitor" || true
+sleep 2
+
+# Copy the built executables and config
+log "Copying files to ${APP_SUPPORT_DIR}/"
+cp ./AttendanceTracker "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy AttendanceTracker"; exit 1; }
+cp ./power_monitor "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy power monitor"; exit 1; }
+# A onedir package (TRACKER_PACKAGING=onedir) carries each program's libraries next to it
+for internal in ./AttendanceTracker_internal ./power_monitor_internal; do
+    if [ -d "$internal" ]; then
+        rm -rf "${APP_SUPPORT_DIR}/${internal#./}"
+        cp -R "$internal" "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy ${internal#./}"; exit 1; }
+    fi
+done
+cp ./config.json "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy config file"; exit 1; }
+cp ./logging.conf "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy logging.conf"; exit 1; }
+chmod +x "${APP_SUPPORT_DIR}/AttendanceTracker" "${APP_SUPPORT_DIR}/power_monitor"
+
+# Create the systemd service so the monitor starts with the user session, or at boot machine-wide
+log "Creating systemd service..."
+mkdir -p "$SYSTEMD_DIR"
+cat > "${SYSTEMD_DIR}/${SERVICE_NAME}" << EOL
+[Unit]
+Description=AttendanceTracker power monitor
+After=${AFTER}
+
+[Service]
+WorkingDirectory=${APP_SUPPORT_DIR}
+ExecStart=${APP_SUPPORT_DIR}/power_monitor
+Restart=on-failure
+
+[Install]
+WantedBy=${WANTED_BY}
+EOL
+
+$SYSTEMCTL daemon-reload || { log "❌ Failed to reload systemd units"; exit 1; }
+$SYSTEMCTL enable "$SERVICE_NAME" || { log "❌ Failed to enable $SERVICE_NAME"; exit 1; }
+
+log "Installation completed successfully!"
+
+# Start PowerMonitor
+log "Starting PowerMonitor..."
+$SYSTEMCTL restart "$SERVICE_NAME"
+sleep 2
+
+# Verify it's running
+if $SYSTEMCTL is-active --quiet "$SERVICE_NAME"; then
+    log "${GREEN}✅ PowerMonitor started successfully${NC}"
+else
+    log "${RED}❌ Failed to start PowerMonitor${NC}"
+fi
@@ -0,0 +1,49 @@
+#!/bin/bash
+
+# Color codes for output
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m'
+
+SERVICE_NAME="attendancetracker-powermonitor.service"
+
+# "uninstall.sh --machine-wide" removes a machine-wide install (test_install.sh --machine-wide)
+if [ "$1" = "--machine-wide" ]; then
+    if [ "$(id -u)" -ne 0 ]; then
+        echo "The machine-wide installation must be removed as root: sudo $0 --machine-wide"
+        exit 1
+    fi
+    APP_SUPPORT_DIR="/opt/AttendanceTracker"
+    STATE_DIR="/var/lib/AttendanceTracker"
+    SYSTEMD_DIR="/etc/systemd/system"
+    SYSTEMCTL="systemctl"
+else
+    APP_SUPPORT_DIR="${XDG_DATA_HOME:-$HOME/.local/share}/AttendanceTracker"
+    STATE_DIR="$APP_SUPPORT_DIR"
+    SYSTEMD_DIR="${XDG_CONFIG_HOME:-$HOME/.config}/systemd/user"
+    SYSTEMCTL="systemctl --user"
+fi
+
+log() {
+    echo -e "$(date '+%Y-%m-%d %H:%M:%S'): $*" >> "/tmp/AttendanceTracker_uninstall.log"
+    echo -e "$*"
+}
+
+log "Uninstalling AttendanceTracker..."
+
+# Stop and remove the systemd service
+log "Removing systemd service..."
+$SYSTEMCTL disable --now "$SERVICE_NAME" 2>/dev/null || true
+rm -f "${SYSTEMD_DIR}/${SERVICE_NAME}"
+$SYSTEMCTL daemon-reload 2>/dev/null || true
+
+# Kill any running processes
+pkill -f "$APP_SUPPORT_DIR/power_monitor" || true
+pkill -f "$APP_SUPPORT_DIR/AttendanceTracker" || true
+sleep 2
+
+# Remove all installed files
+log "Removing installed files..."
+rm -rf "$APP_SUPPORT_DIR" "$STATE_DIR" || log "${YELLOW}⚠️ Failed to remove $APP_SUPPORT_DIR${NC}"
+
+log "${GREEN}✅ AttendanceTracker has been uninstalled${NC}"
@@ -1,9 +1,13 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# The app bundle is always a directory; TRACKER_PACKAGING=onedir also drops UPX, so nothing
+# is inflated on each launch, and compiles bytecode ahead with -OO (see Tools/bench_startup.py)
+ONEDIR = os.environ.get('TRACKER_PACKAGING', 'onefile') == 'onedir'
 
 a = Analysis(
     ['AttendanceTracker.py'],
-    pathex=['../../.venv/lib/python3.12/site-packages'],
+    pathex=['../../.venv/lib/python3.12/site-packages', '../Common'],
     binaries=[],
     datas=[('config.json', '.')],
     hiddenimports=[],
@@ -12,7 +16,7 @@ a = Analysis(
     runtime_hooks=[],
     excludes=[],
     noarchive=False,
-    optimize=0,
+    optimize=2 if ONEDIR else 0,
 )
 pyz = PYZ(a.pure)
 
@@ -25,7 +29,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=not ONEDIR,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -38,7 +42,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=not ONEDIR,
     upx_exclude=[],
     name='AttendanceTracker',
 )
@@ -3,22 +3,32 @@ import sys
 import os
 import logging
 import signal
-from datetime import datetime
-import subprocess
 import fcntl
+import threading
 import time
-from logging.handlers import RotatingFileHandler
-import configparser
 
 try:
     import objc
-    from AppKit import NSWorkspace, NSObject, NSWorkspaceDidWakeNotification
-    from Foundation import NSDistributedNotificationCenter
+    from AppKit import NSWorkspace, NSObject, NSWorkspaceDidWakeNotification, NSWorkspaceWillSleepNotification
+    from Foundation import NSDistributedNotificationCenter, NSTimer
 except ImportError as e:
     print(f"Failed to import required modules: {e}")
     print("Please ensure pyobjc is installed: pip install pyobjc-framework-Cocoa")
     sys.exit(1)
 
+# Shared platform-neutral modules live in Client/Common (bundled via the spec's pathex)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import checkin_schedule
+import client_config
+import control_endpoint
+import delta_update
+import memwatch
+import monitor_core
+from posix_launch import spawn_detached
+import single_flight
+from slim_logging import SizeRotatingFileHandler
+import waits
+
 # Setup paths
 APP_SUPPORT = os.path.expanduser("~/Library/Application Support/AttendanceTracker")
 LOG_DIR = os.path.join(APP_SUPPORT, 'Logs')
@@ -37,24 +47,16 @@ for handler in logger.handlers[:]:
     logger.removeHandler(handler)
 
 config_file = os.path.join(APP_SUPPORT, 'logging.conf')
-config = configparser.ConfigParser()
-log_level = 'INFO'
-max_bytes = 10 * 1024 * 1024
-
-if os.path.exists(config_file):
-    try:
-        config.read(config_file)
-        if 'logging' in config:
-            log_level = config['logging'].get('level', 'INFO').upper()
-            max_size_mb = config['logging'].getfloat('max_size_mb', 10.0)  # Handles 0.01 correctly
-            max_bytes = int(max_size_mb * 1024 * 1024)  # Converts MB to bytes
-            logger.info(f"Configured max log size: {max_size_mb} MB ({max_bytes} bytes)")
-    except Exception as e:
-        print(f"Failed to parse logging.conf: {e}", file=sys.stderr)
+log_level, max_bytes = 'INFO', 10 * 1024 * 1024
+try:
+    log_level, max_bytes = client_config.load_logging_conf(config_file)
+    logger.info(f"Configured max log size: {max_bytes} bytes")
+except Exception as e:
+    print(f"Failed to parse logging.conf: {e}", file=sys.stderr)
 
 logger.setLevel(getattr(logging, log_level, logging.INFO))
 
-handler = RotatingFileHandler(log_file, mode='a', maxBytes=max_bytes, backupCount=1)
+handler = SizeRotatingFileHandler(log_file, max_bytes=max_bytes, backup_count=1)
 handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
 logger.addHandler(handler)
 
@@ -77,6 +79,27 @@ class PowerMonitor(NSObject):
         logger.info(f"Initializing monitor in GUI session: {os.environ.get('DISPLAY', 'No display')}")
         logger.info(f"User: {os.getenv('USER')}, Home: {os.getenv('HOME')}")
         logger.info(f"Using app support dir: {self.app_support}")
+        self.checkinTimer = None
+        self.trackerPid = None
+        self.flight = single_flight.SingleFlight(APP_SUPPORT)
+        self.control = None
+        # Held around every use of the core: the control endpoint reads it from its own thread
+        self.lock = threading.RLock()
+        self.restartRequested = False
+        self.core = monitor_core.MonitorCore(
+            launcher=self.launchApp,
+            is_tracker_running=self.isTrackerRunning,
+            recorder=monitor_core.recorder_from_env('cocoa'),
+            status_path=os.path.join(APP_SUPPORT, 'power_monitor.status'),
+            memory=memwatch.reporter_from_env(),
+            config=client_config.ConfigStore([os.path.join(LOG_DIR, 'config.json'),
+                                              os.path.join(APP_SUPPORT, 'config.json')]),
+            make_schedule=lambda config: checkin_schedule.schedule_from_config(
+                config, os.path.join(LOG_DIR, 'last_success.txt')),
+            set_timer=self.setTimer,
+            nudge=self.nudgeTracker,
+            apply_update=self.applyUpdate,
+        )
         workspace = NSWorkspace.sharedWorkspace()
         nc = workspace.notificationCenter()
         dnc = NSDistributedNotificationCenter.defaultCenter()
@@ -84,14 +107,22 @@ class PowerMonitor(NSObject):
 
         nc.addObserver_selector_name_object_(self, 'handleWake:', NSWorkspaceDidWakeNotification, None)
         logger.info(f"Added system wake observer: {NSWorkspaceDidWakeNotification}")
+        nc.addObserver_selector_name_object_(self, 'handleSleep:', NSWorkspaceWillSleepNotification, None)
+        logger.info(f"Added system sleep observer: {NSWorkspaceWillSleepNotification}")
         dnc.addObserver_selector_name_object_(self, 'handleUnlock:', 'com.apple.screenIsUnlocked', None)
         logger.info("Added screen unlock observer: com.apple.screenIsUnlocked")
         dnc.addObserver_selector_name_object_(self, 'handleLogin:', 'com.apple.sessionDidBecomeActive', None)
         logger.info("Added login observer: com.apple.sessionDidBecomeActive")
 
+        delta_update.remove_old(APP_SUPPORT)
+        # Staged while no monitor was running to hear about it
+        if delta_update.staged_update(APP_SUPPORT):
+            self.core.update_staged()
+
         # Launch AttendanceTracker immediately on startup
-        logger.info("Launching AttendanceTracker on startup")
-        self.launchApp()
+        if not self.restartRequested:
+            logger.info("Launching AttendanceTracker on startup")
+            self.core.handle(monitor_core.STARTUP)
 
         logger.info("====== Power Monitor Started ======")
         return self
@@ -99,61 +130,114 @@ class PowerMonitor(NSObject):
     def handleWake_(self, notification):
         logger.info("====== SYSTEM WAKE EVENT DETECTED ======")
         logger.debug(f"Notification details: {notification}")
-        self.launchApp()
+        with self.lock:
+            self.core.handle(monitor_core.WAKE, {'name': str(notification.name())})
+
+    def handleSleep_(self, notification):
+        logger.info("====== SYSTEM SLEEP EVENT DETECTED ======")
+        with self.lock:
+            self.core.handle(monitor_core.SUSPEND, {'name': str(notification.name())})
 
     def handleUnlock_(self, notification):
         logger.info("====== SCREEN UNLOCK EVENT DETECTED ======")
         logger.debug(f"Notification details: {notification}")
-        self.launchApp()
+        with self.lock:
+            self.core.handle(monitor_core.UNLOCK, {'name': str(notification.name())})
 
     def handleLogin_(self, notification):
         logger.info("====== LOGIN EVENT DETECTED ======")
         logger.debug(f"Notification details: {notification}")
-        self.launchApp()
+        with self.lock:
+            self.core.handle(monitor_core.LOGON, {'name': str(notification.name())})
+
+    def scheduledCheckin_(self, timer):
+        logger.info("====== SCHEDULED CHECK-IN ======")
+        self.checkinTimer = None
+        with self.lock:
+            self.core.handle(monitor_core.TIMER)
+
+    @objc.python_method
+    def startControlEndpoint(self, run_on_main):
+        # Served from a helper thread: status and metrics are read under the lock, anything that
+        # changes state is handed back to the run loop and run there under it too
+        def locked(action):
+            with self.lock:
+                action()
+        try:
+            self.control = control_endpoint.UnixControlServer(
+                control_endpoint.default_address(APP_SUPPORT),
+                control_endpoint.ControlCommands(self.core, run_on_main=lambda action: run_on_main(locked, action),
+                                                 lock=self.lock))
+        except OSError as e:
+            logger.error(f"Control endpoint unavailable: {e}")
+            return
+        threading.Thread(target=self.control.serve_forever, daemon=True).start()
+
+    @objc.python_method
+    def setTimer(self, delay):
+        # One NSTimer armed for the next scheduled check-in; wake events re-arm it after sleep
+        if self.checkinTimer is not None:
+            self.checkinTimer.invalidate()
+            self.checkinTimer = None
+        if delay is not None:
+            self.checkinTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
+                delay, self, 'scheduledCheckin:', None, False)
+            logger.info(f"Next scheduled check-in in {int(delay)} seconds")
+
+    @objc.python_method
+    def isTrackerRunning(self, user=None):
+        # The flight lock is held for exactly as long as a check-in is running
+        if self.flight.in_flight():
+            logger.info("A check-in is already in flight, attaching to its outcome")
+            return True
+        # A tracker we just started may not have taken the flight lock yet
+        if self.trackerPid is not None and pid_alive(self.trackerPid):
+            logger.info(f"AttendanceTracker PID {self.trackerPid} is still starting, skipping launch")
+            return True
+        return False
+
+    @objc.python_method
+    def applyUpdate(self):
+        if self.flight.in_flight():
+            return False
+        swapped = delta_update.apply_if_idle(APP_SUPPORT)
+        if swapped is None:
+            return False
+        if delta_update.replaces_self(APP_SUPPORT, swapped):
+            logger.info("power_monitor was updated, restarting")
+            self.restartRequested = True
+            from PyObjCTools import AppHelper
+            AppHelper.stopEventLoop()
+        return True
+
+    @objc.python_method
+    def nudgeTracker(self, event):
+        # Only signal a tracker that has reported itself through the control endpoint
+        pid = self.core.state().tracker_pid
+        if pid is None or not pid_alive(pid):
+            return
+        logger.info(f"Telling AttendanceTracker PID {pid} about {event}")
+        waits.nudge_tracker(event == monitor_core.SUSPEND, [pid])
 
-    def launchApp(self):
+    @objc.python_method
+    def launchApp(self, event=None, user=None):
         try:
             app_path = os.path.join(self.app_support, "AttendanceTracker.app/Contents/MacOS/AttendanceTracker")
             logger.info(f"Checking if AttendanceTracker exists at: {app_path}")
-            if os.path.exists(app_path):
-                logger.info(f"File permissions: {oct(os.stat(app_path).st_mode & 0o777)}")
-                # Check if AttendanceTracker is already running via lock file with retries
-                for attempt in range(3):  # Retry 3 times to avoid timing issues
-                    if os.path.exists(ATT_LOCK_FILE):
-                        logger.info(f"Lock file {ATT_LOCK_FILE} exists, checking if process is running (attempt {attempt + 1}/3)")
-                        try:
-                            with open(ATT_LOCK_FILE, 'r') as f:
-                                pid = int(f.read().strip())
-                            os.kill(pid, 0)  # Test if PID is alive
-                            logger.info(f"AttendanceTracker is already running with PID: {pid}, skipping launch")
-                            return
-                        except (OSError, ValueError):
-                            logger.info(f"Lock file {ATT_LOCK_FILE} is stale, removing it")
-                            os.remove(ATT_LOCK_FILE)
-                    else:
-                        logger.info(f"No lock file found at {ATT_LOCK_FILE} (attempt {attempt + 1}/3), waiting briefly")
-                    time.sleep(0.5)  # Wait 0.5 seconds before retrying
-                # Launch new instance
-                logger.info(f"Attempting to launch AttendanceTracker from: {app_path}")
-                env = os.environ.copy()
-                env['HOME'] = os.path.expanduser("~")  # Only set necessary environment variables
-                # output_file = os.path.join(LOG_DIR, f"attendance_tracker_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-                # process = subprocess.Popen(
-                #     ['/bin/bash', '-c', f'"{app_path}" > "{output_file}" 2>&1'],
-                #     cwd=self.app_support,
-                #     env=env
-                # )
-
-                process = subprocess.Popen(
-                    ['/bin/bash', '-c', f'"{app_path}" > /dev/null 2>&1'],
-                    cwd=self.app_support,
-                    env=env
-                )
-                logger.info(f"Launched AttendanceTracker with PID: {process.pid}")
-            else:
+            if not os.path.exists(app_path):
                 logger.error(f"AttendanceTracker not found at: {app_path}")
+                return False
+            logger.info(f"File permissions: {oct(os.stat(app_path).st_mode & 0o777)}")
+            logger.info(f"Attempting to launch AttendanceTracker from: {app_path}")
+            env = os.environ.copy()
+            env['HOME'] = os.path.expanduser("~")  # Only set necessary environment variables
+            pid = spawn_detached([app_path], env=env, blocked_signals=waits.TRACKER_SIGNALS)
+            self.trackerPid = pid
+            logger.info(f"Launched AttendanceTracker with PID: {pid}")
+            return True
         except Exception as e:
             logger.error(f"Failed to launch AttendanceTracker: {str(e)}", exc_info=True)
+            return False
 
     def cleanup(self):
         logger.info("Cleaning up PowerMonitor")
@@ -165,6 +249,18 @@ class PowerMonitor(NSObject):
                 logger.error(f"Failed to remove lock file: {e}")
         NSWorkspace.sharedWorkspace().notificationCenter().removeObserver_(self)
         NSDistributedNotificationCenter.defaultCenter().removeObserver_(self)
+        if self.control:
+            self.control.close()
+        with self.lock:
+            self.core.close()
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
 
 def signal_handler(signum, frame, monitor, lock_fd):
     logger.info(f"Received signal {signum}, shutting down")
@@ -176,6 +272,9 @@ def signal_handler(signum, frame, monitor, lock_fd):
             os.remove(lock_file)
         except OSError:
             pass
+    if monitor.restartRequested:
+        argv = delta_update.restart_argv()
+        os.execve(argv[0], argv, delta_update.restart_env())
     sys.exit(0)
 
 def ensure_single_instance():
@@ -225,6 +324,8 @@ def ensure_single_instance():
 
 if __name__ == "__main__":
     logger.info("Power monitor script starting")
+    os.chdir(APP_SUPPORT)  # Launched trackers inherit this working directory
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Let the kernel reap finished trackers
     lock_fd = ensure_single_instance()
     monitor = PowerMonitor.alloc().init()
     if monitor is None:
@@ -235,19 +336,28 @@ if __name__ == "__main__":
         sys.exit(1)
     global_monitor = monitor
     logger.info("Monitor instance created, entering run loop")
+    monitor.core.report_memory("steady state after startup")
     logger.info(f"Running with PID: {os.getpid()}")
     signal.signal(signal.SIGINT, lambda s, f: signal_handler(s, f, global_monitor, lock_fd))
     signal.signal(signal.SIGTERM, lambda s, f: signal_handler(s, f, global_monitor, lock_fd))
-    def heartbeat():
-        while True:
-            logger.info("Heartbeat: PowerMonitor is still running")
-            time.sleep(60)
-    import threading
-    threading.Thread(target=heartbeat, daemon=True).start()
+    from PyObjCTools import AppHelper
+    # Python signal handlers only run once the run loop returns to Python. Rather than
+    # waking every few seconds to give them a chance, a thread blocks on the signal
+    # wakeup pipe and nudges the run loop only when a signal actually arrives.
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+
+    def forward_signals():
+        while os.read(wakeup_r, 64):
+            AppHelper.callAfter(lambda: None)
+    threading.Thread(target=forward_signals, daemon=True).start()
+    monitor.startControlEndpoint(AppHelper.callAfter)
     try:
-        from PyObjCTools import AppHelper
-        logger.info("Starting event loop")
-        AppHelper.runConsoleEventLoop()
+        # Already restarting if a staged update replaced us at startup
+        if not monitor.restartRequested:
+            logger.info("Starting event loop")
+            AppHelper.runConsoleEventLoop(maxTimeout=24 * 3600)
     except Exception as e:
         logger.error(f"Event loop crashed: {str(e)}", exc_info=True)
     finally:
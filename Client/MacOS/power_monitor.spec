@@ -1,10 +1,15 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# TRACKER_PACKAGING=onedir: nothing to unpack to a temp dir on each launch, no UPX to
+# inflate and bytecode compiled ahead with -OO (see Tools/bench_startup.py)
+ONEDIR = os.environ.get('TRACKER_PACKAGING', 'onefile') == 'onedir'
 
 block_cipher = None
 
 a = Analysis(
     ['./power_monitor.py'],
-    pathex=['.venv/lib/python3.12/site-packages'],
+    pathex=['.venv/lib/python3.12/site-packages', '../Common'],
     binaries=[],
     datas=[],
     hiddenimports=['AppKit', 'objc'],
@@ -13,27 +18,56 @@ a = Analysis(
     runtime_hooks=[],
     excludes=[],
     noarchive=False,
-    optimize=0,
+    optimize=2 if ONEDIR else 0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='power_monitor',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=True,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if ONEDIR:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='power_monitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+        # Beside the other program in the install directory, so each needs its own
+        contents_directory='power_monitor_internal',
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        name='power_monitor',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='power_monitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
@@ -42,6 +42,11 @@ rm -rf "${APP_SUPPORT_DIR}/AttendanceTracker.app"
 log "Copying app from $(pwd)/AttendanceTracker.app to ${APP_SUPPORT_DIR}/"
 ditto "./AttendanceTracker.app" "${APP_SUPPORT_DIR}/AttendanceTracker.app" || { log "❌ Failed to copy app"; exit 1; }
 cp ./power_monitor "${APP_SUPPORT_DIR}/" || { log "❌ Failed to copy power monitor"; exit 1; }
+# A onedir package (TRACKER_PACKAGING=onedir) carries the monitor's libraries next to it
+if [ -d "./power_monitor_internal" ]; then
+    rm -rf "${APP_SUPPORT_DIR}/power_monitor_internal"
+    ditto "./power_monitor_internal" "${APP_SUPPORT_DIR}/power_monitor_internal" || { log "❌ Failed to copy power_monitor_internal"; exit 1; }
+fi
 
 # Copy config file
 log "Copying config file..."
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Measure how often an idle resident monitor wakes up and how much it writes.
+
+Starts a command (by default the Linux power monitor against a private
+dbus-daemon, so no real logind is needed), lets it settle, then samples the
+context switches of all its threads and the bytes it wrote over an idle
+window, scaled to one hour. Linux only: it reads /proc.
+
+    python bench_idle.py --duration 120
+    python bench_idle.py --duration 60 -- python ../Linux/power_monitor.py
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_counters(pid):
+    switches = 0
+    for status_path in glob.glob(f'/proc/{pid}/task/*/status'):
+        try:
+            with open(status_path) as f:
+                for line in f:
+                    if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+                        switches += int(line.split()[1])
+        except FileNotFoundError:
+            continue
+    written = 0
+    with open(f'/proc/{pid}/io') as f:
+        for line in f:
+            if line.startswith('wchar'):
+                written = int(line.split()[1])
+    return switches, written
+
+
+def start_private_bus():
+    proc = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return proc, proc.stdout.readline().strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=60, help='idle seconds to measure')
+    parser.add_argument('--settle', type=float, default=3, help='seconds to wait before measuring')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='monitor command (after --)')
+    args = parser.parse_args()
+
+    command = [c for c in args.command if c != '--']
+    env = os.environ.copy()
+    bus = None
+    data_dir = None
+    if not command:
+        bus, address = start_private_bus()
+        data_dir = tempfile.mkdtemp(prefix='bench_idle_')
+        env.update({'POWER_MONITOR_LOGIND_BUS': address, 'XDG_DATA_HOME': data_dir})
+        command = [sys.executable, os.path.join(HERE, '..', 'Linux', 'power_monitor.py')]
+
+    monitor = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(args.settle)
+        if monitor.poll() is not None:
+            sys.exit(f"Monitor exited early with code {monitor.returncode}")
+        switches_before, written_before = read_counters(monitor.pid)
+        started = time.monotonic()
+        time.sleep(args.duration)
+        elapsed = time.monotonic() - started
+        switches_after, written_after = read_counters(monitor.pid)
+    finally:
+        monitor.send_signal(signal.SIGTERM)
+        monitor.wait(timeout=10)
+        if bus:
+            bus.terminate()
+            bus.wait()
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    scale = 3600.0 / elapsed
+    result = {
+        'command': command,
+        'idle_seconds': round(elapsed, 3),
+        'wakeups': switches_after - switches_before,
+        'bytes_written': written_after - written_before,
+        'wakeups_per_idle_hour': round((switches_after - switches_before) * scale, 1),
+        'bytes_written_per_idle_hour': round((written_after - written_before) * scale, 1),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"idle {result['idle_seconds']}s: {result['wakeups']} wakeups, {result['bytes_written']} bytes written")
+        print(f"per idle hour: {result['wakeups_per_idle_hour']} wakeups, "
+              f"{result['bytes_written_per_idle_hour']} bytes written")
+
+
+if __name__ == '__main__':
+    main()
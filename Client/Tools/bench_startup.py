@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Measure how long the tracker and the monitor take to start, cold and warm.
+
+    python bench_startup.py                          # the entry points run from source
+    python bench_startup.py --dist ../Linux/dist     # a PyInstaller build, onefile or onedir
+    python bench_startup.py --dist dist --save startup_baseline.json --label onefile
+    python bench_startup.py --dist dist --compare startup_baseline.json --against onefile
+
+Each entry point runs in a scratch data directory against a local check-in
+server (and, for the Linux monitor, a private dbus-daemon). Every run is
+timed from spawn to:
+
+  first log   the first record in its log file
+  exit        tracker: the end of its check-in; monitor: the end of an
+              orderly shutdown, requested as soon as it logs that it is ready
+
+Warm runs follow one unmeasured run. Cold runs drop the OS page cache
+first, which needs root on Linux and purge on macOS; they are skipped
+where that isn't possible.
+
+--save records the results under --label in a JSON file (merging with
+what is there); --compare prints each median against the run recorded
+under --against. Tools/startup_baseline.json holds the onefile and onedir
+builds as they stood when the onedir packaging mode was added.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+POLL = 0.001
+TIMEOUT = 60
+
+if sys.platform == 'win32':
+    SOURCE_DIR = 'Windows'
+    PROGRAMS = {'tracker': 'AttendanceTracker.exe', 'monitor': 'PowerMonitor.exe'}
+    SCRIPTS = {'tracker': 'AttendanceTracker.py', 'monitor': 'power_monitor.py'}
+    LOGS = {'tracker': os.path.join('Logs', 'attendancetracker.log'), 'monitor': os.path.join('logs', 'powermonitor.log')}
+elif sys.platform == 'darwin':
+    SOURCE_DIR = 'MacOS'
+    PROGRAMS = {'tracker': 'AttendanceTracker.app/Contents/MacOS/AttendanceTracker', 'monitor': 'power_monitor'}
+    SCRIPTS = {'tracker': 'AttendanceTracker.py', 'monitor': 'power_monitor.py'}
+    LOGS = {'tracker': os.path.join('Logs', 'outputat.log'), 'monitor': os.path.join('Logs', 'outputpw.log')}
+else:
+    SOURCE_DIR = 'Linux'
+    PROGRAMS = {'tracker': 'AttendanceTracker', 'monitor': 'power_monitor'}
+    SCRIPTS = {'tracker': 'AttendanceTracker.py', 'monitor': 'power_monitor.py'}
+    LOGS = {'tracker': os.path.join('Logs', 'outputat.log'), 'monitor': os.path.join('Logs', 'outputpw.log')}
+# What each monitor logs once it is waiting for events
+READY = ('Power Monitor Started', 'Entering message loop')
+
+
+class CheckinServer:
+    """Accepts every check-in at once, so the tracker's exit time is its own."""
+
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def scratch_environment(root):
+    """(environment, app-support directory) that keep a run's files under root."""
+    env = os.environ.copy()
+    if sys.platform == 'win32':
+        env['APPDATA'] = root
+        return env, os.path.join(root, 'AttendanceTracker')
+    if sys.platform == 'darwin':
+        env['HOME'] = root
+        return env, os.path.join(root, 'Library', 'Application Support', 'AttendanceTracker')
+    env['XDG_DATA_HOME'] = root
+    # Run as root the monitor is machine-wide; keep its lock out of /run
+    env['POWER_MONITOR_MACHINE_LOCK'] = os.path.join(root, 'power_monitor.machine.lock')
+    return env, os.path.join(root, 'AttendanceTracker')
+
+
+def find_program(dist, role):
+    """The entry point in a build: dist/<name>, or dist/<name>/<name> for a onedir build."""
+    name = PROGRAMS[role]
+    for path in (os.path.join(dist, name), os.path.join(dist, os.path.splitext(name)[0], name)):
+        if os.path.isfile(path):
+            return [path]
+    sys.exit(f"No {name} in {dist}")
+
+
+def drop_caches():
+    if sys.platform.startswith('linux'):
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3')
+    elif sys.platform == 'darwin':
+        subprocess.run(['purge'], check=True, capture_output=True)
+    else:
+        raise OSError("no way to drop the page cache on this platform")
+
+
+def log_contents(path):
+    try:
+        with open(path, 'r', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def run_once(role, command, env, app_support, cold):
+    """(seconds to first log, seconds to exit) of one run."""
+    # A fresh Logs directory each time: no earlier log lines, no last_success.txt or lease
+    shutil.rmtree(os.path.join(app_support, os.path.dirname(LOGS[role])), ignore_errors=True)
+    log = os.path.join(app_support, LOGS[role])
+    if cold:
+        drop_caches()
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_log = None
+    try:
+        while True:
+            elapsed = time.perf_counter() - started
+            if first_log is None and os.path.exists(log) and os.path.getsize(log):
+                first_log = elapsed
+                if role == 'tracker':
+                    process.wait(timeout=TIMEOUT)
+                    break
+            if role == 'monitor' and first_log is not None and any(r in log_contents(log) for r in READY):
+                process.terminate() if sys.platform == 'win32' else process.send_signal(signal.SIGTERM)
+                process.wait(timeout=TIMEOUT)
+                break
+            if process.poll() is not None:
+                break
+            if elapsed > TIMEOUT:
+                raise subprocess.TimeoutExpired(command, TIMEOUT)
+            time.sleep(POLL)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    exited = time.perf_counter() - started
+    if first_log is None:
+        raise RuntimeError(f"{role} exited with code {process.returncode} without logging anything")
+    return first_log, exited
+
+
+def summary(samples):
+    ms = [s * 1000 for s in samples]
+    return {'median_ms': round(statistics.median(ms), 1), 'min_ms': round(min(ms), 1),
+            'max_ms': round(max(ms), 1), 'runs': len(ms)}
+
+
+def bench(role, command, runs, cold_runs, server):
+    root = tempfile.mkdtemp(prefix=f'bench_startup_{role}_')
+    env, app_support = scratch_environment(root)
+    os.makedirs(app_support)
+    with open(os.path.join(app_support, 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': server.url, 'timeout_seconds': 5, 'max_retry_attempts': 1, 'retry_delay_seconds': 1},
+            'application': {'startup_delay_seconds': 0},
+        }, f)
+    bus = None
+    if role == 'monitor' and sys.platform.startswith('linux'):
+        from bench_idle import start_private_bus
+        bus, address = start_private_bus()
+        env['POWER_MONITOR_LOGIND_BUS'] = address
+    results = {}
+    try:
+        phases = [('warm', runs, False)]
+        if cold_runs:
+            try:
+                drop_caches()
+                phases.insert(0, ('cold', cold_runs, True))
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Skipping cold runs, cannot drop the page cache: {e}", file=sys.stderr)
+        for phase, count, cold in phases:
+            if not cold:
+                run_once(role, command, env, app_support, cold)
+            samples = [run_once(role, command, env, app_support, cold) for _ in range(count)]
+            results[phase] = {'first_log': summary([s[0] for s in samples]), 'exit': summary([s[1] for s in samples])}
+    finally:
+        if bus:
+            bus.terminate()
+            bus.wait()
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline):
+    for role, phases in results.items():
+        for phase, metrics in phases.items():
+            for metric, stats in metrics.items():
+                before = baseline.get(role, {}).get(phase, {}).get(metric)
+                if not before:
+                    continue
+                change = (stats['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+                print(f"{role:8} {phase:5} {metric:9} {before['median_ms']:8.1f} ms -> {stats['median_ms']:8.1f} ms "
+                      f"({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dist', help='PyInstaller dist directory to measure instead of the sources')
+    parser.add_argument('--runs', type=int, default=10, help='warm runs per entry point')
+    parser.add_argument('--cold-runs', type=int, default=3, help='cold runs per entry point (0 to skip)')
+    parser.add_argument('--only', choices=sorted(PROGRAMS), help='measure one entry point')
+    parser.add_argument('--save', metavar='FILE', help='record the results in FILE under --label')
+    parser.add_argument('--label', default='current')
+    parser.add_argument('--compare', metavar='FILE', help='compare with the results recorded in FILE')
+    parser.add_argument('--against', default='onefile', help='label in the --compare file')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    server = CheckinServer()
+    results, commands = {}, {}
+    for role in ([args.only] if args.only else sorted(PROGRAMS, reverse=True)):
+        if args.dist:
+            commands[role] = find_program(args.dist, role)
+        else:
+            commands[role] = [sys.executable, os.path.join(HERE, '..', SOURCE_DIR, SCRIPTS[role])]
+        results[role] = bench(role, commands[role], args.runs, args.cold_runs, server)
+    server.server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for role, phases in results.items():
+            for phase, metrics in phases.items():
+                for metric, stats in metrics.items():
+                    print(f"{role:8} {phase:5} {metric:9} median {stats['median_ms']:8.1f} ms "
+                          f"(min {stats['min_ms']:.1f}, max {stats['max_ms']:.1f}, {stats['runs']} runs)")
+    if args.compare:
+        with open(args.compare) as f:
+            recorded = json.load(f)
+        if args.against not in recorded:
+            sys.exit(f"No results labelled {args.against!r} in {args.compare}")
+        compare(results, recorded[args.against]['results'])
+    if args.save:
+        try:
+            with open(args.save) as f:
+                recorded = json.load(f)
+        except (OSError, ValueError):
+            recorded = {}
+        recorded[args.label] = {
+            'recorded': date.today().isoformat(),
+            'platform': f"{platform.system()} {platform.release()} {platform.machine()}",
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'commands': {role: [os.path.basename(part) for part in command] for role, command in commands.items()},
+            'results': results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(recorded, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
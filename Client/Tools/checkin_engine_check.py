@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Try the asyncio check-in engine against a server, or check it against local stand-ins.
+
+    python checkin_engine_check.py probe https://server.example:3001/checkin
+    python checkin_engine_check.py selftest
+
+probe sends one check-in the way the tracker would (this machine's proxy
+settings, the given --timeout) and prints the reply and how long it took.
+
+selftest runs the engine against a local /checkin server, forward and
+SOCKS proxies and a server that never answers: a chunked reply, TLS
+direct and through a CONNECT tunnel, an unreachable or stalling first
+route overtaken by the next, a server name only the proxy can resolve,
+socks5h, the deadline, a proxy resolver that hangs (the attempt must
+still end at its deadline), replies with no length, one that ends with
+the connection and one that never ends, a probe that sends nothing,
+cancelling attempts hosted by an EngineThread (their connections must
+close), and EngineThread results handed back inside a select() loop, as
+the Linux monitor drives it. It finishes by running the Linux
+AttendanceTracker against a server that holds its first request: a
+suspend nudge must cancel it and the resume send it again. TLS needs
+openssl; the tracker scenario is Linux only.
+"""
+import argparse
+import json
+import os
+import selectors
+import shutil
+import signal
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKER = os.path.join(HERE, '..', 'Linux', 'AttendanceTracker.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'Common'))
+import async_checkin
+import proxy_resolver
+
+
+class StandIn:
+    """A TCP listener that runs handler(conn, server) per connection on its own thread."""
+
+    def __init__(self, handler, context=None):
+        self.handler = handler
+        self.context = context
+        self.requests = []
+        self.closed = threading.Event()
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            if self.context:
+                conn = self.context.wrap_socket(conn, server_side=True)
+            self.handler(conn, self)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+def read_request(conn):
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    head, _, body = data.partition(b'\r\n\r\n')
+    length = next((int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                   if line.lower().startswith(b'content-length:')), 0)
+    while len(body) < length:
+        body += conn.recv(65536)
+    return head.decode('latin-1'), body
+
+
+def checkin_handler(chunked=False, hold_first=False, unframed=False):
+    def handle(conn, server):
+        request = read_request(conn)
+        if request is None:
+            return
+        server.requests.append(request)
+        if hold_first and len(server.requests) == 1:
+            # Hold the reply until the client gives up on it
+            conn.settimeout(30)
+            if not conn.recv(1):
+                server.closed.set()
+            return
+        body = json.dumps({'valid_until': 0, 'echo': json.loads(request[1])}).encode()
+        if chunked:
+            middle = len(body) // 2
+            payload = b''.join(b'%x\r\n%s\r\n' % (len(part), part) for part in (body[:middle], body[middle:]))
+            conn.sendall(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nETag: "v1"\r\n\r\n' + payload + b'0\r\n\r\n')
+        elif unframed:
+            # No length and not chunked: the body ends when the connection does, and arrives in pieces
+            conn.sendall(b'HTTP/1.1 200 OK\r\nETag: "v1"\r\n\r\n' + body[:10])
+            time.sleep(0.2)
+            conn.sendall(body[10:])
+        else:
+            conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\nETag: "v1"\r\n\r\n' % len(body) + body)
+    return handle
+
+
+def silent_handler(conn, server):
+    # Accepts and reads, never answers; notes when the client hangs up
+    conn.settimeout(30)
+    while conn.recv(65536):
+        pass
+    server.closed.set()
+
+
+def flood_handler(conn, server):
+    # An unframed reply that never stops
+    read_request(conn)
+    conn.sendall(b'HTTP/1.1 200 OK\r\n\r\n')
+    while True:
+        conn.sendall(b'x' * 65536)
+
+
+def blackhole():
+    """A port whose connects hang: a listener with its backlog full, so SYNs are dropped."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    fillers = []
+    for _ in range(4):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(listener.getsockname())
+        fillers.append(sock)
+    return listener, fillers
+
+
+def pipe(a, b):
+    def copy(source, target):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+    thread = threading.Thread(target=copy, args=(b, a), daemon=True)
+    thread.start()
+    copy(a, b)
+    thread.join()
+
+
+def forward_proxy_handler(names):
+    """CONNECT tunnels and absolute-URI requests, resolving server names through names."""
+    def handle(conn, server):
+        request = read_request(conn)
+        if request is None:
+            return
+        head, body = request
+        server.requests.append(request)
+        method, target, _ = head.split('\r\n')[0].split(' ')
+        if method == 'CONNECT':
+            host, port = target.rsplit(':', 1)
+            upstream = socket.create_connection((names.get(host, host), int(port)))
+            conn.sendall(b'HTTP/1.1 200 Connection established\r\n\r\n')
+            pipe(conn, upstream)
+            upstream.close()
+            return
+        host_port = target.split('/')[2]
+        host, port = host_port.rsplit(':', 1)
+        upstream = socket.create_connection((names.get(host, host), int(port)))
+        path = '/' + target.split('/', 3)[3]
+        upstream.sendall(f"{method} {path} HTTP/1.1\r\n".encode() + head.split('\r\n', 1)[1].encode('latin-1')
+                         + b'\r\n\r\n' + body)
+        pipe(conn, upstream)
+        upstream.close()
+    return handle
+
+
+def socks_handler(names):
+    def handle(conn, server):
+        conn.recv(3)
+        conn.sendall(b'\x05\x00')
+        header = conn.recv(5)
+        name = conn.recv(header[4]).decode()
+        port = struct.unpack('>H', conn.recv(2))[0]
+        server.requests.append((name, port))
+        upstream = socket.create_connection((names.get(name, name), port))
+        conn.sendall(b'\x05\x00\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('>H', port))
+        pipe(conn, upstream)
+        upstream.close()
+    return handle
+
+
+def make_certificate(directory):
+    """A self-signed certificate for localhost, or None without openssl."""
+    openssl = shutil.which('openssl')
+    if not openssl:
+        return None
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    result = subprocess.run([openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                             '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                             '-keyout', key, '-out', cert], capture_output=True)
+    return (cert, key) if result.returncode == 0 else None
+
+
+def fixed_routes(*routes):
+    class Fixed:
+        def candidates(self, url):
+            return list(routes)
+
+        def invalidate(self):
+            pass
+    return Fixed()
+
+
+def hanging_resolver(seconds):
+    class Hanging:
+        def candidates(self, url):
+            # A PAC download or script that takes far longer than any deadline
+            time.sleep(seconds)
+            return [{}]
+
+        def invalidate(self):
+            pass
+    return Hanging()
+
+
+def attempt(engine, url, timeout=5):
+    return async_checkin.run(engine.attempt(url, {'hostname': 'selftest', 'user': 'selftest'}, timeout=timeout))
+
+
+def selftest_engine(directory):
+    server = StandIn(checkin_handler())
+    url = f'http://localhost:{server.port}/checkin'
+    response = attempt(async_checkin.CheckinEngine(fixed_routes({})), url)
+    yield 'direct', response.status_code == 200 and response.json()['echo']['user'] == 'selftest' \
+        and response.headers.get('etag') == '"v1"'
+
+    chunked = StandIn(checkin_handler(chunked=True))
+    response = attempt(async_checkin.CheckinEngine(fixed_routes({})), f'http://127.0.0.1:{chunked.port}/checkin')
+    yield 'chunked reply', response.status_code == 200 and response.json()['echo']['hostname'] == 'selftest'
+
+    certificate = make_certificate(directory)
+    if certificate:
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(*certificate)
+        tls = StandIn(checkin_handler(), server_context)
+        client_context = ssl.create_default_context(cafile=certificate[0])
+        tls_url = f'https://localhost:{tls.port}/checkin'
+        response = attempt(async_checkin.CheckinEngine(fixed_routes({}), client_context), tls_url)
+        yield 'TLS direct', response.status_code == 200
+        proxy = StandIn(forward_proxy_handler({}))
+        route = {'http': f'http://127.0.0.1:{proxy.port}', 'https': f'http://127.0.0.1:{proxy.port}'}
+        response = attempt(async_checkin.CheckinEngine(fixed_routes(route), client_context), tls_url)
+        yield 'TLS through a CONNECT tunnel', response.status_code == 200 \
+            and proxy.requests[-1][0].startswith(f'CONNECT localhost:{tls.port}')
+        stalled = StandIn(silent_handler)
+        stalled_route = {'https': f'http://127.0.0.1:{stalled.port}'}
+        started = time.monotonic()
+        response = attempt(async_checkin.CheckinEngine(fixed_routes(stalled_route, route), client_context), tls_url)
+        took = time.monotonic() - started
+        yield f'proxy stalling on CONNECT overtaken by the next route ({took:.2f}s)', \
+            response.status_code == 200 and took < 2 and stalled.closed.wait(5)
+        stalled.close()
+        try:
+            attempt(async_checkin.CheckinEngine(fixed_routes({})), tls_url)
+            rejected = False
+        except async_checkin.CheckinError:
+            rejected = True
+        yield 'TLS to an untrusted certificate refused', rejected
+    else:
+        print("Skipping TLS scenarios, no openssl to make a certificate")
+
+    listener, fillers = blackhole()
+    dead_route = {'http': f'http://127.0.0.1:{listener.getsockname()[1]}'}
+    proxy = StandIn(forward_proxy_handler({'checkin.invalid': '127.0.0.1'}))
+    route = {'http': f'http://127.0.0.1:{proxy.port}', 'https': f'http://127.0.0.1:{proxy.port}'}
+    engine = async_checkin.CheckinEngine(fixed_routes(dead_route, route))
+    started = time.monotonic()
+    response = attempt(engine, f'http://checkin.invalid:{server.port}/checkin')
+    took = time.monotonic() - started
+    for sock in [listener] + fillers:
+        sock.close()
+    yield f'unreachable first route overtaken by the next ({took:.2f}s)', response.status_code == 200 and took < 2
+    yield 'server name only the proxy can resolve', \
+        proxy.requests[-1][0].startswith(f'POST http://checkin.invalid:{server.port}/checkin')
+
+    socks = StandIn(socks_handler({'checkin.invalid': '127.0.0.1'}))
+    engine = async_checkin.CheckinEngine(fixed_routes({'http': f'socks5h://127.0.0.1:{socks.port}'}))
+    response = attempt(engine, f'http://checkin.invalid:{server.port}/checkin')
+    yield 'socks5h', response.status_code == 200 and socks.requests == [('checkin.invalid', server.port)]
+
+    silent = StandIn(silent_handler)
+    started = time.monotonic()
+    try:
+        attempt(async_checkin.CheckinEngine(fixed_routes({})), f'http://127.0.0.1:{silent.port}/checkin', timeout=1)
+        timed_out = False
+    except async_checkin.CheckinError:
+        timed_out = True
+    took = time.monotonic() - started
+    yield f'one deadline for the whole attempt ({took:.2f}s)', timed_out and 0.9 < took < 2 and silent.closed.wait(5)
+
+    started = time.monotonic()
+    try:
+        attempt(async_checkin.CheckinEngine(hanging_resolver(30)), url, timeout=1)
+        timed_out = False
+    except async_checkin.CheckinError:
+        timed_out = True
+    took = time.monotonic() - started
+    yield f'a resolver that hangs holds up neither the deadline nor run() ({took:.2f}s)', timed_out and took < 2
+
+    unframed = StandIn(checkin_handler(unframed=True))
+    response = attempt(async_checkin.CheckinEngine(fixed_routes({})), f'http://127.0.0.1:{unframed.port}/checkin')
+    try:
+        whole = response.json()['echo']['user'] == 'selftest'
+    except ValueError:
+        whole = False
+    yield 'reply without a length read to the end of the connection', response.status_code == 200 and whole
+
+    flood = StandIn(flood_handler)
+    try:
+        attempt(async_checkin.CheckinEngine(fixed_routes({})), f'http://127.0.0.1:{flood.port}/checkin')
+        refused = False
+    except async_checkin.CheckinError as e:
+        refused = 'too large' in str(e)
+    yield 'endless reply without a length refused', refused
+
+    sent = len(server.requests), len(proxy.requests)
+    via = async_checkin.run(async_checkin.CheckinEngine(fixed_routes(route)).probe(url, timeout=5))
+    yield 'probe reaches the server without sending a check-in', \
+        via == f'http://127.0.0.1:{proxy.port}' and (len(server.requests), len(proxy.requests)) == sent
+
+    host = async_checkin.EngineThread()
+    silent = StandIn(silent_handler)
+    engine = async_checkin.CheckinEngine(fixed_routes({}))
+    futures = [host.submit(engine.attempt(f'http://127.0.0.1:{silent.port}/checkin', {}, timeout=30))
+               for _ in range(3)]
+    time.sleep(0.5)
+    started = time.monotonic()
+    host.cancel_all()
+    cancelled = all(future.cancelled() for future in futures) and silent.closed.wait(5)
+    took = time.monotonic() - started
+    host.close()
+    yield f'EngineThread cancels its attempts (connections closed in {took:.2f}s)', \
+        cancelled and not host.thread.is_alive()
+
+    host = async_checkin.EngineThread()
+    selector = selectors.DefaultSelector()
+    selector.register(host, selectors.EVENT_READ)
+    results = []
+    for _ in range(2):
+        host.submit(engine.attempt(url, {'user': 'embedded'}, timeout=5),
+                    lambda future: results.append((threading.get_ident(), future.result().status_code)))
+    deadline = time.monotonic() + 10
+    while len(results) < 2 and time.monotonic() < deadline:
+        if selector.select(1):
+            host.handle_ready()
+    selector.close()
+    host.close()
+    yield 'EngineThread results handled in a select() loop', \
+        results == [(threading.get_ident(), 200)] * 2
+
+    for stand_in in (server, chunked, proxy, socks, silent, unframed, flood):
+        stand_in.close()
+
+
+def selftest_tracker(directory):
+    server = StandIn(checkin_handler(hold_first=True))
+    logs = os.path.join(directory, 'AttendanceTracker', 'Logs')
+    os.makedirs(logs)
+    with open(os.path.join(logs, 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': f'http://127.0.0.1:{server.port}', 'timeout_seconds': 60, 'max_retry_attempts': 2,
+                       'retry_delay_seconds': 60},
+            'application': {'startup_delay_seconds': 0},
+        }, f)
+    tracker = subprocess.Popen([sys.executable, TRACKER], env=dict(os.environ, XDG_DATA_HOME=directory),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while not server.requests and time.monotonic() < deadline:
+            time.sleep(0.05)
+        started = time.monotonic()
+        tracker.send_signal(signal.SIGUSR2)
+        dropped = server.closed.wait(5)
+        tracker.send_signal(signal.SIGUSR1)
+        code = tracker.wait(30)
+    finally:
+        if tracker.poll() is None:
+            tracker.kill()
+        server.close()
+    with open(os.path.join(logs, 'outputat.log')) as f:
+        log = f.read()
+    yield f'suspend cancels the request, resume sends it again ({time.monotonic() - started:.2f}s)', \
+        dropped and code == 0 and len(server.requests) == 2 and 'cancelled for suspend' in log
+
+
+def selftest():
+    directory = tempfile.mkdtemp(prefix='checkin-engine-check-')
+    failures = total = 0
+    try:
+        scenarios = [selftest_engine(directory)]
+        if sys.platform.startswith('linux'):
+            scenarios.append(selftest_tracker(os.path.join(directory, 'tracker')))
+        for scenario in scenarios:
+            for name, ok in scenario:
+                total += 1
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios failed")
+
+
+def probe(url, timeout):
+    engine = async_checkin.CheckinEngine(proxy_resolver.ProxyResolver())
+    started = time.monotonic()
+    try:
+        response = async_checkin.run(engine.attempt(url, {'hostname': socket.gethostname().split('.')[0],
+                                                          'client_time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                                          'version': 'probe', 'user': 'probe'}, timeout=timeout))
+    except async_checkin.CheckinError as e:
+        sys.exit(f"No reply after {time.monotonic() - started:.2f}s: {e}")
+    print(f"{response.status_code} after {time.monotonic() - started:.2f}s")
+    for name, value in response.headers.items():
+        print(f"{name}: {value}")
+    if response.content:
+        print(response.content.decode('utf-8', errors='replace'))
+
+
+def main():
+    import logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    probe_parser = sub.add_parser('probe', help='send one check-in and print the reply')
+    probe_parser.add_argument('url')
+    probe_parser.add_argument('--timeout', type=float, default=30)
+    sub.add_parser('selftest', help='run the engine against local stand-ins')
+    args = parser.parse_args()
+
+    if args.command == 'selftest':
+        logging.getLogger().setLevel(logging.WARNING)
+        selftest()
+    else:
+        probe(args.url, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
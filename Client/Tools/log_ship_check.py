@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Check the log shipper against a local stand-in collector.
+
+    python log_ship_check.py selftest
+    python log_ship_check.py collector --port 8099
+
+selftest writes logs into a temporary directory and runs LogShipper passes
+against a local collector, checking after each scenario that every line
+arrived exactly once and in order: first pass, a partial last line, a
+rotation to .1, truncation in place, the per-pass byte budget, the
+bandwidth cap, and backoff while the collector answers 503. It checks that
+ship_logs() lowers only the shipping thread's priority, leaving the caller
+as it was, and finishes by running the Linux AttendanceTracker with a "logs"
+section and checking its own log reached the collector. The priority and
+tracker scenarios are Linux only.
+
+collector just runs the stand-in and prints each batch it receives, for
+trying a real client against.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKER = os.path.join(HERE, '..', 'Linux', 'AttendanceTracker.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'Common'))
+import log_shipper
+
+SETTINGS = {'batch_kb': 4, 'max_kb_per_run': 1024, 'max_kbps': 1024, 'max_seconds': 30}
+
+
+class Collector:
+    """Stand-in collector: keeps the batches it accepted, or answers `status` while that is set."""
+
+    def __init__(self, port=0, echo=False):
+        self.batches = []
+        self.status = 200
+        self.wire_bytes = 0
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if collector.status != 200:
+                    self.send_response(collector.status)
+                    self.send_header('Retry-After', '120')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                batch = json.loads(data)
+                collector.batches.append(batch)
+                collector.wire_bytes += int(self.headers.get('Content-Length', 0))
+                if echo:
+                    print(f"{batch.get('host')}/{batch.get('user')} {batch['file']} inode {batch['inode']}.{batch['generation']} "
+                          f"[{batch['offset']}, {batch['end']}): {len(batch['lines'])} line(s)", flush=True)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/logs'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def lines(self, name):
+        """Lines of one log as the collector would rebuild them, dropping resent batches."""
+        seen, lines = set(), []
+        for batch in self.batches:
+            key = (batch['file'], batch['inode'], batch['generation'], batch['offset'])
+            if batch['file'] == name and key not in seen:
+                seen.add(key)
+                lines.extend(batch['lines'])
+        return lines
+
+
+def post_to(url):
+    import urllib.request
+
+    class Response:
+        def __init__(self, status, headers):
+            self.status_code = status
+            self.headers = headers
+
+    def post(data, headers):
+        request = urllib.request.Request(url, data=data, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return Response(response.status, response.headers)
+        except urllib.error.HTTPError as e:
+            return Response(e.code, e.headers)
+    return post
+
+
+def append(path, count, start, tail=''):
+    with open(path, 'a') as f:
+        f.writelines(f"line {i} {'x' * (i % 50)}\n" for i in range(start, start + count))
+        f.write(tail)
+    return [f"line {i} {'x' * (i % 50)}" for i in range(start, start + count)]
+
+
+def selftest_shipper(collector, directory):
+    log = os.path.join(directory, 'outputat.log')
+    state = os.path.join(directory, 'log_shipper.json')
+    sleeps = []
+
+    def shipper(**overrides):
+        return log_shipper.LogShipper([log], state, post_to(collector.url), dict(SETTINGS, **overrides),
+                                      source={'host': 'selftest', 'user': 'selftest'}, sleep=sleeps.append)
+
+    expected = append(log, 500, 0)
+    shipper().ship()
+    yield 'first pass', collector.lines('outputat.log') == expected
+
+    expected += append(log, 10, 500, tail='partial')
+    shipper().ship()
+    held_back = collector.lines('outputat.log') == expected
+    with open(log, 'a') as f:
+        f.write(' line\n')
+    expected.append('partial line')
+    shipper().ship()
+    yield 'partial last line held back', held_back and collector.lines('outputat.log') == expected
+
+    expected += append(log, 50, 510)
+    os.replace(log, log + '.1')
+    expected += append(log, 50, 560)
+    shipper().ship()
+    yield 'rotation to .1', collector.lines('outputat.log') == expected
+
+    with open(log, 'w') as f:
+        f.write('')
+    expected += append(log, 20, 610)
+    shipper().ship()
+    yield 'truncated in place', collector.lines('outputat.log') == expected
+
+    expected += append(log, 400, 630)
+    passes = 0
+    while collector.lines('outputat.log') != expected and passes < 50:
+        passes += 1
+        shipped = shipper(max_kb_per_run=2).ship()
+        if shipped > 2 * 1024:
+            break
+    yield f'2 KB budget per pass ({passes} passes)', collector.lines('outputat.log') == expected and passes > 1
+
+    del sleeps[:]
+    wire_before = collector.wire_bytes
+    expected += append(log, 2000, 1030)
+    shipper(max_kbps=8).ship()
+    spacing = sum(sleeps)
+    wanted = (collector.wire_bytes - wire_before) / (8 * 1024)
+    yield f'bandwidth cap (waited {spacing:.2f}s for {wanted:.2f}s)', \
+        collector.lines('outputat.log') == expected and spacing >= wanted * 0.9
+
+    collector.status = 503
+    expected += append(log, 10, 3030)
+    failed = shipper().ship() == 0
+    collector.status = 200
+    skipped = shipper().ship() == 0
+    with open(state) as f:
+        saved = json.load(f)
+    saved['next_attempt'] = 0
+    with open(state, 'w') as f:
+        json.dump(saved, f)
+    shipper().ship()
+    yield 'backoff on 503', failed and skipped and collector.lines('outputat.log') == expected
+
+
+def selftest_priority(collector, directory):
+    os.makedirs(directory)
+    log = os.path.join(directory, 'priority.log')
+    expected = append(log, 20, 0)
+    before = os.getpriority(os.PRIO_PROCESS, 0)
+    shipping = []
+    post = post_to(collector.url)
+
+    def niced_post(data, headers):
+        shipping.append(os.getpriority(os.PRIO_PROCESS, threading.get_native_id()))
+        return post(data, headers)
+
+    log_shipper.ship_logs(SETTINGS, [log], directory, niced_post, source={'host': 'selftest', 'user': 'selftest'})
+    after = os.getpriority(os.PRIO_PROCESS, 0)
+    yield f'only the shipping thread is lowered (nice {before} -> {shipping[:1]}, caller {after})', \
+        collector.lines('priority.log') == expected and shipping and shipping[0] > before and after == before
+
+
+def selftest_tracker(collector, directory):
+    logs = os.path.join(directory, 'AttendanceTracker', 'Logs')
+    os.makedirs(logs)
+    with open(os.path.join(logs, 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': 'http://127.0.0.1:9', 'timeout_seconds': 2, 'max_retry_attempts': 1,
+                       'retry_delay_seconds': 1},
+            'application': {'startup_delay_seconds': 0},
+            'logs': {'collector_url': collector.url},
+        }, f)
+    subprocess.run([sys.executable, TRACKER], env=dict(os.environ, XDG_DATA_HOME=directory),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    lines = collector.lines('outputat.log')
+    yield 'tracker ships its own log', any('Check-in outcome: failed' in line for line in lines)
+
+
+def selftest():
+    collector = Collector().start()
+    directory = tempfile.mkdtemp(prefix='log-ship-check-')
+    failures = total = 0
+    try:
+        scenarios = [selftest_shipper(collector, directory)]
+        if sys.platform.startswith('linux'):
+            scenarios.append(selftest_priority(collector, os.path.join(directory, 'priority')))
+            scenarios.append(selftest_tracker(collector, os.path.join(directory, 'tracker')))
+        for scenario in scenarios:
+            for name, ok in scenario:
+                total += 1
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    finally:
+        collector.server.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('selftest', help='run the shipper against a local collector')
+    collector = sub.add_parser('collector', help='run the stand-in collector and print what arrives')
+    collector.add_argument('--port', type=int, default=8099)
+    args = parser.parse_args()
+
+    if args.command == 'selftest':
+        selftest()
+        return
+    server = Collector(args.port, echo=True)
+    print(f"Collecting on {server.url}", flush=True)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
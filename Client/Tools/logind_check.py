@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""Check the Linux power monitor against a stand-in logind on a private bus.
+
+    python logind_check.py selftest
+
+selftest starts a private dbus-daemon, exports a fake
+org.freedesktop.login1 Manager and its Sessions on it, and runs
+Linux/power_monitor.py against that bus with a stand-in
+AttendanceTracker that only counts its launches. It then emits logind
+signals and checks, through the monitor's control endpoint, the decision
+taken for each and how many trackers were started: startup,
+PrepareForSleep(true) and (false), with the sleep delay lock let go for
+the first and taken again after the second, Lock and Unlock of its own
+session, SessionNew for a second session of the same user, and
+Lock/Unlock/SessionNew from another user's session and a greeter, which
+must not reach the core at all. It also has the monitor probe a stand-in
+server through the check-in engine its select() loop hosts, and checks
+that the probe sent nothing.
+
+Run as root, it then runs the monitor machine-wide, with the programs in
+a scratch install directory, for two system accounts that stand in for
+logged-in users. It checks that each user's tracker is started as that
+user from the shared directory, that a greeter is ignored, and that a
+broken config.json stops launches with the error reported per user.
+
+The debounce window keeps launches at least five seconds apart, so a run
+takes about fifteen seconds, twenty-five as root. Linux only; needs
+dbus-daemon and jeepney.
+"""
+import argparse
+import json
+import os
+import pwd
+import select
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from jeepney import DBusAddress, HeaderFields, MessageType, message_bus, new_method_return, new_signal
+from jeepney.io.blocking import open_dbus_connection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MONITOR = os.path.join(HERE, '..', 'Linux', 'power_monitor.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'Common'))
+import control_endpoint
+from bench_idle import start_private_bus
+
+LOGIN1 = 'org.freedesktop.login1'
+MANAGER = DBusAddress('/org/freedesktop/login1', interface='org.freedesktop.login1.Manager')
+SESSION_INTERFACE = 'org.freedesktop.login1.Session'
+# Longer than the launch policy's five second debounce
+DEBOUNCE = 5.5
+TIMEOUT = 10
+
+
+class FakeLogind:
+    """Owns org.freedesktop.login1 on a bus and answers the calls the monitor makes.
+
+    sessions maps a session id to (uid, user name, class); listed() is what
+    ListSessions returns, so a session can exist before it is announced.
+    Inhibit hands out the write end of a pipe and keeps the read end, which
+    reads as closed once the caller has let its lock go.
+    """
+
+    def __init__(self, address, sessions, listed):
+        self.sessions = sessions
+        self.listed = listed
+        self.calls = []
+        self.inhibitors = []
+        self.conn = open_dbus_connection(bus=address, enable_fds=True)
+        self.conn.send_and_get_reply(message_bus.RequestName(LOGIN1))
+        self.send_lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def path(session_id):
+        return f'/org/freedesktop/login1/session/_3{session_id}'
+
+    def _send(self, msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def _serve(self):
+        while self.running:
+            try:
+                msg = self.conn.receive(timeout=0.2)
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            if msg.header.message_type != MessageType.method_call:
+                continue
+            member = msg.header.fields.get(HeaderFields.member)
+            path = msg.header.fields.get(HeaderFields.path)
+            self.calls.append((member, path))
+            if member == 'ListSessions':
+                listed = [(session_id, *self.sessions[session_id][:2], 'seat0', self.path(session_id))
+                          for session_id in self.listed]
+                self._send(new_method_return(msg, 'a(susso)', (listed,)))
+            elif member == 'GetAll':
+                session_id = path.rsplit('_3', 1)[1]
+                uid, user, kind = self.sessions[session_id]
+                props = {'User': ('(uo)', (uid, f'/org/freedesktop/login1/user/_{uid}')),
+                         'Name': ('s', user), 'Class': ('s', kind), 'LockedHint': ('b', False)}
+                self._send(new_method_return(msg, 'a{sv}', (props,)))
+            elif member == 'Inhibit':
+                read_end, write_end = os.pipe()
+                self.inhibitors.append((msg.body, read_end))
+                self._send(new_method_return(msg, 'h', (write_end,)))
+                os.close(write_end)
+
+    def held(self):
+        """How many of the locks handed out are still held."""
+        return sum(not select.select([fd], [], [], 0)[0] for _, fd in self.inhibitors)
+
+    def prepare_for_sleep(self, sleeping):
+        self._send(new_signal(MANAGER, 'PrepareForSleep', 'b', (sleeping,)))
+
+    def session_new(self, session_id):
+        self._send(new_signal(MANAGER, 'SessionNew', 'so', (session_id, self.path(session_id))))
+
+    def session_signal(self, session_id, member):
+        self._send(new_signal(DBusAddress(self.path(session_id), interface=SESSION_INTERFACE), member))
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.conn.close()
+        for _, fd in self.inhibitors:
+            os.close(fd)
+
+
+class Monitor:
+    """power_monitor.py run in a scratch data directory against the fake logind.
+
+    Machine-wide, the programs and config.json go to a shared install
+    directory and the monitor's own files to a state directory beside it.
+    """
+
+    def __init__(self, directory, bus_address, machine_wide=False):
+        self.app_support = os.path.join(directory, 'AttendanceTracker')
+        os.makedirs(self.app_support)
+        self.state_dir = os.path.join(directory, 'state') if machine_wide else self.app_support
+        self.write_config({'server': {'url': 'http://127.0.0.1:9'}})
+        self.launch_log = os.path.join(directory, 'launches')
+        tracker = os.path.join(self.app_support, 'AttendanceTracker')
+        with open(tracker, 'w') as f:
+            f.write(f'#!/bin/sh\necho "$(id -un)" >> {self.launch_log}\n')
+        os.chmod(tracker, 0o755)
+        env = dict(os.environ, XDG_DATA_HOME=directory, POWER_MONITOR_LOGIND_BUS=bus_address,
+                   POWER_MONITOR_MACHINE_LOCK=os.path.join(directory, 'machine.lock'),
+                   POWER_MONITOR_MACHINE_WIDE='1' if machine_wide else '0')
+        if machine_wide:
+            # The trackers run as the stand-in users, who must reach the program and the launch log
+            os.chmod(directory, 0o755)
+            with open(self.launch_log, 'w'):
+                pass
+            os.chmod(self.launch_log, 0o666)
+            env.update(POWER_MONITOR_INSTALL_DIR=self.app_support, POWER_MONITOR_STATE_DIR=self.state_dir)
+        self.process = subprocess.Popen([sys.executable, MONITOR], env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def write_config(self, config):
+        with open(os.path.join(self.app_support, 'config.json'), 'w') as f:
+            json.dump(config, f)
+
+    def query(self, cmd, **fields):
+        return control_endpoint.request(control_endpoint.default_address(self.state_dir), {'cmd': cmd, **fields})
+
+    def wait_for_probe(self, previous=None):
+        """last_probe from status once it differs from previous, or None."""
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            probe = self.query('status')['last_probe']
+            if probe is not None and probe != previous:
+                return probe
+            time.sleep(0.05)
+        return None
+
+    def events(self):
+        try:
+            return sum(self.query('metrics')['events'].values())
+        except (OSError, ValueError):
+            return 0
+
+    def wait_for_events(self, count):
+        """The monitor's status once it has handled count events in all, or None."""
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return None
+            if self.events() >= count:
+                return self.query('status')
+            time.sleep(0.05)
+        return None
+
+    def launches(self):
+        # The stand-in tracker writes its line after it has been started, so give it a moment
+        time.sleep(0.2)
+        try:
+            with open(self.launch_log) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Listener:
+    """A check-in server stand-in that records what each connection sent before closing."""
+
+    def __init__(self):
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.received = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(TIMEOUT)
+                data = b''
+                try:
+                    chunk = conn.recv(4096)
+                    while chunk:
+                        data += chunk
+                        chunk = conn.recv(4096)
+                except OSError:
+                    pass
+                self.received.append(data)
+
+    def close(self):
+        # close() alone leaves the port listening while accept() is blocked on it
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+def step(monitor, count, emit):
+    """Emit signals and return (status, events handled) once the monitor has handled count events."""
+    before = monitor.events()
+    emit()
+    status = monitor.wait_for_events(before + count)
+    return status, monitor.events() - before
+
+
+def decided(status, event, decision):
+    return status is not None and status['last_event'] == event and status['last_decision'] == decision
+
+
+def selftest_per_user(directory, bus_address):
+    me = pwd.getpwuid(os.getuid()).pw_name
+    sessions = {'1': (os.getuid(), me, 'user'), '2': (os.getuid() + 4242, 'someone', 'user'),
+                '3': (os.getuid(), me, 'user'), '4': (os.getuid(), me, 'greeter')}
+    logind = FakeLogind(bus_address, sessions, listed=['1', '2'])
+    # As root the monitor would serve every user; this run checks the per-user one
+    monitor = Monitor(directory, bus_address)
+    try:
+        status = monitor.wait_for_events(1)
+        yield 'startup launches the tracker', decided(status, 'startup', 'launch') and monitor.launches() == [me]
+        looked_up = {path for member, path in logind.calls if member == 'GetAll'}
+        yield 'only listed sessions of its own user are looked up', looked_up == {FakeLogind.path('1')}
+        yield 'a sleep delay lock is taken at startup', \
+            logind.held() == 1 and logind.inhibitors[0][0][0] == 'sleep' and logind.inhibitors[0][0][3] == 'delay'
+
+        status, handled = step(monitor, 1, lambda: logind.prepare_for_sleep(True))
+        yield 'PrepareForSleep(true) is a suspend, and the delay lock is let go', \
+            decided(status, 'suspend', 'ignore') and handled == 1 and logind.held() == 0
+
+        status, handled = step(monitor, 1, lambda: logind.prepare_for_sleep(False))
+        yield 'wake inside the debounce window is skipped, and the delay lock taken again', \
+            decided(status, 'wake', 'skip_recent') and logind.held() == 1 and len(logind.inhibitors) == 2
+
+        time.sleep(DEBOUNCE)
+        status, handled = step(monitor, 1, lambda: logind.prepare_for_sleep(False))
+        yield 'PrepareForSleep(false) launches', decided(status, 'wake', 'launch') and len(monitor.launches()) == 2
+
+        # Each foreign signal is followed by one of ours, so the count shows whether it got through
+        status, handled = step(monitor, 1, lambda: (logind.session_signal('2', 'Unlock'),
+                                                    logind.session_signal('1', 'Lock')))
+        yield "another user's Unlock is ignored", decided(status, 'lock', 'ignore') and handled == 1
+
+        status, handled = step(monitor, 1, lambda: (logind.session_signal('4', 'Unlock'),
+                                                    logind.session_signal('1', 'Unlock')))
+        yield 'Unlock of its own session is handled, not the greeter', \
+            decided(status, 'unlock', 'skip_recent') and handled == 1
+
+        time.sleep(DEBOUNCE)
+        status, handled = step(monitor, 1, lambda: (logind.session_new('2'), logind.session_new('4'),
+                                                    logind.session_new('3')))
+        yield 'SessionNew of its own user launches, not the others', \
+            decided(status, 'logon', 'launch') and handled == 1 and len(monitor.launches()) == 3
+
+        status, handled = step(monitor, 1, lambda: (logind.session_signal('2', 'Lock'),
+                                                    logind.session_signal('3', 'Lock')))
+        yield 'Lock of the new session is tracked', decided(status, 'lock', 'ignore') and handled == 1
+
+        server = Listener()
+        monitor.write_config({'server': {'url': f'http://127.0.0.1:{server.port}'}})
+        reply = monitor.query('probe')
+        probe = monitor.wait_for_probe()
+        server.close()
+        yield 'probe runs on the engine the select() loop hosts and sends nothing', \
+            reply.get('probing') == f'http://127.0.0.1:{server.port}/checkin' and probe is not None \
+            and 'via' in probe and server.received == [b'']
+
+        # Closed now, so the same address refuses
+        monitor.query('probe')
+        failed = monitor.wait_for_probe(probe)
+        yield 'probe of a server that refuses is reported', failed is not None and 'error' in failed
+
+        metrics = monitor.query('metrics')
+        yield f"three launches in all ({metrics['launches']})", \
+            metrics['launches'] == 3 and monitor.launches() == [me] * 3 and metrics['launch_failures'] == 0
+    finally:
+        monitor.stop()
+        logind.close()
+
+
+def selftest_machine_wide(directory, bus_address):
+    # System accounts with a home to start in stand in for logged-in users; none has a config.json
+    # of its own, so theirs is the one installed beside the shared program
+    users = [pwd.getpwnam(name) for name in ('daemon', 'bin')]
+    sessions = {'11': (users[0].pw_uid, users[0].pw_name, 'user'), '12': (users[1].pw_uid, users[1].pw_name, 'user'),
+                '13': (0, 'root', 'greeter')}
+    logind = FakeLogind(bus_address, sessions, listed=['11', '12', '13'])
+    monitor = Monitor(directory, bus_address, machine_wide=True)
+    names = sorted(user.pw_name for user in users)
+    try:
+        status = monitor.wait_for_events(1)
+        yield "machine-wide startup starts each user's tracker as that user from the shared directory", \
+            decided(status, 'startup', 'launch') and sorted(monitor.launches()) == names
+        yield 'the greeter session is not tracked', \
+            status is not None and status['sessions']['users'] == {name: 1 for name in names}
+
+        time.sleep(DEBOUNCE)
+        monitor.write_config({'server': {}})
+        status, handled = step(monitor, 1, lambda: (logind.session_signal('13', 'Unlock'),
+                                                    logind.session_signal('11', 'Unlock')))
+        yield "a broken config.json stops the launch and is reported for the user", \
+            decided(status, 'unlock', 'skip_bad_config') and handled == 1 \
+            and status['users'][users[0].pw_name]['config_error'] is not None
+
+        monitor.write_config({'server': {'url': 'http://127.0.0.1:9', 'timeout_seconds': 5}})
+        status, handled = step(monitor, 1, lambda: logind.prepare_for_sleep(False))
+        yield 'once it is fixed, a wake starts every user\'s tracker again', \
+            decided(status, 'wake', 'launch') and sorted(monitor.launches()) == sorted(names * 2) \
+            and status['users'][users[0].pw_name]['config_error'] is None
+    finally:
+        monitor.stop()
+        logind.close()
+
+
+def selftest():
+    bus, address = start_private_bus()
+    directory = tempfile.mkdtemp(prefix='logind-check-')
+    scenarios = [selftest_per_user(os.path.join(directory, 'per-user'), address)]
+    if os.geteuid() == 0:
+        os.chmod(directory, 0o755)
+        scenarios.append(selftest_machine_wide(os.path.join(directory, 'machine-wide'), address))
+    failures = total = 0
+    try:
+        for scenario in scenarios:
+            for name, ok in scenario:
+                total += 1
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}", flush=True)
+    finally:
+        bus.terminate()
+        bus.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('selftest', help='run the monitor against a fake logind on a private bus')
+    parser.parse_args()
+    selftest()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Query or drive a running power monitor through its control endpoint.
+
+    python monitorctl.py status
+    python monitorctl.py metrics
+    python monitorctl.py trigger
+    python monitorctl.py reload
+    python monitorctl.py update
+    python monitorctl.py probe [--user name]
+    python monitorctl.py --address /path/to/power_monitor.sock status
+
+The address defaults to the current user's monitor: power_monitor.sock in
+the app-support directory on macOS and Linux, a named pipe on Windows.
+update asks the monitor to swap in an update already staged by a tracker.
+probe has the monitor reach the check-in server the way a tracker would,
+without checking in; status shows how it went as last_probe. A
+machine-wide monitor probes with the config of the --user given.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import control_endpoint
+
+
+def default_app_support():
+    if sys.platform == 'win32':
+        return os.path.join(os.environ.get('APPDATA', ''), 'AttendanceTracker')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Application Support/AttendanceTracker')
+    return os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'AttendanceTracker')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'metrics', 'trigger', 'reload', 'update', 'probe'])
+    parser.add_argument('--address', help='control socket path or pipe name')
+    parser.add_argument('--user', help='whose config a machine-wide monitor probes with')
+    args = parser.parse_args()
+
+    address = args.address or control_endpoint.default_address(default_app_support())
+    request = {'cmd': args.command}
+    if args.user:
+        request['user'] = args.user
+    try:
+        reply = control_endpoint.request(address, request)
+    except OSError as e:
+        sys.exit(f"No power monitor answering on {address}: {e}")
+    print(json.dumps(reply, indent=2))
+    if not reply.get('ok'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
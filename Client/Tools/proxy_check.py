@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Show how the check-in would be routed, or verify proxy routing end to end.
+
+    python proxy_check.py resolve https://server.example:3001/checkin
+    python proxy_check.py resolve http://server:3001 --pac proxy.pac
+    python proxy_check.py selftest
+
+resolve prints the routes ProxyResolver picks for a URL on this machine
+(config.json-style --pac/--proxy/--bypass override the system settings).
+
+selftest first resolves hosts through a PAC file written the way
+corporate ones are (arrays, for and switch, regex literals, split,
+weekdayRange/timeRange/dateRange) and checks the routes, and that a PAC
+file the interpreter cannot run is reported as a fallback, not a route.
+Next it serves a PAC file over http and checks the on-disk cache: a
+second resolver neither fetches nor parses it, time-dependent routes are
+not kept, an expired entry is revalidated with its ETag, and invalidate()
+forces a fresh fetch.
+It then runs the Linux AttendanceTracker against a local /checkin server,
+a stand-in forward proxy and a local PAC file, and checks each scenario
+reached the server over the expected route: PAC proxy with a dead first
+choice, PAC DIRECT, environment proxy, and a config bypass. Linux only.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKER = os.path.join(HERE, '..', 'Linux', 'AttendanceTracker.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'Common'))
+import proxy_resolver
+
+
+def serve(handler_class):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_checkin_server():
+    hits = {'count': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            hits['count'] += 1
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler), hits
+
+
+def start_proxy():
+    """A forward proxy that relays absolute-URI POSTs and counts them."""
+    hits = {'count': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            target = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            hits['count'] += 1
+            upstream = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=10)
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in ('proxy-connection', 'connection')}
+            upstream.request('POST', target.path or '/', body=body, headers=headers)
+            response = upstream.getresponse()
+            data = response.read()
+            self.send_response(response.status)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            upstream.close()
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler), hits
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_tracker(data_home, server_url, proxy, env):
+    logs = os.path.join(data_home, 'AttendanceTracker', 'Logs')
+    for name in ('last_success.txt', 'lease.json'):
+        try:
+            os.remove(os.path.join(logs, name))
+        except FileNotFoundError:
+            pass
+    with open(os.path.join(logs, 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': server_url, 'timeout_seconds': 5, 'max_retry_attempts': 1, 'retry_delay_seconds': 1},
+            'application': {'startup_delay_seconds': 0},
+            'proxy': proxy,
+        }, f)
+    clean = {k: v for k, v in os.environ.items() if not k.lower().endswith('_proxy')}
+    return subprocess.run([sys.executable, TRACKER], env=dict(clean, XDG_DATA_HOME=data_home, **env),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+
+# Every construct the PAC interpreter once rejected, in the shape corporate PAC files use them
+PAC_SCRIPT = r'''
+var DIRECT_SUFFIXES = [".internal", ".corp.example"];
+var OFFICE = /^(hq|branch\d+)\.example\.com$/i;
+
+function isDirect(host) {
+    for (var i = 0; i < DIRECT_SUFFIXES.length; i++) {
+        if (dnsDomainIs(host, DIRECT_SUFFIXES[i])) return true;
+    }
+    return false;
+}
+
+function FindProxyForURL(url, host) {
+    if (isPlainHostName(host) || isDirect(host)) return "DIRECT";
+    if (OFFICE.test(host)) return "PROXY office:8080";
+    var labels = host.split(".");
+    switch (labels[labels.length - 1]) {
+        case "test":
+            return "PROXY lab:3128; DIRECT";
+        case "invalid":
+            break;
+        default:
+            if (weekdayRange("SUN", "SAT") && timeRange(0, 24) && dateRange("JAN", "DEC"))
+                return "PROXY main:3128; PROXY backup:3128";
+    }
+    return "DIRECT";
+}
+'''
+
+
+def selftest_pac(directory):
+    pac_file = os.path.join(directory, 'corporate.pac')
+    with open(pac_file, 'w') as f:
+        f.write(PAC_SCRIPT)
+    resolver = proxy_resolver.ProxyResolver({'pac_url': pac_file}, environment=lambda: None, system=lambda: None)
+    expected = [
+        ('wiki.internal', ['DIRECT']),
+        ('Branch12.example.com', ['http://office:8080']),
+        ('build.test', ['http://lab:3128', 'DIRECT']),
+        ('nowhere.invalid', ['DIRECT']),
+        ('www.example.org', ['http://main:3128', 'http://backup:3128']),
+    ]
+    for host, routes in expected:
+        found = [p.get('https') or 'DIRECT' for p in resolver.candidates(f'https://{host}/checkin')]
+        yield f"PAC routes {host} to {', '.join(routes)}", found == routes
+
+    # A construct still outside the interpreter must be logged as a fallback naming it, never as a route
+    with open(pac_file, 'w') as f:
+        f.write('function FindProxyForURL(url, host) {\n    return Math.random() < 0.5 ? "DIRECT" : "PROXY a:1";\n}\n')
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('AttendanceTracker')
+    logger.addHandler(handler)
+    try:
+        resolver = proxy_resolver.ProxyResolver({'pac_url': pac_file, 'url': 'http://static:3128'},
+                                                environment=lambda: None, system=lambda: None)
+        found = resolver.candidates('https://www.example.org/checkin')
+    finally:
+        logger.removeHandler(handler)
+    routes = [r for r in records if r.getMessage().startswith('Proxy route for')]
+    yield 'unusable PAC file falls back to the static proxy with a warning naming Math.random()', \
+        found == [{'http': 'http://static:3128', 'https': 'http://static:3128'}] and len(routes) == 1 \
+        and routes[0].levelno == logging.WARNING and 'Math.random()' in routes[0].getMessage()
+
+
+def start_pac_server(script, etag='"v1"', max_age=600):
+    """Serves script at /proxy.pac with an ETag and max-age, counting full answers and 304s."""
+    hits = {'full': 0, 'not_modified': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get('If-None-Match') == etag:
+                hits['not_modified'] += 1
+                self.send_response(304)
+                self.send_header('Cache-Control', f'max-age={max_age}')
+                self.end_headers()
+                return
+            hits['full'] += 1
+            body = script.encode()
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'max-age={max_age}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler), hits
+
+
+def selftest_pac_cache(directory):
+    server, hits = start_pac_server('function FindProxyForURL(url, host) {\n'
+                                    '    if (host == "late.example" && timeRange(0, 24)) return "PROXY night:3128";\n'
+                                    '    return "PROXY main:3128; DIRECT";\n'
+                                    '}\n')
+    pac_url = f'http://127.0.0.1:{server.server_address[1]}/proxy.pac'
+    cache_path = os.path.join(directory, 'proxy_cache.json')
+
+    def resolver():
+        return proxy_resolver.ProxyResolver({'pac_url': pac_url}, environment=lambda: None, system=lambda: None,
+                                            cache_path=cache_path)
+
+    def routes(r, host):
+        return [p.get('https') or 'DIRECT' for p in r.candidates(f'https://{host}/checkin')]
+
+    def cached_hosts():
+        with open(cache_path) as f:
+            return sorted(json.load(f)[pac_url]['routes'])
+
+    try:
+        first = resolver()
+        found = routes(first, 'www.example.org'), routes(first, 'late.example')
+        yield 'first tracker fetches the PAC file once and routes through it', \
+            found == (['http://main:3128', 'DIRECT'], ['http://night:3128']) and hits['full'] == 1
+        yield 'time-dependent route is not cached', cached_hosts() == ['https www.example.org']
+
+        second = resolver()
+        found = routes(second, 'www.example.org')
+        yield 'next tracker reuses the cached route without fetching or parsing the PAC file', \
+            found == ['http://main:3128', 'DIRECT'] and hits['full'] == 1 and second.script is None
+
+        with open(cache_path) as f:
+            entries = json.load(f)
+        entries[pac_url]['expires'] = 0
+        with open(cache_path, 'w') as f:
+            json.dump(entries, f)
+        third = resolver()
+        found = routes(third, 'www.example.org')
+        yield 'expired PAC file is revalidated with its ETag and keeps its routes', \
+            found == ['http://main:3128', 'DIRECT'] and hits == {'full': 1, 'not_modified': 1} \
+            and third.script is None
+
+        third.invalidate()
+        gone = not os.path.exists(cache_path)
+        found = routes(third, 'www.example.org')
+        yield 'network change drops the cache and fetches the PAC file again', \
+            gone and found == ['http://main:3128', 'DIRECT'] and hits['full'] == 2
+    finally:
+        server.shutdown()
+
+
+def selftest():
+    checkin, server_hits = start_checkin_server()
+    proxy, proxy_hits = start_proxy()
+    proxy_address = f'127.0.0.1:{proxy.server_address[1]}'
+    data_home = tempfile.mkdtemp(prefix='proxy-check-')
+    os.makedirs(os.path.join(data_home, 'AttendanceTracker', 'Logs'))
+    pac_file = os.path.join(data_home, 'proxy.pac')
+    with open(pac_file, 'w') as f:
+        f.write('function FindProxyForURL(url, host) {\n'
+                '    if (isPlainHostName(host) || dnsDomainIs(host, ".internal")) return "DIRECT";\n'
+                f'    if (host == "127.0.0.1") return "PROXY 127.0.0.1:{unused_port()}; PROXY {proxy_address}";\n'
+                '    return "DIRECT";\n'
+                '}\n')
+    env_proxy = {'HTTP_PROXY': f'http://{proxy_address}'}
+    # (name, server host, config.json proxy section, environment, requests expected via the proxy)
+    scenarios = [
+        ('PAC proxy after a dead one', '127.0.0.1', {'pac_url': pac_file}, {}, 1),
+        ('PAC DIRECT', 'localhost', {'pac_url': pac_file}, {}, 0),
+        ('environment proxy', '127.0.0.1', {}, env_proxy, 1),
+        ('config bypass beats environment', '127.0.0.1', {'bypass': ['127.0.0.1']}, env_proxy, 0),
+    ]
+    failures = total = 0
+    for name, ok in list(selftest_pac(data_home)) + list(selftest_pac_cache(data_home)):
+        total += 1
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    try:
+        for name, host, proxy_config, env, expected in scenarios:
+            url = f'http://{host}:{checkin.server_address[1]}'
+            before_server, before_proxy = server_hits['count'], proxy_hits['count']
+            code = run_tracker(data_home, url, proxy_config, env)
+            via_proxy = proxy_hits['count'] - before_proxy
+            ok = code == 0 and server_hits['count'] - before_server == 1 and via_proxy == expected
+            total += 1
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: exit {code}, {via_proxy} request(s) via the proxy")
+    finally:
+        checkin.shutdown()
+        proxy.shutdown()
+        shutil.rmtree(data_home, ignore_errors=True)
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios routed incorrectly")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    resolve = sub.add_parser('resolve', help='print the routes for a URL')
+    resolve.add_argument('url')
+    resolve.add_argument('--pac', help='PAC file path or URL, as proxy.pac_url in config.json')
+    resolve.add_argument('--proxy', help='proxy URL, as proxy.url in config.json')
+    resolve.add_argument('--bypass', action='append', default=[], help='host pattern to reach directly')
+    sub.add_parser('selftest', help='verify routing against a local server, proxy and PAC file')
+    args = parser.parse_args()
+
+    if args.command == 'selftest':
+        selftest()
+        return
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    resolver = proxy_resolver.ProxyResolver({'pac_url': args.pac, 'url': args.proxy, 'bypass': args.bypass})
+    for proxies in resolver.candidates(args.url):
+        print(proxies.get(urlsplit(args.url).scheme) or 'DIRECT')
+
+
+if __name__ == '__main__':
+    main()
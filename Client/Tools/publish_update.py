@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Publish client releases for delta updates, and check the updater against them.
+
+    python publish_update.py build --version 1.2.0 --out release \\
+        AttendanceTracker=dist/AttendanceTracker power_monitor=dist/power_monitor
+    python publish_update.py build --version 1.2.0 --out release dist/AttendanceTracker dist/power_monitor
+    python publish_update.py serve release --port 8100
+    python publish_update.py selftest
+
+build chunks each installed-name=local-path into <out>/chunks (chunks shared
+with earlier releases built into the same directory are kept) and writes
+<out>/manifest.json. Point config.json's "update": {"manifest_url": ...} at
+wherever that directory is served from. Names are relative to the install
+directory, so on macOS the tracker is
+AttendanceTracker.app/Contents/MacOS/AttendanceTracker. A directory given
+without a name is a onedir build (TRACKER_PACKAGING=onedir): every file in
+it is published under its path inside the directory, so the executable and
+its <name>_internal libraries land side by side as the installers put them.
+
+serve is a local manifest server for trying a client against.
+
+selftest publishes synthetic releases, serves them and updates a fake
+install directory: a first update found by chunking the installed copy, a
+second found from the recorded chunk lists, an up-to-date check, a chunk
+that doesn't match its hash, manifests naming paths outside the install
+(including drive-relative ones), a staged file modified before the swap, a
+swap failing part-way and a file mode capped at 0755. It
+finishes by running the Linux AttendanceTracker against the server and
+applying what it staged. The tracker scenario is Linux only.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKER = os.path.join(HERE, '..', 'Linux', 'AttendanceTracker.py')
+sys.path.insert(0, os.path.join(HERE, '..', 'Common'))
+import delta_update
+
+
+def expand(items):
+    """installed-name -> local-path for NAME=PATH arguments and onedir build directories."""
+    files = {}
+    for item in items:
+        if '=' in item:
+            name, path = item.split('=', 1)
+            files[name] = path
+            continue
+        if not os.path.isdir(item):
+            sys.exit(f"{item} is neither NAME=PATH nor a build directory")
+        for root, _, names in os.walk(item):
+            for name in names:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, item).replace(os.sep, '/')] = path
+    return files
+
+
+def build(version, files, out, platform=delta_update.PLATFORM):
+    manifest = delta_update.build_manifest(version, files, os.path.join(out, 'chunks'), platform)
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+class ReleaseServer:
+    """Serves a release directory and counts the bytes it sent."""
+
+    def __init__(self, directory, port=0, quiet=True):
+        self.sent = 0
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def copyfile(self, source, outputfile):
+                data = source.read()
+                server.sent += len(data)
+                outputfile.write(data)
+
+            def log_message(self, *args):
+                if not quiet:
+                    super().log_message(*args)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), partial(Handler, directory=directory))
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/manifest.json'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+
+def fetch(url):
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read()
+
+
+def release(rng, base=None):
+    """Synthetic bundle contents: the last release's with a few local edits, like a rebuilt PyInstaller binary."""
+    if base is None:
+        return {'AttendanceTracker': rng.randbytes(3 << 20), 'power_monitor': rng.randbytes(2 << 20)}
+    files = {}
+    for name, data in base.items():
+        data = bytearray(data)
+        for _ in range(3):
+            at = rng.randrange(len(data))
+            data[at:at + rng.randrange(0, 2000)] = rng.randbytes(rng.randrange(1, 2000))
+        files[name] = bytes(data)
+    return files
+
+
+def publish(directory, version, contents):
+    sources = os.path.join(directory, 'build', version)
+    os.makedirs(sources, exist_ok=True)
+    files = {}
+    for name, data in contents.items():
+        files[name] = os.path.join(sources, name)
+        with open(files[name], 'wb') as f:
+            f.write(data)
+        os.chmod(files[name], 0o755)
+    return build(version, files, os.path.join(directory, 'release'))
+
+
+def installed(install_dir, contents):
+    for name, data in contents.items():
+        with open(os.path.join(install_dir, name), 'rb') as f:
+            if f.read() != data:
+                return False
+    return True
+
+
+def selftest_updater(directory):
+    rng = random.Random(39)
+    server = ReleaseServer(os.path.join(directory, 'release'))
+    install_dir = os.path.join(directory, 'install')
+    os.makedirs(install_dir)
+    v1 = release(rng)
+    for name, data in v1.items():
+        with open(os.path.join(install_dir, name), 'wb') as f:
+            f.write(data)
+    total = sum(len(data) for data in v1.values())
+    publish(directory, '1.0.0', v1)
+    server.start()
+
+    try:
+        for version in ('1.1.0', '1.2.0'):
+            contents = release(rng, v1 if version == '1.1.0' else contents)
+            publish(directory, version, contents)
+            updater = delta_update.Updater(install_dir, fetch)
+            sent = server.sent
+            staged = updater.check(server.url)
+            again = updater.check(server.url)
+            swapped = delta_update.apply_staged(install_dir)
+            left_over = [f for f in os.listdir(install_dir) if f.endswith(delta_update.OLD_SUFFIX)]
+            yield (f'update to {version} (downloaded {updater.downloaded} of {total} bytes, '
+                   f'{server.sent - sent} on the wire)',
+                   staged is not None and again is None and sorted(swapped) == sorted(contents)
+                   and installed(install_dir, contents) and not left_over and updater.downloaded < total // 4)
+
+        updater = delta_update.Updater(install_dir, fetch)
+        yield 'already up to date', updater.check(server.url) is None and updater.downloaded == 0
+
+        v3 = release(rng, contents)
+        manifest = publish(directory, '1.3.0', v3)
+        with open(os.path.join(install_dir, 'update', 'installed.json')) as f:
+            have = {chunk['sha256'] for entry in json.load(f).values() for chunk in entry['chunks']}
+        # One the updater has to download, so the bad copy on the server is what it gets
+        tampered = next(os.path.join(directory, 'release', 'chunks', chunk['sha256'])
+                        for entry in manifest['files'].values() for chunk in entry['chunks']
+                        if chunk['sha256'] not in have)
+        with open(tampered, 'rb') as f:
+            good = f.read()
+        with open(tampered, 'wb') as f:
+            f.write(zlib.compress(zlib.decompress(good)[::-1]))
+        try:
+            delta_update.Updater(install_dir, fetch).check(server.url)
+            rejected = False
+        except delta_update.UpdateError:
+            rejected = True
+        with open(tampered, 'wb') as f:
+            f.write(good)
+        yield 'chunk not matching its hash', rejected and delta_update.staged_update(install_dir) is None
+
+        with open(os.path.join(directory, 'release', 'manifest.json')) as f:
+            escaping = json.load(f)
+        entry = escaping['files']['power_monitor']
+        rejected = []
+        # C:escaped is relative to the current directory of drive C: on Windows
+        for name in ('../escaped', os.path.join(directory, 'escaped'), 'C:escaped', 'C:/escaped'):
+            escaping['files'] = {name: entry}
+            with open(os.path.join(directory, 'release', 'escape.json'), 'w') as f:
+                json.dump(escaping, f)
+            try:
+                delta_update.Updater(install_dir, fetch).check(server.url.replace('manifest.json', 'escape.json'))
+            except delta_update.UpdateError:
+                rejected.append(name)
+        yield f'manifest naming a path outside the install ({len(rejected)} of 4 rejected)', \
+            len(rejected) == 4 and not os.path.exists(os.path.join(directory, 'escaped'))
+
+        # A setuid, world-writable mode from the server is capped at rwxr-xr-x
+        manifest['files']['power_monitor']['mode'] = 0o6777
+        with open(os.path.join(directory, 'release', 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        delta_update.Updater(install_dir, fetch).check(server.url)
+        with open(os.path.join(install_dir, 'update', 'staged', 'power_monitor'), 'r+b') as f:
+            f.write(b'\0')
+        swapped = delta_update.apply_staged(install_dir)
+        yield 'staged file modified before the swap', \
+            swapped == [] and installed(install_dir, contents) and delta_update.staged_update(install_dir) is None
+
+        delta_update.Updater(install_dir, fetch).check(server.url)
+        real_replace, calls = os.replace, []
+
+        def failing_replace(source, target):
+            calls.append(target)
+            if len(calls) == 3:
+                raise OSError('disk full')
+            real_replace(source, target)
+        os.replace = failing_replace
+        try:
+            swapped = delta_update.apply_staged(install_dir)
+        finally:
+            os.replace = real_replace
+        rolled_back = swapped == [] and installed(install_dir, contents)
+        swapped = delta_update.apply_staged(install_dir)
+        yield 'swap failing part-way is rolled back', \
+            rolled_back and sorted(swapped) == sorted(v3) and installed(install_dir, v3)
+        yield 'file mode from the manifest capped at 0755', \
+            os.stat(os.path.join(install_dir, 'power_monitor')).st_mode & 0o7777 == 0o755
+    finally:
+        server.server.shutdown()
+
+
+def selftest_tracker(directory):
+    rng = random.Random(41)
+    server = ReleaseServer(os.path.join(directory, 'release')).start()
+    app_support = os.path.join(directory, 'AttendanceTracker')
+    os.makedirs(os.path.join(app_support, 'Logs'))
+    v1 = {'AttendanceTracker': rng.randbytes(1 << 20)}
+    with open(os.path.join(app_support, 'AttendanceTracker'), 'wb') as f:
+        f.write(v1['AttendanceTracker'])
+    v2 = release(rng, v1)
+    publish(directory, '2.0.0', v2)
+    with open(os.path.join(app_support, 'Logs', 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': 'http://127.0.0.1:9', 'timeout_seconds': 2, 'max_retry_attempts': 1,
+                       'retry_delay_seconds': 1},
+            'application': {'startup_delay_seconds': 0},
+            'update': {'manifest_url': server.url, 'check_interval_hours': 0},
+        }, f)
+    try:
+        subprocess.run([sys.executable, TRACKER], env=dict(os.environ, XDG_DATA_HOME=directory),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        staged = delta_update.staged_update(app_support)
+        swapped = delta_update.apply_staged(app_support)
+        yield 'tracker stages an update the monitor applies', \
+            staged is not None and staged['version'] == '2.0.0' and swapped == ['AttendanceTracker'] \
+            and installed(app_support, v2)
+    finally:
+        server.server.shutdown()
+
+
+def selftest():
+    directory = tempfile.mkdtemp(prefix='publish-update-')
+    failures = total = 0
+    try:
+        scenarios = [selftest_updater(os.path.join(directory, 'updater'))]
+        if sys.platform.startswith('linux'):
+            scenarios.append(selftest_tracker(os.path.join(directory, 'tracker')))
+        for scenario in scenarios:
+            for name, ok in scenario:
+                total += 1
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help='chunk a release and write its manifest')
+    build_parser.add_argument('--version', required=True)
+    build_parser.add_argument('--platform', default=delta_update.PLATFORM, choices=['win32', 'darwin', 'linux'])
+    build_parser.add_argument('--out', required=True)
+    build_parser.add_argument('files', nargs='+', metavar='NAME=PATH|DIR')
+    serve_parser = sub.add_parser('serve', help='serve a release directory')
+    serve_parser.add_argument('directory')
+    serve_parser.add_argument('--port', type=int, default=8100)
+    sub.add_parser('selftest', help='update a fake install from synthetic releases')
+    args = parser.parse_args()
+
+    if args.command == 'selftest':
+        selftest()
+    elif args.command == 'build':
+        manifest = build(args.version, expand(args.files), args.out, args.platform)
+        for name, entry in manifest['files'].items():
+            print(f"{name}: {entry['size']} bytes in {len(entry['chunks'])} chunks, sha256 {entry['sha256']}")
+    else:
+        server = ReleaseServer(args.directory, args.port, quiet=False)
+        print(f"Serving {args.directory} at {server.url}", flush=True)
+        try:
+            server.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
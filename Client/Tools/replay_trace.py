@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Replay recorded or synthetic power-monitor event traces through the core.
+
+Traces are the JSON-lines files written when a monitor runs with
+POWER_MONITOR_TRACE set. Events are fed through monitor_core with a fake
+clock and a simulated AttendanceTracker, so this runs on any OS at full
+speed and reports decisions per second and launches per trace.
+
+    python replay_trace.py trace1.jsonl trace2.jsonl
+    python replay_trace.py --synthetic 100000 --seed 7
+    python replay_trace.py selftest
+
+selftest holds the resident monitors to a memory budget. It replays
+synthetic traces under tracemalloc and fails when the core's heap peak
+exceeds MEMORY_BUDGET_KB, or grows with the number of events. It replays
+a machine-wide core with SESSIONS logged-in users, whose peak may not
+exceed SESSION_BUDGET_BYTES per session. It also checks that the
+Common modules imported by the monitors at startup leave out the modules
+the slim resident mode defers (SLIM_EXCLUDED). Finally it replays a
+morning on a machine-wide core whose users each have their own
+config.json and last check-in, and checks that a broken config or a
+finished check-in holds back only its own user, and that the schedule
+timer starts check-ins only for the users who are due.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+COMMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common')
+sys.path.insert(0, COMMON)
+import checkin_schedule
+import client_config
+import monitor_core
+import sessions
+
+# Heap peak of a per-user core over a whole trace; about 4 KB today
+MEMORY_BUDGET_KB = 64
+# Growth allowed between a short and a 100 times longer trace
+GROWTH_BUDGET_KB = 2
+SESSIONS = 500
+# Heap per logged-in user of a machine-wide core (session entry plus UserState); about 500 bytes today
+SESSION_BUDGET_BYTES = 1024
+# Common modules every monitor imports at startup, and what the slim resident mode keeps out of them
+MONITOR_IMPORTS = ['checkin_schedule', 'client_config', 'control_endpoint', 'delta_update', 'memwatch',
+                   'monitor_core', 'sessions', 'single_flight', 'slim_logging', 'waits']
+SLIM_EXCLUDED = ['logging.handlers', 'configparser', 'subprocess', 'pickle', 'queue', 'heapq', 'copy', 'asyncio', 'ssl']
+
+
+def load_trace(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_trace(count, seed):
+    """Build a Win32-flavoured trace with bursty, realistic spacing."""
+    rng = random.Random(seed)
+    choices = [
+        (monitor_core.WM_WTSSESSION_CHANGE, monitor_core.WTS_SESSION_UNLOCK, 40),
+        (monitor_core.WM_WTSSESSION_CHANGE, monitor_core.WTS_SESSION_LOCK, 40),
+        (monitor_core.WM_POWERBROADCAST, monitor_core.PBT_APMSUSPEND, 6),
+        (monitor_core.WM_POWERBROADCAST, monitor_core.PBT_APMRESUMESUSPEND, 6),
+        (monitor_core.WM_POWERBROADCAST, monitor_core.PBT_APMRESUMEAUTOMATIC, 6),
+        (monitor_core.WM_WTSSESSION_CHANGE, monitor_core.WTS_SESSION_LOGON, 1),
+        (monitor_core.WM_WTSSESSION_CHANGE, monitor_core.WTS_SESSION_LOGOFF, 1),
+    ]
+    population = [(msg, wparam) for msg, wparam, _ in choices]
+    weights = [weight for _, _, weight in choices]
+    t = 0.0
+    trace = []
+    for _ in range(count):
+        # Mostly minutes apart, occasionally a burst of duplicates within a second
+        t += rng.expovariate(1 / 900.0) if rng.random() > 0.1 else rng.random()
+        msg, wparam = rng.choices(population, weights)[0]
+        trace.append({
+            't': t,
+            'source': 'win32',
+            'event': monitor_core.from_win32(msg, wparam),
+            'raw': {'msg': msg, 'wParam': wparam},
+        })
+    return trace
+
+
+def translate(entry):
+    """Re-derive the abstract event from the raw platform fields when present."""
+    raw = entry.get('raw') or {}
+    if 'msg' in raw:
+        return monitor_core.from_win32(raw['msg'], raw['wParam'])
+    if 'name' in raw:
+        return monitor_core.from_cocoa(raw['name']) or entry.get('event')
+    return entry.get('event')
+
+
+def replay(trace, tracker_runtime, policy_kwargs, session_table=None):
+    """Feed trace through a core and return its stats; with session_table the core is machine-wide."""
+    clock = {'now': 0.0}
+    # user -> time their simulated tracker finishes
+    running = {}
+
+    def launcher(event, user=None):
+        running[user] = clock['now'] + tracker_runtime
+        return True
+
+    core = monitor_core.MonitorCore(
+        launcher=launcher,
+        is_tracker_running=lambda user=None: clock['now'] < running.get(user, -1.0),
+        policy=monitor_core.LaunchPolicy(**policy_kwargs),
+        clock=lambda: clock['now'],
+        sessions=session_table,
+    )
+    # Offset the fake clock so the first event is not inside the debounce window
+    base = policy_kwargs.get('retry_reset_interval', 3600) + 1
+    for entry in trace:
+        event = translate(entry)
+        if event is None:
+            continue
+        clock['now'] = base + entry['t']
+        core.handle(event)
+    return core.stats()
+
+
+def heap_peak_kb(action):
+    """Run action under tracemalloc and return the Python heap's peak in KB."""
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def selftest_memory():
+    policy_kwargs = {'min_event_interval': 5, 'max_retries': 10, 'retry_reset_interval': 3600}
+    short, long = synthetic_trace(1000, 7), synthetic_trace(100000, 7)
+    short_peak = heap_peak_kb(lambda: replay(short, 10.0, policy_kwargs))
+    long_peak = heap_peak_kb(lambda: replay(long, 10.0, policy_kwargs))
+    yield f'core heap peak {long_peak:.1f}KB over 100000 events (budget {MEMORY_BUDGET_KB}KB)', \
+        long_peak <= MEMORY_BUDGET_KB
+    yield f'heap grows {long_peak - short_peak:.1f}KB from 1000 to 100000 events (budget {GROWTH_BUDGET_KB}KB)', \
+        long_peak - short_peak <= GROWTH_BUDGET_KB
+
+    def machine_wide():
+        table = sessions.SessionTable()
+        for n in range(SESSIONS):
+            table.add(n, f'user{n}')
+        replay(short, 10.0, policy_kwargs, table)
+    one_user = heap_peak_kb(lambda: replay(short, 10.0, policy_kwargs))
+    per_session = (heap_peak_kb(machine_wide) - one_user) * 1024 / SESSIONS
+    yield f'{per_session:.0f} bytes per session with {SESSIONS} sessions (budget {SESSION_BUDGET_BYTES})', \
+        per_session <= SESSION_BUDGET_BYTES
+
+
+def selftest_imports():
+    # A fresh interpreter, since this one has already loaded whatever it pleased
+    loaded = subprocess.run(
+        [sys.executable, '-c', f"import sys; sys.path.insert(0, {COMMON!r}); import {', '.join(MONITOR_IMPORTS)}; "
+                               f"print(' '.join(m for m in {SLIM_EXCLUDED!r} if m in sys.modules))"],
+        capture_output=True, text=True, check=True).stdout.split()
+    yield f"monitor startup imports leave out {', '.join(SLIM_EXCLUDED)}" \
+          f"{f' (loaded: {chr(32).join(loaded)})' if loaded else ''}", not loaded
+
+
+def selftest_machine_wide():
+    directory = tempfile.mkdtemp(prefix='replay-machine-wide-')
+    morning = datetime(2026, 3, 2, 8, 0)
+    clock = {'now': morning.timestamp()}
+    launched = []
+
+    def write(user, name, content):
+        os.makedirs(os.path.join(directory, user), exist_ok=True)
+        with open(os.path.join(directory, user, name), 'w') as f:
+            f.write(content)
+
+    def config(window):
+        return json.dumps({'server': {'url': 'http://127.0.0.1:9'}, 'schedule': {'windows': [window]}})
+
+    write('alice', 'config.json', config('09:00-10:00'))
+    write('bob', 'config.json', '{"server": {}}')
+    write('carol', 'config.json', config('09:00-10:00'))
+    write('carol', 'last_success.txt', morning.strftime('%Y-%m-%d'))
+    table = sessions.SessionTable()
+    for n, user in enumerate(('alice', 'bob', 'carol')):
+        table.add(n, user)
+    core = monitor_core.MonitorCore(
+        launcher=lambda event, user=None: launched.append((event, user)) or True,
+        is_tracker_running=lambda user=None: False,
+        clock=lambda: clock['now'],
+        sessions=table,
+        set_timer=lambda delay: None,
+        user_config=lambda user: client_config.ConfigStore([os.path.join(directory, user, 'config.json')]),
+        make_schedule=lambda config, user=None: checkin_schedule.schedule_from_config(
+            config, os.path.join(directory, user, 'last_success.txt')),
+    )
+    try:
+        core.handle(monitor_core.STARTUP)
+        yield "startup launches for every user but the one whose config.json is broken", \
+            launched == [('startup', 'alice'), ('startup', 'carol')] \
+            and core.status()['users']['bob']['config_error'] is not None
+        yield "the timer is armed for the first user's window, not a shared one", \
+            core.next_checkin == morning.replace(hour=9).timestamp()
+
+        write('bob', 'config.json', config('09:30-10:00') + ' ')
+        clock['now'] = morning.replace(hour=9).timestamp()
+        core.handle(monitor_core.TIMER)
+        yield "at 09:00 only alice is due; carol checked in today, bob's window is later", \
+            launched[2:] == [('timer', 'alice')]
+        yield "bob's fixed config.json is picked up with his own window", \
+            core.status()['users']['bob']['config_error'] is None \
+            and core.next_checkin == morning.replace(hour=9, minute=30).timestamp()
+
+        clock['now'] = morning.replace(hour=9, minute=30).timestamp()
+        core.handle(monitor_core.TIMER)
+        yield "at 09:30 bob's own schedule starts his check-in", launched[3:] == [('timer', 'bob')]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def selftest():
+    failures = total = 0
+    for scenario in (selftest_memory(), selftest_imports(), selftest_machine_wide()):
+        for name, ok in scenario:
+            total += 1
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    if failures:
+        sys.exit(f"{failures} of {total} scenarios failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='*', help='JSON-lines trace files recorded by a monitor')
+    parser.add_argument('--synthetic', type=int, default=0, help='number of synthetic events to generate')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tracker-runtime', type=float, default=10.0,
+                        help='seconds a launched AttendanceTracker is considered running')
+    parser.add_argument('--min-event-interval', type=float, default=5)
+    parser.add_argument('--max-retries', type=int, default=10)
+    parser.add_argument('--retry-reset-interval', type=float, default=3600)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the core log output')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL,
+                        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    if args.traces == ['selftest']:
+        selftest()
+        return
+
+    traces = [(path, load_trace(path)) for path in args.traces]
+    if args.synthetic:
+        traces.append((f'synthetic:{args.synthetic}:{args.seed}', synthetic_trace(args.synthetic, args.seed)))
+    if not traces:
+        parser.error('give at least one trace file or --synthetic N')
+
+    policy_kwargs = {
+        'min_event_interval': args.min_event_interval,
+        'max_retries': args.max_retries,
+        'retry_reset_interval': args.retry_reset_interval,
+    }
+    results = []
+    total_events = 0
+    started = time.perf_counter()
+    for name, trace in traces:
+        stats = replay(trace, args.tracker_runtime, policy_kwargs)
+        total_events += len(trace)
+        results.append({'trace': name, 'events_in_trace': len(trace), **stats})
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        'traces': results,
+        'total_events': total_events,
+        'elapsed_seconds': round(elapsed, 6),
+        'decisions_per_second': round(total_events / elapsed) if elapsed else None,
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for result in results:
+            print(f"{result['trace']}: {result['events_in_trace']} events, {result['launches']} launches, "
+                  f"decisions={result['decisions']}")
+        print(f"{total_events} events in {elapsed:.3f}s ({summary['decisions_per_second']} decisions/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Stress the single-flight check-in with many concurrent tracker processes.
+
+Each round clears the last check-in, then starts --processes Linux
+AttendanceTracker processes at once against a local /checkin server that
+takes --server-delay seconds to answer. Exactly one POST must reach the
+server per round and every process must exit with the same outcome, for
+accepted (200), already (208) and failed (500) answers alike. Linux only.
+
+    python stress_single_flight.py --processes 20 --rounds 5
+    python stress_single_flight.py --status 500 --processes 10
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKER = os.path.join(HERE, '..', 'Linux', 'AttendanceTracker.py')
+
+
+def start_server(status, delay):
+    posts = {'count': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with lock:
+                posts['count'] += 1
+            time.sleep(delay)
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, posts
+
+
+def run_round(data_home, processes, stagger, rng):
+    logs = os.path.join(data_home, 'AttendanceTracker', 'Logs')
+    for name in ('last_success.txt', 'lease.json'):
+        try:
+            os.remove(os.path.join(logs, name))
+        except FileNotFoundError:
+            pass
+    env = dict(os.environ, XDG_DATA_HOME=data_home)
+    procs = []
+    for _ in range(processes):
+        procs.append(subprocess.Popen([sys.executable, TRACKER], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        time.sleep(rng.uniform(0, stagger / processes))
+    return [p.wait() for p in procs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--status', type=int, default=200, help='HTTP status the server answers with')
+    parser.add_argument('--server-delay', type=float, default=3.0, help='seconds the server takes to answer')
+    parser.add_argument('--stagger', type=float, default=1.0, help='spread process starts over this many seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    if args.stagger >= args.server_delay:
+        parser.error('--stagger must be shorter than --server-delay so every process overlaps the flight')
+
+    server, posts = start_server(args.status, args.server_delay)
+    data_home = tempfile.mkdtemp(prefix='single-flight-')
+    logs = os.path.join(data_home, 'AttendanceTracker', 'Logs')
+    os.makedirs(logs)
+    with open(os.path.join(logs, 'config.json'), 'w') as f:
+        json.dump({
+            'server': {'url': f'http://127.0.0.1:{server.server_address[1]}', 'timeout_seconds': 30,
+                       'max_retry_attempts': 1, 'retry_delay_seconds': 1},
+            'application': {'startup_delay_seconds': 0},
+        }, f)
+
+    rng = random.Random(args.seed)
+    rounds = []
+    try:
+        for _ in range(args.rounds):
+            before = posts['count']
+            started = time.perf_counter()
+            codes = run_round(data_home, args.processes, args.stagger, rng)
+            rounds.append({
+                'posts': posts['count'] - before,
+                'exit_codes': sorted(set(codes)),
+                'seconds': round(time.perf_counter() - started, 2),
+            })
+        with open(os.path.join(logs, 'outputat.log')) as f:
+            shared = sum('shared with the in-flight check-in' in line for line in f)
+    finally:
+        server.shutdown()
+        shutil.rmtree(data_home, ignore_errors=True)
+
+    failures = [r for r in rounds if r['posts'] != 1 or len(r['exit_codes']) != 1]
+    summary = {
+        'processes': args.processes,
+        'status': args.status,
+        'rounds': rounds,
+        'shared_outcomes': shared,
+        'ok': not failures,
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for i, r in enumerate(rounds, 1):
+            print(f"round {i}: {r['posts']} POST(s), exit codes {r['exit_codes']}, {r['seconds']}s")
+        print(f"{shared} of {args.processes * args.rounds} processes shared an in-flight outcome")
+    if failures:
+        sys.exit(f"Single-flight violated in {len(failures)} of {len(rounds)} rounds")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,36 @@
-import requests
 import socket
-import time
+import getpass
 from datetime import datetime
-import json
 import os
 import sys
 import logging
 import uuid
 from logging.handlers import RotatingFileHandler
-import configparser
 from urllib.parse import urlparse
 
+# Shared platform-neutral modules live in Client/Common (bundled via the spec's pathex)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import async_checkin
+import checkin_lease
+import client_config
+import control_endpoint
+import delta_update
+import log_shipper
+import proxy_resolver
+import single_flight
+import waits
+
 # Setup paths
 APP_SUPPORT = os.path.join(os.environ['APPDATA'], 'AttendanceTracker')
 LOG_DIR = os.path.join(APP_SUPPORT, 'Logs')
 os.makedirs(LOG_DIR, exist_ok=True)
+LEASE_FILE = os.path.join(LOG_DIR, 'lease.json')
+# PAC file and the routes it gave, reused by the next tracker on the same network
+PROXY_CACHE_FILE = os.path.join(LOG_DIR, 'proxy_cache.json')
+# A machine-wide monitor runs the shared binary for each user, so config.json may only live beside it
+INSTALL_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+# Check-ins name the user so several people sharing one machine are told apart
+USER = getpass.getuser()
 
 # Configure logging
 power_monitor_log = os.path.join(LOG_DIR, 'attendancetracker.log')
@@ -23,54 +39,28 @@ for handler in logger.handlers[:]:
     logger.removeHandler(handler)
 
 config_file = os.path.join(os.path.dirname(sys.executable), 'logging.conf')
-config = configparser.ConfigParser()
-log_level = 'INFO'
-max_bytes = 10 * 1024 * 1024
-
-if os.path.exists(config_file):
-    try:
-        config.read(config_file)
-        if 'logging' in config:
-            log_level = config['logging'].get('level', 'INFO').upper()
-            max_bytes = config['logging'].getint('max_size_mb', 10) * 1024 * 1024
-    except Exception as e:
-        logging.basicConfig(level=logging.ERROR)
-        logging.error(f"Failed to read logging config from {config_file}: {e}")
+log_level, max_bytes = 'INFO', 10 * 1024 * 1024
+try:
+    log_level, max_bytes = client_config.load_logging_conf(config_file)
+except (client_config.ConfigError, OSError) as e:
+    logging.basicConfig(level=logging.ERROR)
+    logging.error(f"Failed to read logging config from {config_file}: {e}")
 
-handler = RotatingFileHandler(power_monitor_log, mode='w', maxBytes=max_bytes, backupCount=0)
+# Appended to and rotated to a .1 backup like the other platforms, so a restart keeps the evidence
+handler = RotatingFileHandler(power_monitor_log, mode='a', maxBytes=max_bytes, backupCount=1)
 handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] AttendanceTracker: %(message)s'))
 level = getattr(logging, log_level, logging.INFO)
 logger.setLevel(level)
 handler.setLevel(level)
 logger.addHandler(handler)
 
-# Resolve address with IPv4 preference, fallback to IPv6
-def get_ip_address(host, port):
-    try:
-        # First try IPv4
-        addrinfo = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_STREAM)
-        ip = addrinfo[0][4][0]
-        logger.info(f"Resolved {host} to IPv4: {ip}")
-        return ip, socket.AF_INET
-    except socket.gaierror as e:
-        logger.warning(f"IPv4 resolution failed for {host}: {str(e)}. Trying IPv6...")
-        try:
-            # Fallback to IPv6
-            addrinfo = socket.getaddrinfo(host, port, socket.AF_INET6, socket.SOCK_STREAM)
-            ip = addrinfo[0][4][0]
-            logger.info(f"Resolved {host} to IPv6: {ip}")
-            return f"[{ip}]", socket.AF_INET6
-        except socket.gaierror as e2:
-            logger.error(f"IPv6 resolution failed for {host}: {str(e2)}")
-            raise
-
 def get_config():
-    config_path = os.path.join(APP_SUPPORT, 'config.json')
     try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error reading config: {str(e)}")
+        return client_config.load_config(client_config.find_config([os.path.join(APP_SUPPORT, 'config.json'),
+                                                                    os.path.join(INSTALL_DIR, 'config.json')]))
+    except client_config.ConfigError as e:
+        # Refuse to start rather than fail half-way through a check-in on a missing key
+        logger.error(f"Invalid configuration, not checking in: {e}")
         sys.exit(1)
 
 def get_hostname():
@@ -99,44 +89,60 @@ def try_connect_with_retry(config, max_attempts=None, delay_seconds=None):
     logger.info(f"Server URL: {url}")
     logger.info(f"Max attempts: {max_attempts}, Delay: {delay_seconds} seconds")
     
-    max_attempts = max_attempts or config['server'].get('max_retry_attempts', 10)
-    delay_seconds = delay_seconds or config['server'].get('retry_delay_seconds', 60)
-    version = config.get('version', '1.0.0')  
+    max_attempts = max_attempts or config['server']['max_retry_attempts']
+    delay_seconds = delay_seconds or config['server']['retry_delay_seconds']
+    version = config['version']
+    lease = checkin_lease.load_lease(LEASE_FILE)
+    headers = checkin_lease.conditional_headers(lease)
+    # Proxy settings, including the registry and any PAC file, are looked up once, not on every attempt
+    engine = async_checkin.CheckinEngine(proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE))
+    parsed = urlparse(base_url)
+    new_url = f"{parsed.scheme}://{parsed.hostname}:{parsed.port or 3001}/checkin"
     for attempt in range(max_attempts):
         try:
-            parsed = urlparse(base_url)
-            host = parsed.hostname
-            port = parsed.port or 3001
-            ip, family = get_ip_address(host, port)
-            new_url = f"{parsed.scheme}://{ip}:{port}/checkin"
             logger.info(f"Attempt {attempt + 1}/{max_attempts}: Sending request to {new_url}")
             client_time = datetime.now()
-            logger.info(f"Request data: hostname={hostname}, time={client_time.isoformat()}")
-            response = requests.post(new_url,
-                                    json={"hostname": hostname, "client_time": client_time.isoformat(), "version": version},
-                                    timeout=config['server']['timeout_seconds'])
+            logger.info(f"Request data: hostname={hostname}, user={USER}, time={client_time.isoformat()}")
+            # The engine resolves the server itself (IPv4 first) while the proxy route is worked out,
+            # all under the one timeout
+            response = async_checkin.run(engine.attempt(new_url, {"hostname": hostname, "client_time": client_time.isoformat(),
+                                                                  "version": version, "user": USER},
+                                                        headers=headers, timeout=config['server']['timeout_seconds']))
             
             if response.status_code == 200:
                 logger.info(f"Success: Server accepted check-in at {datetime.now()}")
                 save_success_date()
-                sys.exit(0)
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                return single_flight.ACCEPTED
             elif response.status_code == 208:
                 logger.info(f"Server already checked in today at {datetime.now()}")
                 save_success_date()
-                sys.exit(0)
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                return single_flight.ALREADY
+            elif response.status_code == 304:
+                logger.info(f"Server confirmed check-in is still current at {datetime.now()}")
+                save_success_date()
+                checkin_lease.refresh_lease(LEASE_FILE, lease, response)
+                return single_flight.ALREADY
             else:
                 logger.error(f"Unexpected response: {response.status_code}")
-        except requests.exceptions.ConnectionError as e:
+        except async_checkin.Cancelled:
+            logger.info(f"Attempt {attempt + 1}/{max_attempts} cancelled for suspend")
+        except async_checkin.CheckinError as e:
             logger.error(f"Connection failed on attempt {attempt + 1}/{max_attempts}: {str(e)}")
         except Exception as e:
             logger.error(f"Unexpected error on attempt {attempt + 1}/{max_attempts}: {str(e)}")
         
         if attempt < max_attempts - 1:
             logger.info(f"Waiting {delay_seconds} seconds before next attempt...")
-            time.sleep(delay_seconds)
+            reason = waiter.wait(delay_seconds)
+            if reason != waits.TIMEOUT:
+                logger.info(f"Retrying now after {reason} notification")
+            if reason == waits.NETWORK:
+                engine.resolver.invalidate()
     
     logger.error(f"Failed to connect after {max_attempts} attempts")
-    return False
+    return single_flight.FAILED
 
 def get_last_success_date():
     date_file = os.path.join(LOG_DIR, 'last_success.txt')
@@ -157,23 +163,95 @@ def save_success_date():
     except Exception as e:
         logger.error(f"Error saving success date: {str(e)}")
 
+def checkpoint():
+    # The monitor says we're about to sleep; only quick, local work fits in the suspend deadline
+    for handler in logger.handlers:
+        handler.flush()
+    # Called on the waiter's watcher thread; a request in flight would only time out across the sleep
+    async_checkin.cancel_running()
+
+waiter = waits.Waiter(on_suspend=checkpoint)
+
+def report_to_monitor(outcome=None):
+    # Tell the monitor we've started (no outcome) or finished, so it never has to poll for us
+    try:
+        control_endpoint.request(control_endpoint.default_address(APP_SUPPORT),
+                                 {'cmd': 'report', 'pid': os.getpid(), 'user': USER, 'outcome': outcome}, timeout=1)
+    except (OSError, ValueError) as e:
+        logger.info(f"Could not report to the power monitor: {e}")
+
+def check_in(config):
+    report_to_monitor()
+    logger.info("Config loaded, checking last success date")
+    waiter.wait(config['application']['startup_delay_seconds'])
+    
+    lease = checkin_lease.load_lease(LEASE_FILE)
+    if checkin_lease.lease_active(lease):
+        logger.info(f"Check-in lease valid until {datetime.fromtimestamp(lease['valid_until'])}, not contacting the server")
+        return single_flight.ALREADY
+    
+    # Servers that grant leases decide when the next check-in is due; otherwise it's once per day
+    last_date = get_last_success_date()
+    today = datetime.now().strftime('%Y-%m-%d')
+    if last_date == today and (lease is None or lease.get('valid_until') is None):
+        logger.info(f"Already checked in today at {datetime.now()}")
+        return single_flight.ALREADY
+    
+    return try_connect_with_retry(config)
+
+def ship_logs(config):
+    # Optional: send what's new in our logs to the collector, within the configured budget
+    url = config['logs']['collector_url']
+    if not url:
+        return
+    resolver = proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE)
+    http = proxy_resolver.session()
+    try:
+        log_shipper.ship_logs(
+            config['logs'], [power_monitor_log, os.path.join(LOG_DIR, 'powermonitor.log')], APP_SUPPORT,
+            lambda data, headers: proxy_resolver.post(http, resolver.candidates(url), url, data=data,
+                                                      headers=headers, timeout=config['server']['timeout_seconds']),
+            source={'host': get_hostname(), 'user': USER})
+    except Exception as e:
+        logger.error(f"Log shipping failed: {str(e)}")
+
+def check_for_update(config):
+    # Optional: stage a newer release for the monitor to swap in once nothing is running
+    url = config['update']['manifest_url']
+    if not url or not delta_update.runs_from(APP_SUPPORT):
+        return
+    resolver = proxy_resolver.ProxyResolver(config['proxy'], cache_path=PROXY_CACHE_FILE)
+    http = proxy_resolver.session()
+
+    def fetch(address):
+        response = proxy_resolver.get(http, resolver.candidates(address), address,
+                                      timeout=config['server']['timeout_seconds'])
+        response.raise_for_status()
+        return response.content
+    try:
+        staged = delta_update.check_for_update(config['update'], APP_SUPPORT, fetch)
+    except Exception as e:
+        logger.error(f"Update check failed: {str(e)}")
+        return
+    if staged:
+        try:
+            control_endpoint.request(control_endpoint.default_address(APP_SUPPORT), {'cmd': 'update'}, timeout=1)
+        except (OSError, ValueError) as e:
+            logger.info(f"Could not tell the power monitor about the update, it applies it when it next starts: {e}")
+
 def main():
     logger.info("AttendanceTracker starting up in main")
     try:
         config = get_config()
-        logger.info("Config loaded, checking last success date")
-        time.sleep(config['application'].get('startup_delay_seconds', 0))
-        
-        last_date = get_last_success_date()
-        today = datetime.now().strftime('%Y-%m-%d')
-        if last_date == today:
-            logger.info(f"Already checked in today at {datetime.now()}")
-            sys.exit(0)
-        
-        if try_connect_with_retry(config):
-            save_success_date()
-            sys.exit(0)
-        sys.exit(1)
+        # Only one check-in runs at a time; if one is in flight we wait for it and take its outcome
+        outcome, shared = single_flight.SingleFlight(APP_SUPPORT).run(lambda: check_in(config))
+        logger.info(f"Check-in outcome: {outcome}{' (shared with the in-flight check-in)' if shared else ''}")
+        if not shared:
+            report_to_monitor(outcome)
+        handler.flush()
+        ship_logs(config)
+        check_for_update(config)
+        sys.exit(0 if outcome in (single_flight.ACCEPTED, single_flight.ALREADY) else 1)
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
         sys.exit(1)
@@ -1,7 +1,6 @@
 import os
 import sys
 import logging
-import subprocess
 import time
 import traceback
 import win32gui
@@ -9,10 +8,10 @@ import win32api
 import win32con
 import win32event
 import winerror
+import pywintypes
 import ctypes
-from logging.handlers import RotatingFileHandler
-
-import configparser  # Added for reading INI file
+import threading
+from collections import deque
 
 try:
     import win32ts
@@ -21,18 +20,44 @@ except ImportError:
     HAS_WIN32TS = False
     logging.warning("win32ts module not available - session notifications disabled")
 
-# Define fallback constants
-WM_WTSSESSION_CHANGE_FALLBACK = 0x02B1
-WTS_SESSION_UNLOCK_FALLBACK = 0x8
-WTS_SESSION_LOGON_FALLBACK = 0x5
-WTS_SESSION_LOGOFF_FALLBACK = 0x6
-WTS_SESSION_LOCK_FALLBACK = 0x7
-PBT_APMRESUMEAUTOMATIC_FALLBACK = 0x12  # Added for wake from sleep
-PBT_APMRESUMESUSPEND_FALLBACK = 0x4    # Added for user-triggered wake
-PBT_APMSUSPEND_FALLBACK = 0x4          # Added for sleep (note: overlaps with RESUMESUSPEND, but typically 0x4)
-
-# Configure logging with RotatingFileHandler from config file
-app_support = os.path.join(os.environ.get('APPDATA', ''), 'AttendanceTracker')
+# Shared platform-neutral modules live in Client/Common (bundled via the spec's pathex)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import checkin_schedule
+import client_config
+import control_endpoint
+import delta_update
+import memwatch
+import monitor_core
+import sessions
+from slim_logging import SizeRotatingFileHandler
+import single_flight
+import waits
+
+def running_as_system():
+    try:
+        import win32security
+        token = win32security.OpenProcessToken(win32api.GetCurrentProcess(), win32security.TOKEN_QUERY)
+        sid = win32security.GetTokenInformation(token, win32security.TokenUser)[0]
+        return win32security.ConvertSidToStringSid(sid) == 'S-1-5-18'
+    except Exception as e:
+        logging.warning(f"Could not determine the monitor's account: {e}")
+        return False
+
+# Only SYSTEM can start a tracker in another user's session, so only it watches all of them
+MACHINE_WIDE = HAS_WIN32TS and running_as_system()
+
+# The monitor stays resident all day, so only what event handling needs is imported
+# up front; subprocess is loaded on the first launch and logging.conf is read without
+# keeping a parser alive.
+if MACHINE_WIDE:
+    # Installed for every user (test_install.bat /machine): the programs live where every user
+    # can run them and the monitor keeps its own logs and status in ProgramData. SYSTEM's
+    # AppData is nobody's; each user's config.json and last check-in stay in their own profile.
+    install_dir = os.path.join(os.environ.get('ProgramFiles', 'C:\\Program Files'), 'AttendanceTracker')
+    app_support = os.path.join(os.environ.get('ProgramData', 'C:\\ProgramData'), 'AttendanceTracker')
+else:
+    app_support = os.path.join(os.environ.get('APPDATA', ''), 'AttendanceTracker')
+    install_dir = app_support
 logs_dir = os.path.join(app_support, 'logs')
 os.makedirs(logs_dir, exist_ok=True)
 
@@ -40,65 +65,25 @@ power_monitor_log = os.path.join(logs_dir, 'powermonitor.log')
 
 # Get the root logger and clear any existing handlers
 logger = logging.getLogger()
-for handler in logger.handlers:
+for handler in logger.handlers[:]:
     logger.removeHandler(handler)
 
-# Load logging configuration from file
+# Load logging configuration from file, defaulting to DEBUG and 10 MB
 config_file = os.path.join(os.path.dirname(sys.executable), 'logging.conf')
-config = configparser.ConfigParser()
-
-# Default settings if config file is missing or invalid
-log_level = 'DEBUG'
-max_bytes = 10 * 1024 * 1024  # 10 MB
-
-if os.path.exists(config_file):
-    try:
-        config.read(config_file)
-        if 'logging' in config:
-            log_level = config['logging'].get('level', 'DEBUG').upper()
-            max_bytes = config['logging'].getint('max_size_mb', 10) * 1024 * 1024
-    except Exception as e:
-        logging.basicConfig(level=logging.ERROR)  # Temporary setup for error logging
-        logging.error(f"Failed to read logging config from {config_file}: {e}")
+log_level, max_bytes = 'DEBUG', 10 * 1024 * 1024
+try:
+    log_level, max_bytes = client_config.load_logging_conf(config_file, default_level='DEBUG')
+except Exception as e:
+    logging.basicConfig(level=logging.ERROR)  # Temporary setup for error logging
+    logging.error(f"Failed to read logging config from {config_file}: {e}")
 
-# Set up RotatingFileHandler with settings from config or defaults
-handler = RotatingFileHandler(power_monitor_log, mode='w', maxBytes=max_bytes, backupCount=0)
+handler = SizeRotatingFileHandler(power_monitor_log, max_bytes=max_bytes, backup_count=1)
 handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
 level = getattr(logging, log_level, logging.DEBUG)  # Fallback to DEBUG if invalid
 logger.setLevel(level)
 handler.setLevel(level)
 logger.addHandler(handler)
 
-# Import Windows modules
-required_modules = {
-    'win32api': None,
-    'win32con': None,
-    'win32event': None,
-    'win32gui': None
-}
-
-for module_name in required_modules:
-    try:
-        module = __import__(module_name)
-        required_modules[module_name] = module
-        logging.info(f"Successfully imported {module_name}")
-    except ImportError as e:
-        logging.error(f"Failed to import {module_name}: {e}")
-        sys.exit(1)
-
-win32api = required_modules['win32api']
-win32con = required_modules['win32con']
-win32event = required_modules['win32event']
-win32gui = required_modules['win32gui']
-
-try:
-    import win32process
-    HAS_WIN32PROCESS = True
-    logging.info("Successfully imported win32process")
-except ImportError:
-    HAS_WIN32PROCESS = False
-    logging.warning("win32process module not available - using alternative process check")
-
 # Define MSG structure with ctypes
 class MSG(ctypes.Structure):
     _fields_ = [
@@ -117,6 +102,18 @@ GetMessageW = user32.GetMessageW
 TranslateMessage = user32.TranslateMessage
 DispatchMessageW = user32.DispatchMessageW
 
+SetTimer = user32.SetTimer
+KillTimer = user32.KillTimer
+SetTimer.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_void_p]
+SetTimer.restype = ctypes.c_size_t
+KillTimer.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+KillTimer.restype = ctypes.c_int
+
+WM_TIMER = 0x0113
+WM_CONTROL = 0x8001  # WM_APP + 1: work queued by the control endpoint thread
+CHECKIN_TIMER_ID = 1
+USER_TIMER_MAXIMUM = 0x7FFFFFFF
+
 GetMessageW.argtypes = [ctypes.POINTER(MSG), ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
 GetMessageW.restype = ctypes.c_int
 TranslateMessage.argtypes = [ctypes.POINTER(MSG)]
@@ -124,18 +121,41 @@ TranslateMessage.restype = ctypes.c_int
 DispatchMessageW.argtypes = [ctypes.POINTER(MSG)]
 DispatchMessageW.restype = ctypes.c_void_p
 
-def is_process_running(process_name):
+MONITOR_MUTEX = "Global\\AttendanceTracker_PowerMonitor"
+# A name of its own: per-user monitors from before the machine-wide mode held the plain one
+MACHINE_MUTEX = "Global\\AttendanceTracker_PowerMonitor_Machine"
+
+def machine_wide_monitor_running():
     try:
-        result = subprocess.run(['tasklist', '/FI', f'IMAGENAME eq {process_name}'], 
-                              capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        return process_name.lower() in result.stdout.lower()
-    except Exception as e:
-        logging.error(f"Error checking process status: {e}")
-        return False
+        win32api.CloseHandle(win32event.OpenMutex(win32con.SYNCHRONIZE, False, MACHINE_MUTEX))
+        return True
+    except pywintypes.error as e:
+        # SYSTEM's mutex exists but its default DACL keeps users from opening it
+        return e.winerror == winerror.ERROR_ACCESS_DENIED
+
+def wait_for_previous_instance():
+    # Started by an instance that just updated itself; its mutex is ours once it has exited
+    pid = os.environ.pop('POWER_MONITOR_RESTART_OF', None)
+    if not pid:
+        return
+    try:
+        handle = win32api.OpenProcess(win32con.SYNCHRONIZE, False, int(pid))
+    except (pywintypes.error, ValueError):
+        return
+    try:
+        logging.info(f"Waiting for the previous PowerMonitor (PID {pid}) to exit")
+        win32event.WaitForSingleObject(handle, 15000)
+    finally:
+        win32api.CloseHandle(handle)
 
 def ensure_single_instance():
     try:
-        mutex = win32event.CreateMutex(None, True, "Global\\AttendanceTracker_PowerMonitor")
+        if not MACHINE_WIDE and machine_wide_monitor_running():
+            logging.info("A machine-wide PowerMonitor is serving every session—exiting")
+            sys.exit(0)
+        # Per-user monitors are one per user, so a second user's session still gets its own
+        name = MACHINE_MUTEX if MACHINE_WIDE else f"{MONITOR_MUTEX}-{os.environ.get('USERNAME', 'default')}"
+        mutex = win32event.CreateMutex(None, True, name)
         last_error = win32api.GetLastError()
         if last_error == winerror.ERROR_ALREADY_EXISTS:
             logging.info("Another instance of PowerMonitor is running—exiting")
@@ -144,7 +164,8 @@ def ensure_single_instance():
             logging.error(f"Mutex creation failed with error: {last_error}")
             sys.exit(1)
         logging.info("Successfully created mutex")
-        return True
+        # The mutex only exists while a handle to it is open, so the caller keeps this for the process's life
+        return mutex
     except Exception as e:
         logging.error(f"Failed to create/check mutex: {e}\n{traceback.format_exc()}")
         sys.exit(1)
@@ -152,49 +173,148 @@ def ensure_single_instance():
 class PowerMonitor:
     def __init__(self):
         try:
-            self.app_support = os.path.join(os.environ['APPDATA'], 'AttendanceTracker')
+            self.app_support = app_support
+            self.install_dir = install_dir
             logging.info(f"Initializing PowerMonitor. App support dir: {self.app_support}")
             os.makedirs(self.app_support, exist_ok=True)
-            self.last_event_time = 0
-            self.min_event_interval = 5
-            self.max_retries = 10
-            self.retry_count = 0
-            self.retry_reset_interval = 3600
+            # Held while handling an event, so the control thread never reads the core half-updated
+            self.lock = threading.RLock()
+            self.hWnd = None
+            self.timer_delay = None
+            self.trackerProcess = None
+            self.flight = single_flight.SingleFlight(self.app_support)
+            # Machine-wide: user -> (process handle, launch time) of the tracker started for them
+            self.processes = {}
+            self.sessions = sessions.SessionTable() if MACHINE_WIDE else None
+            if self.sessions is not None:
+                self.loadSessions()
+            self.control = None
+            self.pending = deque()
+            self.core = monitor_core.MonitorCore(
+                launcher=self.launchApp,
+                is_tracker_running=self.isTrackerRunning,
+                policy=monitor_core.LaunchPolicy(min_event_interval=5, max_retries=10, retry_reset_interval=3600),
+                recorder=monitor_core.recorder_from_env('win32'),
+                status_path=os.path.join(self.app_support, 'powermonitor.status'),
+                memory=memwatch.reporter_from_env(),
+                # Machine-wide, every user has the config and last check-in their own tracker uses
+                config=None if MACHINE_WIDE else client_config.ConfigStore([os.path.join(self.app_support,
+                                                                                         'config.json')]),
+                user_config=self.userConfig,
+                make_schedule=lambda config, user=None: checkin_schedule.schedule_from_config(
+                    config, self.userFile(user, 'Logs', 'last_success.txt') if MACHINE_WIDE
+                    else os.path.join(self.app_support, 'Logs', 'last_success.txt')),
+                set_timer=self.setTimer,
+                nudge=self.nudgeTrackers,
+                user=None if MACHINE_WIDE else os.environ.get('USERNAME'),
+                sessions=self.sessions,
+                # A machine-wide install is updated by the installers
+                apply_update=None if MACHINE_WIDE else self.applyUpdate,
+            )
             logging.info("PowerMonitor initialized successfully")
         except Exception as e:
             logging.error(f"Failed to initialize PowerMonitor: {e}\n{traceback.format_exc()}")
             raise
 
-    def _should_reset_retries(self):
-        current_time = time.time()
-        if current_time - self.last_event_time > self.retry_reset_interval:
-            self.retry_count = 0
-            logging.info("Reset retry counter due to time elapsed")
-            return True
-        return False
+    def loadSessions(self):
+        for info in win32ts.WTSEnumerateSessions(win32ts.WTS_CURRENT_SERVER_HANDLE):
+            if info['State'] == win32ts.WTSActive:
+                self.addSession(info['SessionId'])
+        logging.info(f"Watching all sessions: {self.sessions.summary()}")
 
-    def launchApp(self):
+    def addSession(self, session_id, locked=False):
         try:
-            current_time = time.time()
-            self._should_reset_retries()
-            if self.retry_count >= self.max_retries:
-                logging.error(f"Maximum retry attempts ({self.max_retries}) reached.")
-                return False
-            if current_time - self.last_event_time < self.min_event_interval:
-                logging.info("Skipping launch due to recent event")
-                return True
-            if is_process_running("AttendanceTracker.exe"):
-                logging.info("AttendanceTracker is already running")
-                self.retry_count = 0
-                return True
-            self.last_event_time = current_time
-            self.retry_count += 1
-            logging.info(f"Launch attempt {self.retry_count} of {self.max_retries}")
-            app_path = os.path.join(self.app_support, "AttendanceTracker.exe")
+            user = win32ts.WTSQuerySessionInformation(win32ts.WTS_CURRENT_SERVER_HANDLE, session_id,
+                                                      win32ts.WTSUserName)
+        except pywintypes.error as e:
+            logging.warning(f"Could not look up the user of session {session_id}: {e}")
+            return None
+        # Session 0 and the sign-in screen have no user to check in
+        return self.sessions.add(session_id, user, locked=locked) if user else None
+
+    def sessionUser(self, event, session_id):
+        """Apply a WTS notification to the session table and return the user it concerns."""
+        if event == monitor_core.LOGOFF:
+            session = self.sessions.remove(session_id)
+        else:
+            session = self.sessions.get(session_id) or self.addSession(session_id)
+            if session and event in (monitor_core.LOCK, monitor_core.UNLOCK, monitor_core.LOGON):
+                session.locked = event == monitor_core.LOCK
+        return session.user if session else None
+
+    def userAppSupport(self, session_id, session):
+        # The user's own AppData, from the environment block their processes get
+        if session.app_support is None:
+            import win32profile
+            token = win32ts.WTSQueryUserToken(session_id)
+            try:
+                env = win32profile.CreateEnvironmentBlock(token, False)
+            finally:
+                token.Close()
+            session.app_support = os.path.join(env['APPDATA'], 'AttendanceTracker')
+        return session.app_support
+
+    def userFile(self, user, *parts):
+        """A path in user's own AppData\\AttendanceTracker, or None while it can't be looked up."""
+        session_id, session = self.sessions.find(user)
+        if session is None:
+            return None
+        try:
+            return os.path.join(self.userAppSupport(session_id, session), *parts)
+        except pywintypes.error as e:
+            logging.warning(f"Could not find {user}'s AppData: {e}")
+            return None
+
+    def userConfig(self, user):
+        # Where user's tracker looks for config.json: their AppData, then beside the shared program
+        shared = os.path.join(self.install_dir, 'config.json')
+        own = self.userFile(user, 'config.json')
+        return client_config.ConfigStore([own, shared] if own else [shared])
+
+    def nudgeTrackers(self, event):
+        suspend = event == monitor_core.SUSPEND
+        waits.nudge_tracker(suspend, sessions=list(self.sessions.sessions) if self.sessions is not None else ())
+
+    def startControlEndpoint(self):
+        # The pipe is served from a helper thread; state changes are posted back to the window
+        self.control = control_endpoint.PipeControlServer(
+            control_endpoint.default_address(self.app_support),
+            control_endpoint.ControlCommands(self.core, run_on_main=self.runOnMain, lock=self.lock))
+        threading.Thread(target=self.control.serve_forever, daemon=True).start()
+
+    def runOnMain(self, action):
+        self.pending.append(action)
+        win32gui.PostMessage(self.hWnd, WM_CONTROL, 0, 0)
+
+    def runPending(self):
+        with self.lock:
+            while self.pending:
+                self.pending.popleft()()
+
+    def attachWindow(self, hWnd):
+        self.hWnd = hWnd
+        self.setTimer(self.timer_delay)
+
+    def setTimer(self, delay):
+        # One WM_TIMER armed for the next scheduled check-in; wake events re-arm it after suspend
+        self.timer_delay = delay
+        if not self.hWnd:
+            return
+        KillTimer(self.hWnd, CHECKIN_TIMER_ID)
+        if delay is not None:
+            SetTimer(self.hWnd, CHECKIN_TIMER_ID, min(int(delay * 1000), USER_TIMER_MAXIMUM), None)
+            logging.info(f"Next scheduled check-in in {int(delay)} seconds")
+
+    def launchApp(self, event=None, user=None):
+        if self.sessions is not None:
+            return self.launchForUser(user)
+        try:
+            app_path = os.path.join(self.install_dir, "AttendanceTracker.exe")
             logging.info(f"Attempting to launch AttendanceTracker from: {app_path}")
             if not os.path.exists(app_path):
                 logging.error(f"AttendanceTracker not found at: {app_path}")
                 return False
+            import subprocess
             process = subprocess.Popen(
                 [app_path],
                 stdout=subprocess.DEVNULL,
@@ -204,21 +324,123 @@ class PowerMonitor:
                 startupinfo=subprocess.STARTUPINFO(dwFlags=subprocess.STARTF_USESHOWWINDOW, wShowWindow=subprocess.SW_HIDE)
             )
             logging.info(f"Launched AttendanceTracker with PID {process.pid}")
-            time.sleep(1)
-            if process.poll() is not None:
-                logging.error(f"Process terminated immediately with code: {process.poll()}")
-                return False
-            if not is_process_running("AttendanceTracker.exe"):
-                logging.error("Process not found after starting")
+            try:
+                code = process.wait(timeout=1)
+                logging.error(f"Process terminated immediately with code: {code}")
                 return False
+            except subprocess.TimeoutExpired:
+                pass
+            self.trackerProcess = process
             return True
         except Exception as e:
             logging.error(f"Error launching app: {e}\n{traceback.format_exc()}")
             return False
 
-    def handleEvent(self, event_type):
+    def launchForUser(self, user):
+        # Start the tracker as user, in their session and with their environment
+        session_id, session = self.sessions.find(user)
+        app_path = os.path.join(self.install_dir, "AttendanceTracker.exe")
+        if session is None or not os.path.exists(app_path):
+            logging.error(f"Cannot launch AttendanceTracker for {user}: "
+                          f"{'no session' if session is None else f'not found at {app_path}'}")
+            return False
+        try:
+            import win32process
+            import win32profile
+            token = win32ts.WTSQueryUserToken(session_id)
+            try:
+                env = win32profile.CreateEnvironmentBlock(token, False)
+                startup = win32process.STARTUPINFO()
+                startup.lpDesktop = 'winsta0\\default'
+                startup.dwFlags = win32con.STARTF_USESHOWWINDOW
+                startup.wShowWindow = win32con.SW_HIDE
+                process, thread, pid, _ = win32process.CreateProcessAsUser(
+                    token, app_path, None, None, None, False,
+                    win32process.CREATE_NO_WINDOW | win32process.CREATE_UNICODE_ENVIRONMENT,
+                    env, self.install_dir, startup)
+            finally:
+                token.Close()
+            thread.Close()
+            session.app_support = os.path.join(env['APPDATA'], 'AttendanceTracker')
+            self.processes[user] = (process, time.time())
+            logging.info(f"Launched AttendanceTracker for {user} in session {session_id} with PID {pid}")
+            return True
+        except Exception as e:
+            logging.error(f"Error launching app for {user}: {e}\n{traceback.format_exc()}")
+            return False
+
+    def userTrackerRunning(self, user):
+        session_id, session = self.sessions.find(user)
+        if session is not None:
+            try:
+                if single_flight.SingleFlight(self.userAppSupport(session_id, session)).in_flight():
+                    return True
+            except pywintypes.error as e:
+                logging.warning(f"Could not check {user}'s check-in: {e}")
+        process, launched = self.processes.get(user, (None, None))
+        if process is None:
+            return False
+        if win32event.WaitForSingleObject(process, 0) == win32event.WAIT_TIMEOUT:
+            return True
+        # It finished since we last looked; its result file says how it went. A onefile build checks
+        # in from the bootloader's child, so the result is matched on time rather than PID
+        del self.processes[user]
+        result = single_flight.SingleFlight(session.app_support).last_result() if session else None
+        if result and result.get('finished', 0) >= launched:
+            self.core.record_outcome(result['outcome'], user)
+        else:
+            # It exited without getting as far as a check-in
+            self.core.record_outcome(single_flight.FAILED, user)
+        return False
+
+    def isTrackerRunning(self, user=None):
+        if self.sessions is not None:
+            running = self.userTrackerRunning(user)
+        else:
+            # The tracker we started may still be unpacking before it takes the flight lock
+            running = self.flight.in_flight() or (self.trackerProcess is not None and self.trackerProcess.poll() is None)
+        if running:
+            logging.info("A check-in is already in flight, attaching to its outcome")
+        return running
+
+    def applyUpdate(self):
+        if self.flight.in_flight():
+            return False
+        swapped = delta_update.apply_if_idle(self.app_support)
+        if swapped is None:
+            return False
+        if delta_update.replaces_self(self.app_support, swapped):
+            self.restart()
+        return True
+
+    def restart(self):
+        import subprocess
+        logging.info("PowerMonitor was updated, restarting")
+        subprocess.Popen(
+            delta_update.restart_argv(),
+            cwd=self.app_support,
+            env=dict(delta_update.restart_env(), POWER_MONITOR_RESTART_OF=str(os.getpid())),
+            creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+        win32gui.PostQuitMessage(0)
+
+    def handleEvent(self, event_type, msg=None, wParam=None, session_id=None):
+        with self.lock:
+            return self.handleEventLocked(event_type, msg, wParam, session_id)
+
+    def handleEventLocked(self, event_type, msg, wParam, session_id):
         logging.info(f"Handling event: {event_type}")
-        return self.launchApp()
+        raw = {'msg': msg, 'wParam': wParam} if msg is not None else None
+        user = None
+        if session_id is not None:
+            raw['session'] = session_id
+            if self.sessions is not None:
+                user = self.sessionUser(event_type, session_id)
+                if user is None:
+                    logging.info(f"Ignoring {event_type} in session {session_id}, it has no user")
+                    return True
+        decision = self.core.handle(event_type, raw, user)
+        return decision not in (monitor_core.SKIP_RETRY_CAP, monitor_core.LAUNCH_FAILED)
 
 def run_message_loop(hWnd):
     session_notifications_registered = False
@@ -227,17 +449,18 @@ def run_message_loop(hWnd):
         logging.info("Starting message loop")
         if HAS_WIN32TS:
             logging.info(f"Attempting to register session notifications for hWnd={hWnd}")
-            if win32ts.WTSRegisterSessionNotification(hWnd, win32ts.NOTIFY_FOR_THIS_SESSION):
+            # lParam of each WM_WTSSESSION_CHANGE then names the session it is about
+            scope = win32ts.NOTIFY_FOR_ALL_SESSIONS if MACHINE_WIDE else win32ts.NOTIFY_FOR_THIS_SESSION
+            if win32ts.WTSRegisterSessionNotification(hWnd, scope):
                 session_notifications_registered = True
                 logging.info("Successfully registered for session notifications")
             else:
                 error = ctypes.get_last_error()
                 logging.warning(f"Failed to register for session notifications, error: {error}")
         
-        iteration = 0
+        # GetMessageW blocks until the OS posts something; nothing is logged per message
+        # so an idle monitor neither wakes up nor writes to disk
         while True:
-            iteration += 1
-            logging.debug(f"Message loop iteration {iteration}")
             result = GetMessageW(ctypes.byref(msg), hWnd, 0, 0)
             if result == 0:
                 logging.info("Received WM_QUIT, exiting message loop")
@@ -246,7 +469,6 @@ def run_message_loop(hWnd):
                 error = ctypes.get_last_error()
                 logging.error(f"Error in GetMessageW: {error}")
                 break
-            logging.info(f"Received message: hwnd={msg.hwnd}, message={msg.message}, wParam={msg.wParam}, lParam={msg.lParam}")
             TranslateMessage(ctypes.byref(msg))
             DispatchMessageW(ctypes.byref(msg))
         return True
@@ -266,50 +488,23 @@ def WndProc(hWnd, msg, wParam, lParam):
         monitor = getattr(sys.modules[__name__], 'monitor', None)
         if not monitor:
             return win32gui.DefWindowProc(hWnd, msg, wParam, lParam)
-        if msg == win32con.WM_POWERBROADCAST:
-            logging.info(f"Received power event: wParam={wParam}")
-            # Use fallbacks for power events
-            pbt_apmresumeautomatic = getattr(win32con, 'PBT_APMRESUMEAUTOMATIC', PBT_APMRESUMEAUTOMATIC_FALLBACK)
-            pbt_apmresumesuspend = getattr(win32con, 'PBT_APMRESUMESUSPEND', PBT_APMRESUMESUSPEND_FALLBACK)
-            pbt_apmsuspend = getattr(win32con, 'PBT_APMSUSPEND', PBT_APMSUSPEND_FALLBACK)
-            if wParam == pbt_apmresumeautomatic:
-                logging.info("System resuming from suspend (automatic)")
-                if monitor.handleEvent("wake"):
-                    return True
-            elif wParam == pbt_apmresumesuspend:
-                logging.info("System resuming from suspend (user triggered)")
-                if monitor.handleEvent("wake"):
-                    return True
-            elif wParam == pbt_apmsuspend:
-                logging.info("System going to suspend")
+        if msg == win32con.WM_POWERBROADCAST or (HAS_WIN32TS and msg == monitor_core.WM_WTSSESSION_CHANGE):
+            kind = "power" if msg == win32con.WM_POWERBROADCAST else "session"
+            logging.info(f"Received {kind} event: wParam={wParam}")
+            event = monitor_core.from_win32(msg, wParam)
+            session_id = lParam if kind == "session" else None
+            if event is None:
+                logging.info(f"Unhandled {kind} event: wParam={wParam}")
+            elif monitor.handleEvent(event, msg, wParam, session_id):
                 return True
-            else:
-                logging.info(f"Unhandled power event: wParam={wParam}")
-        elif HAS_WIN32TS:
-            session_change_msg = getattr(win32con, 'WM_WTSSESSION_CHANGE', WM_WTSSESSION_CHANGE_FALLBACK)
-            if msg == session_change_msg:
-                logging.info(f"Received session event: wParam={wParam}")
-                # Use fallbacks for session events
-                wts_session_unlock = getattr(win32con, 'WTS_SESSION_UNLOCK', WTS_SESSION_UNLOCK_FALLBACK)
-                wts_session_logon = getattr(win32con, 'WTS_SESSION_LOGON', WTS_SESSION_LOGON_FALLBACK)
-                wts_session_logoff = getattr(win32con, 'WTS_SESSION_LOGOFF', WTS_SESSION_LOGOFF_FALLBACK)
-                wts_session_lock = getattr(win32con, 'WTS_SESSION_LOCK', WTS_SESSION_LOCK_FALLBACK)
-                if wParam == wts_session_unlock:
-                    logging.info("Session unlocked")
-                    if monitor.handleEvent("unlock"):
-                        return True
-                elif wParam == wts_session_logon:
-                    logging.info("User logged on")
-                    if monitor.handleEvent("logon"):
-                        return True
-                elif wParam == wts_session_logoff:
-                    logging.info("User logged off")
-                    return True
-                elif wParam == wts_session_lock:
-                    logging.info("Session locked")
-                    return True
-                else:
-                    logging.info(f"Unhandled session event: wParam={wParam}")
+        elif msg == WM_CONTROL:
+            monitor.runPending()
+            return 0
+        elif msg == WM_TIMER and wParam == CHECKIN_TIMER_ID:
+            KillTimer(hWnd, CHECKIN_TIMER_ID)
+            logging.info("Scheduled check-in timer fired")
+            monitor.handleEvent(monitor_core.TIMER, msg, wParam)
+            return 0
         elif msg == win32con.WM_QUERYENDSESSION:
             logging.info("System shutdown/restart/logoff requested")
             return True
@@ -317,6 +512,7 @@ def WndProc(hWnd, msg, wParam, lParam):
             logging.info("System session is ending")
             if wParam:
                 logging.info("Session is actually ending")
+                monitor.handleEvent(monitor_core.SHUTDOWN, msg, wParam)
                 win32gui.PostQuitMessage(0)
             return 0
         elif msg == win32con.WM_DESTROY:
@@ -349,8 +545,7 @@ def create_window():
             logging.error("CreateWindow returned NULL")
             return None
         logging.info(f"Window created with hWnd={hWnd}")
-        win32gui.SendMessage(hWnd, win32con.WM_POWERBROADCAST, 
-                           getattr(win32con, 'PBT_APMRESUMEAUTOMATIC', PBT_APMRESUMEAUTOMATIC_FALLBACK), 0)
+        win32gui.SendMessage(hWnd, win32con.WM_POWERBROADCAST, monitor_core.PBT_APMRESUMEAUTOMATIC, 0)
         return hWnd
     except Exception as e:
         logging.error(f"Error in create_window: {e}\n{traceback.format_exc()}")
@@ -359,17 +554,28 @@ def create_window():
 if __name__ == '__main__':
     try:
         logging.info("PowerMonitor main entry point")
-        ensure_single_instance()
-        if is_process_running("AttendanceTracker.exe"):
+        wait_for_previous_instance()
+        instance_mutex = ensure_single_instance()
+        if not MACHINE_WIDE and single_flight.SingleFlight(app_support).in_flight():
+            import subprocess
             subprocess.run(['taskkill', '/F', '/IM', 'AttendanceTracker.exe'], capture_output=True)
             time.sleep(1)
-        sys.modules[__name__].monitor = PowerMonitor()
+        monitor = PowerMonitor()
+        sys.modules[__name__].monitor = monitor
         logging.info("PowerMonitor instance created successfully")
         hWnd = create_window()
         if not hWnd:
             logging.error("Failed to create window")
             sys.exit(1)
         logging.info("Window created successfully")
+        monitor.attachWindow(hWnd)
+        monitor.startControlEndpoint()
+        if not MACHINE_WIDE:
+            delta_update.remove_old(app_support)
+            # Staged while no monitor was running to hear about it
+            if delta_update.staged_update(app_support):
+                monitor.core.update_staged()
+        monitor.core.report_memory("steady state after startup")
         logging.info("Entering message loop")
         run_message_loop(hWnd)
     except Exception as e:
@@ -382,4 +588,8 @@ if __name__ == '__main__':
                 logging.info("Window destroyed successfully")
             except Exception as e:
                 logging.error(f"Failed to destroy window: {e}")
+        if 'monitor' in globals():
+            if monitor.control:
+                monitor.control.close()
+            monitor.core.close()
         logging.info("PowerMonitor shutting down")
\ No newline at end of file
@@ -4,21 +4,27 @@ import os
 import site
 from PyInstaller.utils.hooks import collect_dynamic_libs, collect_data_files
 
+# TRACKER_PACKAGING=onedir: nothing to unpack to a temp dir on each launch, no UPX to
+# inflate and bytecode compiled ahead with -OO (see Tools/bench_startup.py)
+ONEDIR = os.environ.get('TRACKER_PACKAGING', 'onefile') == 'onedir'
+
 a = Analysis(
     ['power_monitor.py'],
-    pathex=['.'],
+    pathex=['.', '../Common'],
     binaries=[],
     datas=[('config.json', '.')],
     hiddenimports=[
         'win32api', 'win32con', 'win32event', 'win32service', 'win32serviceutil',
         'win32com', 'win32com.client', 'win32gui', 'win32gui_struct', 'win32ts',
-        'pywintypes', 'pythoncom', 'win32process'
+        'pywintypes', 'pythoncom', 'win32process', 'win32pipe', 'win32file', 'win32profile',
+        'win32security'
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
     excludes=[],
-    noarchive=False
+    noarchive=False,
+    optimize=2 if ONEDIR else 0,
 )
 
 # Forcefully include pywin32 DLLs and binaries
@@ -41,23 +47,52 @@ a.datas += collect_data_files('win32gui_struct')
 
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='PowerMonitor',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
\ No newline at end of file
+if ONEDIR:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='PowerMonitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+        # Beside the other program in the install directory, so each needs its own
+        contents_directory='PowerMonitor_internal',
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        name='PowerMonitor',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='PowerMonitor',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
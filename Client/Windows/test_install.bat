@@ -7,6 +7,10 @@ set "LOG_DIR=%APP_SUPPORT%\Logs"
 set "STARTUP_DIR=%APPDATA%\Microsoft\Windows\Start Menu\Programs\Startup"
 set "CURRENT_DIR=%~dp0"
 
+:: "test_install.bat /machine" installs one PowerMonitor for every user of the machine instead,
+:: started at boot as SYSTEM; it needs an elevated prompt
+if /I "%~1"=="/machine" goto :machine
+
 echo Starting AttendanceTracker installation...
 
 :: Create directories
@@ -98,6 +102,19 @@ if not exist "%APP_SUPPORT%\logging.conf" (
     echo Error: Failed to copy logging.conf >> "%LOG_FILE%"
     exit /b 1
 )
+:: A onedir package (TRACKER_PACKAGING=onedir) carries each program's libraries next to it
+for %%D in (AttendanceTracker_internal PowerMonitor_internal) do (
+    if exist "%CURRENT_DIR%%%D\" (
+        if exist "%APP_SUPPORT%\%%D" rd /s /q "%APP_SUPPORT%\%%D"
+        xcopy /E /I /Y /Q "%CURRENT_DIR%%%D" "%APP_SUPPORT%\%%D" >>"%LOG_FILE%" 2>&1
+        if not exist "%APP_SUPPORT%\%%D\" (
+            echo Error: Failed to copy %%D
+            echo Error: Failed to copy %%D >> "%LOG_FILE%"
+            exit /b 1
+        )
+    )
+)
+
 :: Create startup entry
 echo Creating startup entry...
 set "STARTUP_SCRIPT=%STARTUP_DIR%\AttendanceTracker_PowerMonitor.bat"
@@ -141,4 +158,89 @@ if !errorlevel! equ 0 (
 
 echo Installation completed successfully
 echo Installation completed successfully at %date% %time% >> "%LOG_FILE%"
+exit /b 0
+
+:machine
+:: The programs go where every user's tracker can run them; each user's config.json and last
+:: check-in stay in their own AppData, with the config.json copied here as the fallback
+set "INSTALL_DIR=%ProgramFiles%\AttendanceTracker"
+set "STATE_DIR=%ProgramData%\AttendanceTracker"
+set "LOG_FILE=%STATE_DIR%\logs\install.log"
+
+net session >nul 2>&1
+if errorlevel 1 (
+    echo The machine-wide installation must be run from an elevated command prompt
+    exit /b 1
+)
+
+echo Starting machine-wide AttendanceTracker installation...
+if not exist "%STATE_DIR%\logs" mkdir "%STATE_DIR%\logs"
+if not exist "%INSTALL_DIR%" mkdir "%INSTALL_DIR%"
+echo Machine-wide installation started at %date% %time% > "%LOG_FILE%" || (
+    echo Failed to create log file - permission denied
+    exit /b 1
+)
+echo Current directory: %CURRENT_DIR% >> "%LOG_FILE%"
+echo Target directory: %INSTALL_DIR% >> "%LOG_FILE%"
+
+echo Stopping existing processes...
+schtasks /End /TN "AttendanceTracker\PowerMonitor" >nul 2>&1
+taskkill /F /IM "PowerMonitor.exe" 2>>"%LOG_FILE%" || echo No existing PowerMonitor process found >> "%LOG_FILE%"
+taskkill /F /IM "AttendanceTracker.exe" 2>>"%LOG_FILE%" || echo No existing AttendanceTracker process found >> "%LOG_FILE%"
+timeout /t 2 /nobreak >nul
+
+echo Copying files...
+for %%F in (AttendanceTracker.exe PowerMonitor.exe config.json logging.conf) do (
+    if not exist "%CURRENT_DIR%%%F" (
+        echo Error: %%F not found in source directory
+        echo Error: %%F not found in source directory >> "%LOG_FILE%"
+        exit /b 1
+    )
+    xcopy /Y /F "%CURRENT_DIR%%%F" "%INSTALL_DIR%\" >>"%LOG_FILE%" 2>&1
+    if not exist "%INSTALL_DIR%\%%F" (
+        echo Error: Failed to copy %%F
+        echo Error: Failed to copy %%F >> "%LOG_FILE%"
+        exit /b 1
+    )
+)
+for %%D in (AttendanceTracker_internal PowerMonitor_internal) do (
+    if exist "%CURRENT_DIR%%%D\" (
+        if exist "%INSTALL_DIR%\%%D" rd /s /q "%INSTALL_DIR%\%%D"
+        xcopy /E /I /Y /Q "%CURRENT_DIR%%%D" "%INSTALL_DIR%\%%D" >>"%LOG_FILE%" 2>&1
+        if not exist "%INSTALL_DIR%\%%D\" (
+            echo Error: Failed to copy %%D
+            echo Error: Failed to copy %%D >> "%LOG_FILE%"
+            exit /b 1
+        )
+    )
+)
+
+:: A boot task running as SYSTEM, with no time limit and kept running on battery
+:: (schtasks /Create would stop it after three days and on battery)
+echo Registering the PowerMonitor startup task...
+powershell -NoProfile -ExecutionPolicy Bypass -Command ^
+    "$action = New-ScheduledTaskAction -Execute '%INSTALL_DIR%\PowerMonitor.exe' -WorkingDirectory '%INSTALL_DIR%';" ^
+    "$settings = New-ScheduledTaskSettingsSet -ExecutionTimeLimit ([TimeSpan]::Zero) -AllowStartIfOnBatteries -DontStopIfGoingOnBatteries -RestartCount 3 -RestartInterval (New-TimeSpan -Minutes 1);" ^
+    "Register-ScheduledTask -TaskPath '\AttendanceTracker\' -TaskName 'PowerMonitor' -Action $action -Trigger (New-ScheduledTaskTrigger -AtStartup) -Settings $settings -User 'SYSTEM' -RunLevel Highest -Force | Out-Null" >>"%LOG_FILE%" 2>&1
+if errorlevel 1 (
+    echo Failed to register the startup task
+    echo Failed to register the startup task >> "%LOG_FILE%"
+    exit /b 1
+)
+
+echo Starting PowerMonitor...
+schtasks /Run /TN "AttendanceTracker\PowerMonitor" >>"%LOG_FILE%" 2>&1
+timeout /t 3 /nobreak >nul
+tasklist /FI "IMAGENAME eq PowerMonitor.exe" | find "PowerMonitor.exe" >nul
+if !errorlevel! equ 0 (
+    echo ✓ PowerMonitor is running for every user
+    echo PowerMonitor started successfully >> "%LOG_FILE%"
+) else (
+    echo × Failed to start PowerMonitor
+    echo Failed to start PowerMonitor >> "%LOG_FILE%"
+    exit /b 1
+)
+
+echo Machine-wide installation completed successfully
+echo Machine-wide installation completed successfully at %date% %time% >> "%LOG_FILE%"
 exit /b 0
\ No newline at end of file
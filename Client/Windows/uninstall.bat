@@ -8,6 +8,13 @@ taskkill /F /IM "AttendanceTracker.exe" 2>nul
 :: Remove scheduled task (if applicable)
 schtasks /Delete /TN "AttendanceTracker\PowerMonitor" /F 2>nul
 
+:: "uninstall.bat /machine" also removes a machine-wide install (test_install.bat /machine)
+if /I "%~1"=="/machine" (
+    if exist "%ProgramFiles%\AttendanceTracker" rd /s /q "%ProgramFiles%\AttendanceTracker"
+    if exist "%ProgramData%\AttendanceTracker" rd /s /q "%ProgramData%\AttendanceTracker"
+    echo Removed the machine-wide installation
+)
+
 :: Remove the startup script
 set "STARTUP_DIR=%APPDATA%\Microsoft\Windows\Start Menu\Programs\Startup"
 set "STARTUP_SCRIPT=%STARTUP_DIR%\AttendanceTracker_PowerMonitor.bat"
@@ -42,14 +42,14 @@ pyinstaller AttendanceTracker.spec \
           --workpath ./build && \
 cd ../..
 
-# Wait for build to complete and check success
-if [ ! -f "Client/Windows/dist/power_monitor" ]; then
+# Wait for build to complete and check success (a directory when TRACKER_PACKAGING=onedir)
+if [ ! -e "Client/Windows/dist/power_monitor" ] && [ ! -d "Client/Windows/dist/PowerMonitor" ]; then
     echo "❌ Failed to build power monitor"
     exit 1
 fi
 
 # Wait for app build and check success
-if [ ! -f "Client/Windows/dist/AttendanceTracker" ]; then
+if [ ! -e "Client/Windows/dist/AttendanceTracker" ]; then
     echo "❌ Failed to build AttendanceTracker"
     exit 1
 fi
@@ -60,8 +60,14 @@ echo "✅ Windows executables built successfully"
 mkdir -p distwin/package
 
 # Copy files to distribution
-cp Client/Windows/dist/power_monitor distwin/package/power_monitor.exe || { echo "❌ Failed to copy power monitor"; exit 1; }
-cp Client/Windows/dist/AttendanceTracker distwin/package/AttendanceTracker.exe || { echo "❌ Failed to copy AttendanceTracker"; exit 1; }
+if [ -d "Client/Windows/dist/AttendanceTracker" ]; then
+    # onedir: each executable next to its <name>_internal directory
+    cp -R Client/Windows/dist/PowerMonitor/. distwin/package/ || { echo "❌ Failed to copy power monitor"; exit 1; }
+    cp -R Client/Windows/dist/AttendanceTracker/. distwin/package/ || { echo "❌ Failed to copy AttendanceTracker"; exit 1; }
+else
+    cp Client/Windows/dist/power_monitor distwin/package/power_monitor.exe || { echo "❌ Failed to copy power monitor"; exit 1; }
+    cp Client/Windows/dist/AttendanceTracker distwin/package/AttendanceTracker.exe || { echo "❌ Failed to copy AttendanceTracker"; exit 1; }
+fi
 cp Client/Windows/config.json distwin/package/ || { echo "❌ Failed to copy config"; exit 1; }
 cp Client/Windows/test_install.bat distwin/package/ || { echo "❌ Failed to copy install script"; exit 1; }
 cp Client/Windows/uninstall.bat distwin/package/ || { echo "❌ Failed to copy uninstall script"; exit 1; }
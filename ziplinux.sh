@@ -0,0 +1,64 @@
+#!/bin/bash
+
+# Ensure we're in the virtual environment
+if [[ -z "${VIRTUAL_ENV}" ]]; then
+    if [ -d ".venv" ]; then
+        echo "Activating virtual environment..."
+        source .venv/bin/activate
+    else
+        echo "❌ Virtual environment not found. Please create and activate it first."
+        echo "Run: python -m venv .venv && source .venv/bin/activate && pip install -r Client/Linux/requirements.txt"
+        exit 1
+    fi
+fi
+
+# Install Linux dependencies
+pip3 install -r Client/Linux/requirements.txt
+
+# Clean up previous Linux builds only
+rm -rf Client/Linux/build Client/Linux/dist distlinux
+
+# Build power monitor and tracker
+cd Client/Linux && \
+pyinstaller --noconfirm power_monitor.spec && \
+pyinstaller --noconfirm AttendanceTracker.spec && \
+cd ../..
+
+# TRACKER_PACKAGING=onedir builds each program as dist/<name>/ holding the executable and its
+# <name>_internal libraries: no unpacking on every launch (see Client/Tools/bench_startup.py)
+if [ ! -e "Client/Linux/dist/power_monitor" ]; then
+    echo "❌ Failed to build power monitor"
+    exit 1
+fi
+
+if [ ! -e "Client/Linux/dist/AttendanceTracker" ]; then
+    echo "❌ Failed to build AttendanceTracker"
+    exit 1
+fi
+
+echo "✅ Linux executables built successfully"
+
+# Prepare package directory
+mkdir -p distlinux/package
+
+for program in power_monitor AttendanceTracker; do
+    if [ -d "Client/Linux/dist/$program" ]; then
+        cp -R "Client/Linux/dist/$program/." distlinux/package/
+    else
+        cp "Client/Linux/dist/$program" distlinux/package/
+    fi || { echo "❌ Failed to copy $program"; exit 1; }
+done
+cp Client/Linux/config.json distlinux/package/ || { echo "❌ Failed to copy config"; exit 1; }
+cp Client/Linux/logging.conf distlinux/package/ || { echo "❌ Failed to copy logging.conf"; exit 1; }
+cp Client/Linux/test_install.sh distlinux/package/ || { echo "❌ Failed to copy install script"; exit 1; }
+cp Client/Linux/uninstall.sh distlinux/package/ || { echo "❌ Failed to copy uninstall script"; exit 1; }
+
+chmod +x distlinux/package/power_monitor distlinux/package/AttendanceTracker distlinux/package/test_install.sh distlinux/package/uninstall.sh
+
+# Create archive
+echo "Creating package..."
+cd distlinux
+tar czf AttendanceTracker_Linux.tar.gz package/
+cd ..
+
+echo "✅ AttendanceTracker_Linux.tar.gz created successfully"
@@ -36,25 +36,16 @@ mkdir -p dist
 cd Client/MacOS && \
 PYTHONPATH=../.. pyinstaller --noconfirm power_monitor.spec && cd ../..
 
-# Wait for build to complete and check success
-if [ ! -f "Client/MacOS/dist/power_monitor" ]; then
+# Wait for build to complete and check success (a directory when TRACKER_PACKAGING=onedir)
+if [ ! -e "Client/MacOS/dist/power_monitor" ]; then
     echo "❌ Failed to build power monitor"
     exit 1
 fi
 
-# Build the app
+# Build the app from its spec, like the power monitor; TRACKER_PACKAGING=onedir is read by the spec
 echo "Building AttendanceTracker app..."
 cd Client/MacOS && \
-PYTHONPATH=../.. pyinstaller --clean \
-            --noconfirm \
-            --name AttendanceTracker \
-            --windowed \
-            --add-data "config.json:." \
-            --log-level ERROR \
-            --noconsole \
-            --paths ../../.venv/lib/python3.12/site-packages \
-            --osx-bundle-identifier "com.company.attendancetracker" \
-            AttendanceTracker.py && \
+PYTHONPATH=../.. pyinstaller --clean --noconfirm --log-level ERROR AttendanceTracker.spec && \
 cd ../..
 
 # Wait for app build and check success
@@ -70,7 +61,11 @@ mkdir -p dist/package
 
 # Copy files to distribution
 cp -R "Client/MacOS/dist/AttendanceTracker.app" "dist/package/" || { echo "❌ Failed to copy app bundle"; exit 1; }
-cp Client/MacOS/dist/power_monitor dist/package/ || { echo "❌ Failed to copy power monitor"; exit 1; }
+if [ -d "Client/MacOS/dist/power_monitor" ]; then
+    cp -R Client/MacOS/dist/power_monitor/. dist/package/ || { echo "❌ Failed to copy power monitor"; exit 1; }
+else
+    cp Client/MacOS/dist/power_monitor dist/package/ || { echo "❌ Failed to copy power monitor"; exit 1; }
+fi
 cp Client/MacOS/config.json dist/package/ || { echo "❌ Failed to copy config"; exit 1; }
 cp Client/MacOS/test_install.sh dist/package/ || { echo "❌ Failed to copy install script"; exit 1; }
 cp Client/MacOS/start.command dist/package/ || { echo "❌ Failed to copy start command"; exit 1; }